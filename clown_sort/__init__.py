@@ -1,14 +1,19 @@
 """
-Entry point for all of the clown_sort scripts.
+Entry point for all of the clown_sort scripts. Only what every script needs is imported here; the image,
+OCR, and PDF machinery is imported when a script needs it (see screenshot_sorter.py) so find_duplicates,
+--help, etc. start quickly. Names that used to be imported here are still available via __getattr__().
 """
+import importlib
 import shutil
+import sqlite3
 from argparse import Namespace
-from glob import glob
 from os import environ, getcwd, path
 from pathlib import Path
-from typing import List, Union
+from typing import Any, Union
 
 from dotenv import load_dotenv
+from rich.filesize import decimal
+from rich.text import Text
 
 # load_dotenv() should be called as soon as possible (before parsing local classes) but not for pytest
 if not environ.get('INVOKED_BY_PYTEST', False):
@@ -17,35 +22,38 @@ if not environ.get('INVOKED_BY_PYTEST', False):
             load_dotenv(dotenv_path=dotenv_file)
             break
 
-from clown_sort.util.argument_parser import (parse_text_extraction_args, parse_pdf_page_extraction_args,
+from clown_sort.util.argument_parser import (find_duplicates_arg_parser, parse_bench_args, parse_text_extraction_args,
      purge_arg_parser)
 from clown_sort.config import Config
-from clown_sort.files.image_file import ImageFile
-from clown_sort.files.pdf_file import PdfFile
-from clown_sort.files.sortable_file import SortableFile
-from clown_sort.sort_selector import process_file_with_popup
-from clown_sort.util.filesystem_helper import (IMAGE_FILE_EXTENSIONS, files_in_dir, is_image,
-      is_pdf, set_timestamp_based_on_screenshot_filename)
+from clown_sort.lib.duplicate_finder import collapse_into_hardlinks, find_duplicates as find_duplicate_files
+from clown_sort.lib.sorted_file_index import INDEX_FILENAME, SortedFileIndex
+from clown_sort.util.constants import DEFAULT_DESTINATION_DIR
+from clown_sort.util.filesystem_helper import (files_in_dir, is_pdf, set_timestamp_based_on_screenshot_filename,
+     walk_files)
+from clown_sort.util.instrumentation import instrumentation
 from clown_sort.util.logging import log, set_log_level
 from clown_sort.util.rich_helper import console
 
+# Module each lazily imported name comes from (PEP 562: https://peps.python.org/pep-0562/)
+LAZY_IMPORTS = {
+    'ImageFile': 'clown_sort.files.image_file',
+    'PdfFile': 'clown_sort.files.pdf_file',
+    'SortableFile': 'clown_sort.files.sortable_file',
+    'build_sortable_file': 'clown_sort.screenshot_sorter',
+    'prepared_for_sorting': 'clown_sort.screenshot_sorter',
+    'screenshot_paths': 'clown_sort.screenshot_sorter',
+}
+
 
 def sort_screenshots():
     """Main entry point for sorting screenshots."""
-    Config.configure()
-
-    if Config.rescan_sorted:
-        _rescan_sorted_screenshots()
-        return
-
-    for file_to_sort in screenshot_paths(Config.screenshots_dir):
-        if Config.manual_sort:
-            if file_to_sort.can_be_presented_in_popup():
-                process_file_with_popup(file_to_sort)
-            else:
-                print(f"'{file_to_sort.file_path}' is not suitable for manual sort, skipping...")
-        else:
-            file_to_sort.sort_file()
+    args = Config.configure()
+    Config.configure_extraction_cache(Config.destination_dir, args)
+    Config.configure_sorted_manifest(args)
+    from clown_sort import screenshot_sorter
+    screenshot_sorter.sort_screenshots()
+    instrumentation.print_summary()
+    instrumentation.close_trace()
 
 
 def extract_text_from_files() -> None:
@@ -61,6 +69,17 @@ def extract_text_from_files() -> None:
     if args.print_as_parsed:
         Config.print_as_parsed = True
 
+    Config.set_ocr_engine(args.ocr_engine)
+    Config.set_ocr_preprocessing_options(args)
+    Config.set_pdf_extraction_options(args)
+    Config.pdf_page_jobs = max(1, Config.pdf_page_jobs)
+
+    if DEFAULT_DESTINATION_DIR.is_dir():
+        Config.configure_extraction_cache(DEFAULT_DESTINATION_DIR, args)
+
+    from clown_sort.files.pdf_file import PdfFile
+    from clown_sort.screenshot_sorter import build_sortable_file
+
     for file_path in args.files_to_process:
         sortable_file = build_sortable_file(file_path)
 
@@ -76,62 +95,38 @@ def set_screenshot_timestamps_from_filenames():
     """Parse the filenames to reset the file creation timestamps."""
     Config.configure()
 
-    for image in screenshot_paths(Config.screenshots_dir):
-        set_timestamp_based_on_screenshot_filename(image.file_path)
-
-
-def _rescan_sorted_screenshots():
-    """Rescan sorted folders."""
-    console.print(f"Rescanning '{Config.sorted_screenshots_dir}'...")
-    sortable_files: List[SortableFile] = []
-    file_paths: List[str] = []
-
-    for extname in IMAGE_FILE_EXTENSIONS:
-        for pattern in ['*', '**/*']:
-            glob_pattern = Config.sorted_screenshots_dir.joinpath(f"{pattern}{extname}")
-            log.debug(f"Adding '{glob_pattern}' to glob patterns...")
-            file_paths.extend(glob(str(glob_pattern)))
+    for file_path in sorted(files_in_dir(Config.screenshots_dir)):
+        if is_file_to_sort(file_path):
+            set_timestamp_based_on_screenshot_filename(file_path)
 
-    for file_path in file_paths:
-        if Config.screenshots_only and not Config.filename_regex.match(path.basename(file_path)):
-            log.debug(f"Skipping '{file_path}' because it doesn't match the filename_regex...")
-            continue
 
-        sortable_files.append(build_sortable_file(file_path))
+def is_file_to_sort(file_path: Union[str, Path]) -> bool:
+    """True if file_path is a non-hidden file in SCREENSHOTS_DIR that should be sorted."""
+    basename = path.basename(file_path)
 
-    console.print(
-        f"Re-processing {len(sortable_files)} files in '{Config.sorted_screenshots_dir}'...",
-        style='bright_green'
-    )
+    if basename.startswith('.') or not path.isfile(file_path):
+        return False
 
-    for file_path in sortable_files:
-        file_path.sort_file()
+    return not Config.screenshots_only or bool(Config.filename_regex.match(basename))
 
 
-def screenshot_paths(dir: Path) -> List[SortableFile]:
-    """Returns a list of ImageFiles for all the screenshots to be sorted."""
-    screenshots = [
-        build_sortable_file(f) for f in files_in_dir(Config.screenshots_dir)
-        if not Config.screenshots_only or Config.filename_regex.match(path.basename(f))
-    ]
+def _open_sorted_file_index(args: Namespace) -> SortedFileIndex:
+    """The persistent index in DESTINATION_DIR unless --no-cache was specified (or it can't be opened)."""
+    if not args.no_cache:
+        try:
+            return SortedFileIndex(Config.destination_dir.joinpath(INDEX_FILENAME), args.rebuild_cache)
+        except sqlite3.Error as e:
+            log.warning(f"Failed to open sorted file index in '{Config.destination_dir}' ({e}), indexing in memory...")
 
-    return sorted(screenshots, key=lambda f: f.basename)
-
-
-def build_sortable_file(file_path: Union[str, Path]) -> SortableFile:
-    """Decide if it's a PDF, image, or other type of file."""
-    if is_image(file_path):
-        return ImageFile(file_path)
-    elif is_pdf(file_path):
-        return PdfFile(file_path)
-    else:
-        return SortableFile(file_path)
+    return SortedFileIndex(Path(':memory:'))
 
 
 def purge_non_images_from_dir() -> None:
     """Find all non images in a dir and purge them if they appear elsewhere in the sorted hierarchy."""
     args = Config.configure(purge_arg_parser)
-    sorted_files = SortableFile.all_sorted_files()
+    sorted_file_index = _open_sorted_file_index(args)
+    console.print(f"Indexing '{Config.sorted_screenshots_dir}'...")
+    sorted_file_index.refresh(Config.sorted_screenshots_dir)
     set_log_level('INFO')
 
     for subdir in args.subdirs_to_purge:
@@ -141,17 +136,62 @@ def purge_non_images_from_dir() -> None:
             if not is_pdf(file_path):
                 log.debug(f"Skipping image '{file_path}'...")
                 continue
+            elif path.islink(file_path):
+                log.debug(f"Skipping symlink '{file_path}'...")
+                continue
 
             basename = path.basename(file_path)
             console.print(f"Checking for '{basename}' in sorted files...")
-            matching_files = [f for f in sorted_files if f.name == basename]
+            copy_count = len(sorted_file_index.paths(basename))
 
-            if len(matching_files) <= 1:
-                console.print(f" -> Only {len(matching_files)} copies of '{basename}'...", style="dim")
+            if copy_count <= 1:
+                console.print(f" -> Only {copy_count} copies of '{basename}'...", style="dim")
                 continue
 
             processed_file_path = Config.processed_screenshots_dir.joinpath(basename)
             shutil.move(file_path, processed_file_path)
-            console.print(f"    Found {len(matching_files)} copies of '{basename}'...")
+            sorted_file_index.remove(file_path)
+            console.print(f"    Found {copy_count} copies of '{basename}'...")
             console.print(f"    Moved '{file_path}' to '{processed_file_path}'...", style="red")
             console.line()
+
+
+def find_duplicates() -> None:
+    """Find files with identical contents in the sorted hierarchy and optionally collapse them into hardlinks."""
+    args = Config.configure(find_duplicates_arg_parser)
+    console.print(f"Looking for duplicates in '{Config.sorted_screenshots_dir}'...")
+    duplicate_groups = find_duplicate_files(walk_files(Config.sorted_screenshots_dir), args.hash_threads)
+    bytes_freed = 0
+
+    for group in duplicate_groups:
+        console.print(f"{len(group.file_ids)} copies of {decimal(group.size)} file:")
+
+        for file_path in group.paths:
+            console.print(Text(f"    {file_path}", style='dim'))
+
+        if args.hardlink and not Config.dry_run:
+            bytes_freed += collapse_into_hardlinks(group)
+
+    wasted_bytes = sum(group.wasted_bytes for group in duplicate_groups)
+    console.line()
+    console.print(f"Found {len(duplicate_groups)} sets of duplicates wasting {decimal(wasted_bytes)}.", style='bright_green')
+
+    if args.hardlink:
+        if Config.dry_run:
+            console.print("Dry run; pass --execute to replace the duplicates with hardlinks.", style='yellow')
+        else:
+            console.print(f"Replaced duplicates with hardlinks, freeing {decimal(bytes_freed)}.", style='bright_green')
+
+
+def clown_sort_bench() -> None:
+    """Time each stage of sorting a synthetic corpus of screenshots and PDFs (see benchmark.py)."""
+    args = parse_bench_args()
+    from clown_sort import benchmark
+    benchmark.run_benchmark(args)
+
+
+def __getattr__(name: str) -> Any:
+    if name in LAZY_IMPORTS:
+        return getattr(importlib.import_module(LAZY_IMPORTS[name]), name)
+
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
@@ -0,0 +1,241 @@
+"""
+clown_sort_bench: sort a synthetic corpus (see lib/synthetic_corpus.py) into a temp dir with the same
+SortableFile.sort_file() that sort_screenshots uses and report the time spent in each of the instrumentation
+stages (see util/instrumentation.py). Results are written as JSON so runs on different commits can be compared
+(--compare).
+
+If the OCR engine isn't available the text rendered into the corpus is used instead of OCRing the files (and
+the ocr stage is skipped).
+"""
+import importlib
+import json
+import platform
+import shutil
+import subprocess
+from argparse import Namespace
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict, List, Optional
+
+from rich import box
+from rich.table import Table
+
+from clown_sort.config import Config
+from clown_sort.lib.ocr_engine import ocr_engine
+from clown_sort.lib.synthetic_corpus import CorpusFile, generate_corpus, load_corpus
+from clown_sort.screenshot_sorter import screenshot_paths
+from clown_sort.sort_rule import CRYPTO_RULES_CSV_PATH
+from clown_sort.util.constants import PACKAGE_NAME
+from clown_sort.util.instrumentation import SCAN, SORT_FILE, STAGES, StageStats, instrumentation
+from clown_sort.util.rich_helper import console, warning_text
+
+# Imported up front so importing pdfalyzer isn't part of the scan stage
+importlib.import_module('clown_sort.files.pdf_file')
+
+RESULTS_VERSION = 2
+OUTERMOST_STAGES = [SCAN, SORT_FILE]  # The other stages happen inside these so they aren't part of the total
+COMPARABLE_KEYS = ['results_version', 'corpus', 'ocr_engine', 'options']  # Results are only comparable if these are the same
+
+
+def run_benchmark(args: Namespace) -> None:
+    """Configure from args, sort the corpus args.repeat times, and print and write the fastest time for each stage."""
+    if args.debug:
+        Config.enable_debug_mode()
+
+    Config.set_ocr_engine(args.ocr_engine)
+    Config.set_ocr_preprocessing_options(args)
+    Config.set_pdf_extraction_options(args)
+    Config.pdf_page_jobs = max(1, Config.pdf_page_jobs)
+
+    with TemporaryDirectory(prefix='clown_sort_bench_') as tmp_dir:
+        corpus_dir = Path(args.corpus_dir) if args.corpus_dir else Path(tmp_dir).joinpath('corpus')
+        corpus = load_corpus(corpus_dir, args.seed, args.files_per_kind, args.pdf_pages)
+
+        if corpus is None:
+            console.print(f"Generating synthetic corpus in '{corpus_dir}'...")
+            corpus = generate_corpus(corpus_dir, args.seed, args.files_per_kind, args.pdf_pages)
+        else:
+            console.print(f"Reusing synthetic corpus in '{corpus_dir}'...")
+
+        work_dir = Path(tmp_dir).joinpath('work')
+
+        for dir in ['Screenshots', 'Sorted', 'Processed']:
+            work_dir.joinpath(dir).mkdir(parents=True)
+
+        Config.set_directories(work_dir.joinpath('Screenshots'), work_dir, [CRYPTO_RULES_CSV_PATH])
+        ocr_engine_key = ocr_engine(Config.ocr_engine).cache_key()
+
+        if ocr_engine_key is None:
+            msg = f"OCR engine '{Config.ocr_engine}' isn't available; timing the other stages with the corpus text"
+            console.print(warning_text(msg))
+
+        runs = []
+
+        for run_number in range(1, args.repeat + 1):
+            console.print(f"Sorting {len(corpus)} files (run {run_number} of {args.repeat})...")
+            runs.append(sort_corpus(corpus, use_corpus_text=ocr_engine_key is None))
+
+        results = benchmark_results(runs, corpus, args, ocr_engine_key)
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+
+    if baseline is not None and [baseline.get(k) for k in COMPARABLE_KEYS] != [results[k] for k in COMPARABLE_KEYS]:
+        console.print(warning_text(f"'{args.compare}' was run on a different corpus or with different options"))
+
+    console.print(results_table(results, baseline))
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    console.print(f"Wrote results to '{args.output}'.", style='bright_green')
+
+
+def sort_corpus(corpus: List[CorpusFile], use_corpus_text: bool = False) -> Dict[str, StageStats]:
+    """
+    Copy the corpus into Config.screenshots_dir, sort it (Config.dry_run and any prompts are turned off while
+    it runs), and return the instrumentation stats of each stage. If use_corpus_text is True the text rendered
+    into each file is used instead of OCRing it.
+    """
+    for dir in [Config.screenshots_dir, Config.sorted_screenshots_dir, Config.processed_screenshots_dir]:
+        shutil.rmtree(dir, ignore_errors=True)
+        dir.mkdir(parents=True)
+
+    for corpus_file in corpus:
+        shutil.copy2(corpus_file.file_path, Config.screenshots_dir)
+
+    corpus_texts = {corpus_file.file_path.name: corpus_file.text for corpus_file in corpus}
+    settings = (Config.dry_run, Config.leave_in_place, Config.screenshots_only, Config.manual_fallback,
+                Config.only_if_match, console.quiet)
+    Config.dry_run, Config.leave_in_place, Config.screenshots_only, Config.manual_fallback, \
+        Config.only_if_match, console.quiet = (False, False, False, False, False, True)
+    instrumentation.reset()
+
+    try:
+        for sortable_file in screenshot_paths(Config.screenshots_dir):
+            if use_corpus_text:
+                sortable_file.borrow_extracted_text(corpus_texts[sortable_file.basename])
+
+            sortable_file.sort_file()
+    finally:
+        Config.dry_run, Config.leave_in_place, Config.screenshots_only, Config.manual_fallback, \
+            Config.only_if_match, console.quiet = settings
+
+    stage_stats = instrumentation.stage_stats
+    instrumentation.reset()
+    return stage_stats
+
+
+def benchmark_results(runs: List[Dict[str, StageStats]], corpus: List[CorpusFile], args: Namespace, ocr_engine_key: Optional[str]) -> dict:
+    """JSON serializable results with the fastest run of each stage."""
+    stages = {}
+
+    for stage in STAGES:
+        fastest_run = min(runs, key=lambda stage_stats: _total_seconds(stage_stats, [stage]))
+        stages[stage] = _stage_results(fastest_run.get(stage))
+
+    total_seconds = min(_total_seconds(stage_stats, OUTERMOST_STAGES) for stage_stats in runs)
+
+    return {
+        'results_version': RESULTS_VERSION,
+        'clown_sort_version': _package_version(),
+        'git_commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'ocr_engine': ocr_engine_key,
+        'options': {
+            'ocr_preprocess': Config.ocr_preprocess,
+            'ocr_binarize': Config.ocr_binarize,
+            'ocr_crop_margins': Config.ocr_crop_margins,
+            'text_detection': Config.text_detection,
+            'pdf_ocr': Config.pdf_ocr,
+            'pdf_page_jobs': Config.pdf_page_jobs,
+        },
+        'repeat': args.repeat,
+        'corpus': {
+            'seed': args.seed,
+            'files_per_kind': args.files_per_kind,
+            'pdf_pages': args.pdf_pages,
+            'files': len(corpus),
+            'bytes': sum(corpus_file.file_path.stat().st_size for corpus_file in corpus),
+        },
+        'stages': stages,
+        'total_seconds': total_seconds,
+        'files_per_second': len(corpus) / total_seconds if total_seconds > 0 else None,
+    }
+
+
+def results_table(results: dict, baseline: Optional[dict] = None) -> Table:
+    """Table of the time spent in each stage (and the change from the baseline results if provided)."""
+    table = Table('Stage', 'Files', 'Total', 'Mean', 'Median', 'Max', title='clown_sort_bench', box=box.SIMPLE)
+
+    if baseline is not None:
+        table.add_column('Baseline', justify='right')
+        table.add_column('Change', justify='right')
+
+    for stage, stats in list(results['stages'].items()) + [('total', {'total_seconds': results['total_seconds']})]:
+        row = [stage, str(stats.get('count', ''))]
+
+        if stats.get('count') == 0:
+            row += ['skipped', '', '', '']
+        else:
+            row.append(f"{stats['total_seconds']:.3f} s")
+            row += [f"{stats[key]:.1f} ms" if key in stats else '' for key in ['mean_ms', 'median_ms', 'max_ms']]
+
+        if baseline is not None:
+            row += _comparison(stats.get('total_seconds'), _baseline_seconds(baseline, stage))
+
+        table.add_row(*row, style='bold' if stage == 'total' else None)
+
+    return table
+
+
+def _stage_results(stats: Optional[StageStats]) -> dict:
+    if stats is None:
+        return {'count': 0, 'total_seconds': None}
+
+    return {
+        'count': stats.count,
+        'total_seconds': stats.total,
+        'mean_ms': stats.total / stats.count * 1000,
+        'median_ms': stats.percentile(50) * 1000,
+        'max_ms': stats.max * 1000,
+    }
+
+
+def _total_seconds(stage_stats: Dict[str, StageStats], stages: List[str]) -> float:
+    return sum(stage_stats[stage].total for stage in stages if stage in stage_stats)
+
+
+def _baseline_seconds(baseline: dict, stage: str) -> Optional[float]:
+    if stage == 'total':
+        return baseline.get('total_seconds')
+
+    return baseline.get('stages', {}).get(stage, {}).get('total_seconds')
+
+
+def _comparison(seconds: Optional[float], baseline_seconds: Optional[float]) -> List[str]:
+    if baseline_seconds is None:
+        return ['', '']
+    elif not seconds:
+        return [f"{baseline_seconds:.3f} s", '']
+
+    change = (seconds - baseline_seconds) / baseline_seconds if baseline_seconds > 0 else 0.0
+    style = 'green' if change < 0 else 'red'
+    return [f"{baseline_seconds:.3f} s", f"[{style}]{change:+.1%}[/{style}]"]
+
+
+def _package_version() -> Optional[str]:
+    try:
+        return version(PACKAGE_NAME)
+    except PackageNotFoundError:
+        return None
+
+
+def _git_commit() -> Optional[str]:
+    """Commit of the clown_sort checkout being benchmarked (None if it's not a git checkout)."""
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=Path(__file__).parent)
+    except OSError:
+        return None
+
+    return result.stdout.strip() if result.returncode == 0 else None
@@ -2,30 +2,68 @@
 Global configuration.
 """
 import re
+import sqlite3
 import sys
 from argparse import ArgumentParser, Namespace
 from importlib.metadata import version
 from os import environ
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Union
 
 from rich import box
 from rich.console import Console
 from rich.table import Table
 from rich.text import Text
 
+from clown_sort.lib.extraction_cache import CACHE_FILENAME, ExtractionCache
+from clown_sort.lib.ocr_engine import DEFAULT_OCR_ENGINE, OCR_ENGINE_CLASSES
+from clown_sort.lib.pdf_page_extractor import DEFAULT_MIN_TEXT_DENSITY, DEFAULT_PDF_OCR_POLICY
+from clown_sort.lib.rule_set import RuleSet
+from clown_sort.lib.sorted_manifest import MANIFEST_FILENAME, SortedManifest
 from clown_sort.sort_rule import SortRule, SortRuleParseError
 from clown_sort.util import rich_helper
 from clown_sort.util.argument_parser import parser
-from clown_sort.util.constants import PACKAGE_NAME, PDF_ERRORS
-from clown_sort.util.filesystem_helper import create_dir_if_it_does_not_exist, subdirs_of_dir
+from clown_sort.util.constants import (DEFAULT_MIN_EDGE_DENSITY, DEFAULT_PREFETCH_FILES, DEFAULT_PREFETCH_MAX_MB,
+     DEFAULT_TEXT_HEIGHT, PACKAGE_NAME, PDF_ERRORS)
+from clown_sort.util.filesystem_helper import COPY, create_dir_if_it_does_not_exist, subdirs_of_dir
+from clown_sort.util.instrumentation import instrumentation
 from clown_sort.util.logging import log, set_log_level
 
+if TYPE_CHECKING:
+    from clown_sort.lib.ocr_preprocessing import OcrPreprocessing
+
+# Types of Config values that are copied into worker processes
+WORKER_STATE_TYPES = (bool, int, float, str, Path, re.Pattern)
+
 
 class Config:
     # Non-boolean config vars
     filename_regex: re.Pattern
     sort_rules: List[SortRule] = []
+    rule_set: RuleSet = RuleSet([])
+    rules_csv_paths: List[Path] = []
+    _rules_csv_mtimes: List[Optional[int]] = []
+    extraction_cache: Optional[ExtractionCache] = None
+    sorted_manifest: Optional[SortedManifest] = None
+    jobs: int = 1
+    pdf_page_jobs: int = 1
+    pdf_ocr: str = DEFAULT_PDF_OCR_POLICY
+    pdf_ocr_min_density: float = DEFAULT_MIN_TEXT_DENSITY
+    # Limits on how much of a PDF is extracted for sorting
+    pdf_max_pages: Optional[int] = None
+    pdf_max_chars: Optional[int] = None
+    pdf_stop_after_folders: Optional[int] = None
+    link_mode: str = COPY
+    # Files in the sorted dir that other sorted files are symlinks to (found by --rescan-sorted)
+    symlink_targets: Set[Path] = set()
+    prefetch: int = DEFAULT_PREFETCH_FILES
+    prefetch_max_mb: int = DEFAULT_PREFETCH_MAX_MB
+    near_duplicates: Optional[str] = None
+    ocr_engine: str = DEFAULT_OCR_ENGINE
+    ocr_text_height: int = DEFAULT_TEXT_HEIGHT
+    text_detection: Optional[str] = None
+    min_edge_density: float = DEFAULT_MIN_EDGE_DENSITY
+    trace_path: Optional[Path] = None
     # Boolean config vars
     anonymize_user_dir: bool = False
     delete_originals: bool = False
@@ -35,10 +73,14 @@ class Config:
     leave_in_place: bool = False
     manual_sort: bool = False
     manual_fallback: bool = False
+    ocr_binarize: bool = False
+    ocr_crop_margins: bool = False
+    ocr_preprocess: bool = False
     only_if_match: bool = False
     print_as_parsed: bool = False
     rescan_sorted: bool = False
     screenshots_only: bool = True
+    watch: bool = False
     yes_overwrite: bool = False
 
     @classmethod
@@ -60,7 +102,19 @@ class Config:
         Config.leave_in_place = True if args.leave_in_place else False
         Config.only_if_match = True if args.only_if_match else False
         Config.rescan_sorted = True if args.rescan_sorted else False
+        Config.watch = True if args.watch else False
         Config.yes_overwrite = True if args.yes_overwrite else False
+        Config.jobs = args.jobs
+        Config.set_pdf_extraction_options(args)
+        Config.pdf_max_pages = args.pdf_max_pages
+        Config.pdf_max_chars = args.pdf_max_chars
+        Config.pdf_stop_after_folders = args.pdf_stop_after_folders
+        Config.link_mode = args.link_mode
+        Config.prefetch = args.prefetch
+        Config.prefetch_max_mb = args.prefetch_max_mb
+        Config.near_duplicates = args.near_duplicates
+        Config.set_ocr_engine(args.ocr_engine)
+        Config.set_ocr_preprocessing_options(args)
 
         screenshots_dir = Path(args.screenshots_dir).expanduser()
         destination_dir = Path(args.destination_dir or args.screenshots_dir).expanduser()
@@ -68,10 +122,30 @@ class Config:
         log.debug(f"Rules CSVs: {rules_csvs}")
         Config.set_directories(screenshots_dir, destination_dir, rules_csvs)
 
+        if Config.jobs < 1 or Config.pdf_page_jobs < 1:
+            Console().print("--jobs and --pdf-page-jobs must be at least 1.", style='red')
+            sys.exit(-1)
+
+        if Config.prefetch < 0 or Config.prefetch_max_mb < 1:
+            Console().print("--prefetch can't be negative and --prefetch-max-mb must be at least 1.", style='red')
+            sys.exit(-1)
+
+        if Config.ocr_text_height < 1:
+            Console().print("--ocr-text-height must be at least 1.", style='red')
+            sys.exit(-1)
+
+        if any(limit is not None and limit < 1 for limit in cls.pdf_sorting_limits()):
+            Console().print("--pdf-max-pages, --pdf-max-chars, and --pdf-stop-after-folders must be at least 1.", style='red')
+            sys.exit(-1)
+
         if Config.leave_in_place and Config.delete_originals:
             Console().print("--leave-in-place and --delete-originals are mutually exclusive.", style='red')
             sys.exit(-1)
 
+        if Config.watch and (args.manual_sort or Config.rescan_sorted):
+            Console().print("--watch can't be used with --manual-sort or --rescan-sorted.", style='red')
+            sys.exit(-1)
+
         if args.show_rules:
             Console().print(cls._rules_table())
             sys.exit()
@@ -98,6 +172,9 @@ class Config:
 
                 Config.manual_fallback = True
 
+        if args.trace:
+            Config.open_trace(Path(args.trace).expanduser())
+
         return args
 
     @classmethod
@@ -122,6 +199,9 @@ class Config:
             except SortRuleParseError:
                 sys.exit(-1)
 
+        cls.rule_set = RuleSet(cls.sort_rules)
+        cls.rules_csv_paths = rules_csv_paths
+        cls._rules_csv_mtimes = _mtimes(rules_csv_paths)
         cls.screenshots_dir: Path = Path(screenshots_dir)
         cls.destination_dir: Path = Path(destination_dir or screenshots_dir)
         cls.sorted_screenshots_dir = cls.destination_dir.joinpath('Sorted')
@@ -133,11 +213,138 @@ class Config:
 
         cls._log_configured_paths()
 
+    @classmethod
+    def reload_sort_rules_if_changed(cls) -> bool:
+        """Reload the sort rules if any of the rules CSVs changed since they were loaded. Returns True if reloaded."""
+        csv_mtimes = _mtimes(cls.rules_csv_paths)
+
+        if csv_mtimes == cls._rules_csv_mtimes:
+            return False
+
+        cls._rules_csv_mtimes = csv_mtimes
+
+        try:
+            sort_rules = [rule for csv_path in cls.rules_csv_paths for rule in SortRule.load_rules_csv(csv_path)]
+        except (KeyError, OSError, SortRuleParseError) as e:
+            log.warning(f"Failed to reload sort rules ({e!r}), keeping the old ones...")
+            return False
+
+        cls.sort_rules = sort_rules
+        cls.rule_set = RuleSet(sort_rules)
+        log.info(f"Reloaded {len(sort_rules)} sort rules from {[str(p) for p in cls.rules_csv_paths]}")
+        return True
+
+    @classmethod
+    def configure_extraction_cache(cls, cache_dir: Path, args: Namespace) -> None:
+        """Open the OCR / extracted text cache in cache_dir unless --no-cache was specified."""
+        if args.no_cache:
+            log.debug("Text extraction cache disabled...")
+            return
+
+        try:
+            cls.extraction_cache = ExtractionCache(
+                cache_dir.joinpath(CACHE_FILENAME),
+                max_bytes=args.cache_max_mb * 1024 * 1024,
+                rebuild=args.rebuild_cache
+            )
+        except sqlite3.Error as e:
+            log.warning(f"Failed to open text extraction cache in '{cache_dir}' ({e}), continuing without it...")
+
+    @classmethod
+    def open_trace(cls, trace_path: Path) -> None:
+        """Write the instrumentation spans to trace_path as they're recorded (see --trace)."""
+        try:
+            instrumentation.open_trace(trace_path)
+        except OSError as e:
+            Console().print(f"Can't write trace file '{trace_path}' ({e.strerror}).", style='red')
+            sys.exit(-1)
+
+        cls.trace_path = trace_path
+
+    @classmethod
+    def set_ocr_engine(cls, engine_name: str) -> None:
+        """Choose the OCR backend, exiting if it requires an optional package that isn't installed."""
+        if not OCR_ENGINE_CLASSES[engine_name].is_installed():
+            msg = Text('ERROR', style='bright_red')
+            msg.append(f": The '{engine_name}' package must be installed to use it as the OCR engine. Try running:", style='bright_white')
+            log_optional_module_warning('ocr', msg)
+            sys.exit(-1)
+
+        log.debug(f"OCR engine: {engine_name}")
+        cls.ocr_engine = engine_name
+
+    @classmethod
+    def configure_sorted_manifest(cls, args: Namespace) -> None:
+        """Open the manifest of already evaluated sorted files unless --no-cache was specified."""
+        if args.no_cache:
+            return
+
+        try:
+            cls.sorted_manifest = SortedManifest(cls.destination_dir.joinpath(MANIFEST_FILENAME), args.rebuild_cache)
+        except sqlite3.Error as e:
+            log.warning(f"Failed to open sorted files manifest in '{cls.destination_dir}' ({e}), continuing without it...")
+
+    @classmethod
+    def set_pdf_extraction_options(cls, args: Namespace) -> None:
+        cls.pdf_page_jobs = args.pdf_page_jobs
+        cls.pdf_ocr = args.pdf_ocr
+        cls.pdf_ocr_min_density = args.pdf_ocr_min_density
+
+    @classmethod
+    def set_ocr_preprocessing_options(cls, args: Namespace) -> None:
+        cls.ocr_binarize = bool(args.ocr_binarize)
+        cls.ocr_crop_margins = bool(args.ocr_crop_margins)
+        cls.ocr_preprocess = bool(args.ocr_preprocess or args.ocr_binarize or args.ocr_crop_margins)
+        cls.ocr_text_height = args.ocr_text_height
+        cls.text_detection = args.text_detection
+        cls.min_edge_density = args.min_edge_density
+
+    @classmethod
+    def ocr_preprocessing(cls) -> Optional['OcrPreprocessing']:
+        """The preprocessing to apply to images before OCRing them (None if --ocr-preprocess isn't set)."""
+        if not cls.ocr_preprocess:
+            return None
+
+        from clown_sort.lib.ocr_preprocessing import OcrPreprocessing
+
+        return OcrPreprocessing(cls.ocr_binarize, cls.ocr_crop_margins, cls.ocr_text_height)
+
+    @classmethod
+    def pdf_sorting_limits(cls) -> List[Optional[int]]:
+        return [cls.pdf_max_pages, cls.pdf_max_chars, cls.pdf_stop_after_folders]
+
     @classmethod
     def get_sort_dirs(cls) -> List[str]:
         """Returns a list of the subdirectories already created for sorted images."""
         return sorted(subdirs_of_dir(cls.sorted_screenshots_dir), key=lambda d: d.lower())
 
+    @classmethod
+    def worker_state(cls) -> Dict[str, Any]:
+        """
+        Picklable copy of the simple config values (flags, paths, etc.) plus the sort rules (--pdf-stop-after-folders
+        matches rules in the workers) to hand to worker processes.
+        """
+        state = {k: v for k, v in vars(cls).items() if not k.startswith('_') and isinstance(v, WORKER_STATE_TYPES)}
+        state['sort_rules'] = cls.sort_rules
+        return state
+
+    @classmethod
+    def load_worker_state(cls, state: Dict[str, Any]) -> None:
+        """
+        Configure a worker process. Workers never touch the cache or manifest; the parent process owns them.
+        --jobs workers extract PDFs one page at a time so there aren't jobs * pdf_page_jobs processes.
+        """
+        for k, v in state.items():
+            setattr(cls, k, v)
+
+        cls.rule_set = RuleSet(cls.sort_rules)
+        cls.pdf_page_jobs = 1
+        cls.extraction_cache = None
+        cls.sorted_manifest = None
+
+        if cls.debug:
+            cls.enable_debug_mode()
+
     @classmethod
     def enable_debug_mode(cls) -> None:
         Config.debug = True
@@ -172,6 +379,11 @@ class Config:
         log.debug(f"pdf_errors_dir: {cls.pdf_errors_dir}")
 
 
+def _mtimes(file_paths: List[Path]) -> List[Optional[int]]:
+    """Modification times of file_paths (None for files that don't exist)."""
+    return [file_path.stat().st_mtime_ns if file_path.exists() else None for file_path in file_paths]
+
+
 def _check_for_pysimplegui():
     try:
         import FreeSimpleGUI as sg
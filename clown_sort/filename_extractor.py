@@ -1,9 +1,16 @@
 """
 Decide on a filename string based on some OCR text.
+
+The text is classified (tweet, reddit post, etc.) by detectors that each run at most once per file on
+at most the first DETECTION_WINDOW_CHARS of the text. The big DOTALL regexes are never searched
+directly because OCR text that almost matches them (e.g. a long reddit thread with no 'Give Award Share
+Report' footer) makes them backtrack for minutes. Instead a regex that can only match a single line
+finds where the match has to start and the big regex is only matched from there, which takes time
+proportional to the length of the text.
 """
 import re
 from difflib import SequenceMatcher
-from typing import Optional
+from typing import Callable, Dict, Optional
 
 from clown_sort.util.logging import log
 from clown_sort.util.filesystem_helper import strip_bad_chars, strip_mac_screenshot
@@ -23,16 +30,35 @@ REDDIT_POST_REGEX = re.compile(
     re.DOTALL | re.MULTILINE
 )
 
+# The author has to be on the same line as the '- 5 days ago' (used to be anywhere before it)
 REDDIT_REPLY_REGEX = re.compile(
-    '(?P<author>\\w{3,30})( OP -)?\\s+(.*?)-\\s+\\d+\\s+(seconds|min(\\.|utes)|hours|hr\\.|days|months|years)\\s+ago\\s*(.*?)\\n(?P<body>.*?)(Reply\\s+)?Give\\s?Award\\s+Share\\s+Report',
+    '(?P<author>\\w{3,30})( OP -)?[^\\S\\n]+([^\\n]*?)-\\s+\\d+\\s+(seconds|min(\\.|utes)|hours|hr\\.|days|months|years)\\s+ago\\s*(.*?)\\n(?P<body>.*?)(Reply\\s+)?Give\\s?Award\\s+Share\\s+Report',
     re.DOTALL | re.MULTILINE | re.IGNORECASE
 )
 
+# The parts of the regexes above before the body. The body can be anything so they match where the header does.
+TWEET_REPLY_HEADER_REGEX = re.compile('Replying to (@\\w{3,15})[^\\n]*\\n')
+
+TWEET_HEADER_REGEX = re.compile(
+    '(@\\w{3,15}(\\.\\.\\.)?)(\\s{1,2}-\\s{1,2}([\\dti]{1,2}[smhd]|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[^\\n]*)?\\n'
+)
+
+REDDIT_POST_HEADER_REGEX = re.compile('(r/(?P<sub>\\w{3,30}) - )?Posted by u/(?P<author>\\w{3,30}) \\d+[^\\n]*\\n')
+
+REDDIT_REPLY_HEADER_REGEX = re.compile(
+    '(?P<author>\\w{3,30})( OP -)?[^\\S\\n]+([^\\n]*?)-\\s+\\d+\\s+(seconds|min(\\.|utes)|hours|hr\\.|days|months|years)\\s+ago',
+    re.IGNORECASE
+)
+
+REDDIT_REPLY_AGE_REGEX = re.compile('-\\s+\\d+\\s+(seconds|min(\\.|utes)|hours|hr\\.|days|months|years)\\s+ago', re.IGNORECASE)
+REDDIT_REPLY_FOOTER_REGEX = re.compile('Give\\s?Award\\s+Share\\s+Report', re.IGNORECASE)
+
 REVEDDIT_REGEX = re.compile('Reveddit Real.?Time')
 SUBREDDIT_REGEX = re.compile('/r/(?P<subreddit>\\w+)|\\sse(lf|ir)\\.(?P<subreddit2>\\w+)')
 DUNE_ANALYTICS_REGEX = re.compile('Query results (.*) @\\w+')
 RETWEETED_REGEX = re.compile('(.*) Retweeted')
 
+DETECTION_WINDOW_CHARS = 4096  # Tweets etc. are recognized by headers near the top of the text
 MAX_FILENAME_LENGTH = 225
 MIN_LENGTH_FOR_DUPE_CHECK = 9
 DEFAULT_LENGTH_FOR_LONG_FILENAMES = 190
@@ -47,14 +73,23 @@ class FilenameExtractor:
         self.available_char_count: int = MAX_FILENAME_LENGTH - self.basename_length - 1
         self.author: Optional[str] = None
         self.reply_to_account: Optional[str] = None
+        self._detection_window: str = (self.text or '')[0:DETECTION_WINDOW_CHARS]
+        self._detector_matches: Dict[Callable[[str], Optional[re.Match]], Optional[re.Match]] = {}
+
+    def __getstate__(self) -> dict:
+        """re.Match objects can't be pickled (--jobs sends ImageFiles back from workers) so drop the memoized matches."""
+        state = self.__dict__.copy()
+        state['_detector_matches'] = {}
+        return state
 
     def filename(self) -> str:
         """Examine self.text and decide on an appropriate filename."""
         if self.text is None:
             return self.image_file.basename
 
-        if DUNE_ANALYTICS_REGEX.search(self.text):
-            dune_match = DUNE_ANALYTICS_REGEX.search(self.text)
+        dune_match = self._detect(DUNE_ANALYTICS_REGEX.search)
+
+        if dune_match is not None:
             query_title = strip_bad_chars(dune_match.group(1))
             filename_str = 'Dune Analytics "' + query_title + '" '
             new_filename = filename_str + self.image_file.basename
@@ -69,7 +104,7 @@ class FilenameExtractor:
             new_filename = filename + self.image_file.extname
         elif self._is_reveddit():
             filename_str = 'Reveddit '
-            subreddit_match = SUBREDDIT_REGEX.search(self.text)
+            subreddit_match = self._detect(SUBREDDIT_REGEX.search)
 
             if subreddit_match is not None:
                 filename_str += 'r_' + (subreddit_match.group('subreddit') or subreddit_match.group('subreddit2'))
@@ -91,16 +126,16 @@ class FilenameExtractor:
     def _is_tweet(self) -> bool:
         """Return true if the text looks like a tweet."""
         # TODO: the check for @crypto_oracle is a hack
-        return TWEET_REGEX.search(self.text) is not None and '@crypto_oracle' not in self.text
+        return self._detect(find_tweet) is not None and '@crypto_oracle' not in self.text
 
     def _is_retweet(self) -> bool:
         """Return true if the text looks like a retweet."""
-        return self._is_tweet() and RETWEETED_REGEX.search(self._first_line()) is not None
+        return self._is_tweet() and self._detect(_find_retweeted) is not None
 
     def _retweeter(self) -> Optional[str]:
         """Return the name of the retweeter (or None if there isn't one)"""
         if self._is_retweet():
-            retweet_match = RETWEETED_REGEX.search(self._first_line())
+            retweet_match = self._detect(_find_retweeted)
             retweeter = retweet_match.group(1)
             # Remove the leading 'tl' (or whatever Tesseract interprets the loop arrow icon to be)
             return ','.join(retweeter.split()[1:])
@@ -113,24 +148,24 @@ class FilenameExtractor:
 
     def _is_reddit_post(self) -> bool:
         """Return true if it's a reddit post."""
-        return REDDIT_POST_REGEX.search(self.text) is not None
+        return self._detect(find_reddit_post) is not None
 
     def _is_reddit_comment(self) -> bool:
         """Return true if it's a reddit comment."""
-        return REDDIT_REPLY_REGEX.search(self.text) is not None
+        return self._detect(find_reddit_reply) is not None
 
     def _is_reveddit(self) -> bool:
         """Return true if text is from reveddit.com (site for deleted reddit posts and comments)."""
-        return REVEDDIT_REGEX.search(self.text) is not None
+        return self._detect(REVEDDIT_REGEX.search) is not None
 
     def _filename_str_for_tweet(self) -> str:
         """Build a filename for tweets."""
-        tweet_match = TWEET_REGEX.search(self.text)
+        tweet_match = self._detect(find_tweet)
         self.author = tweet_match.group(1)
         body = tweet_match.group('body')
         filename_text = f"Tweet by {self.author}"
         retweeter = self._retweeter()
-        reply_to = TWEET_REPLY_REGEX.search(self.text)
+        reply_to = self._detect(find_tweet_reply)
 
         if retweeter is not None:
             filename_text = f'Retweeted by {retweeter} - {filename_text}'
@@ -148,7 +183,7 @@ class FilenameExtractor:
     def _filename_str_for_reddit(self) -> str:
         """Build a filename for Reddit posts and comments."""
         if self._is_reddit_post():
-            reddit_match = REDDIT_POST_REGEX.search(self.text)
+            reddit_match = self._detect(find_reddit_post)
             self.author = reddit_match.group('author')
             subreddit: str = reddit_match.group('sub')
             body: str = reddit_match.group('body')
@@ -157,7 +192,7 @@ class FilenameExtractor:
             if subreddit:
                 filename_text += f" in {subreddit}"
         else:
-            reddit_match = REDDIT_REPLY_REGEX.search(self.text)
+            reddit_match = self._detect(find_reddit_reply)
             self.author = reddit_match.group('author')
             body: str = reddit_match.group('body')
             filename_text: str = f"Reddit post by {self.author}"
@@ -208,5 +243,74 @@ class FilenameExtractor:
             log.debug(f"\n'{clean_filename_str}'\nis not in\n'{self.image_file.basename}'\n")
             return False
 
-    def _first_line(self) -> str:
-        return self.text.split('\n')[0]
+    def _detect(self, detector: Callable[[str], Optional[re.Match]]) -> Optional[re.Match]:
+        """Run detector on the detection window the first time it's needed and remember the result."""
+        if detector not in self._detector_matches:
+            self._detector_matches[detector] = detector(self._detection_window)
+
+        return self._detector_matches[detector]
+
+
+def find_tweet(text: str) -> Optional[re.Match]:
+    """Same as TWEET_REGEX.search(text) but in linear time."""
+    return _match_from_header(TWEET_REGEX, TWEET_HEADER_REGEX, text)
+
+
+def find_tweet_reply(text: str) -> Optional[re.Match]:
+    """Same as TWEET_REPLY_REGEX.search(text) but in linear time."""
+    return _match_from_header(TWEET_REPLY_REGEX, TWEET_REPLY_HEADER_REGEX, text)
+
+
+def find_reddit_post(text: str) -> Optional[re.Match]:
+    """Same as REDDIT_POST_REGEX.search(text) but in linear time."""
+    return _match_from_header(REDDIT_POST_REGEX, REDDIT_POST_HEADER_REGEX, text)
+
+
+def find_reddit_reply(text: str) -> Optional[re.Match]:
+    """
+    Same as REDDIT_REPLY_REGEX.search(text) but in linear time. A match has to end with a footer so only
+    the text up to the last footer is searched. The match starts on the first line that has an author
+    before its '- 5 days ago' as long as there's a newline between that and the footer.
+    """
+    footer = None
+
+    for footer in REDDIT_REPLY_FOOTER_REGEX.finditer(text):
+        pass
+
+    if footer is None:
+        return None
+
+    ages = list(REDDIT_REPLY_AGE_REGEX.finditer(text, 0, footer.start()))
+
+    for i, age in enumerate(ages):
+        next_newline = text.find('\n', age.end())
+
+        # If there's no newline before the footer after this age there's none after any of the later ones either
+        if not 0 <= next_newline < footer.start():
+            return None
+        # Only the last age on each line needs checking; the header regex finds the first one after the author
+        elif i + 1 < len(ages) and ages[i + 1].start() < next_newline:
+            continue
+
+        line_start = text.rfind('\n', 0, age.start()) + 1
+        header = REDDIT_REPLY_HEADER_REGEX.search(text, line_start, age.end())
+
+        if header is not None:
+            return REDDIT_REPLY_REGEX.match(text, header.start(), footer.end())
+
+    return None
+
+
+def _match_from_header(regex: re.Pattern, header_regex: re.Pattern, text: str) -> Optional[re.Match]:
+    """
+    Find where regex's match starts with header_regex (which only matches single lines so it can't
+    backtrack across the whole text) then match regex from there. The header ends with a newline so
+    only the text up to the last newline needs to be searched.
+    """
+    header = header_regex.search(text, 0, text.rfind('\n') + 1)
+    return None if header is None else regex.match(text, header.start())
+
+
+def _find_retweeted(text: str) -> Optional[re.Match]:
+    """RETWEETED_REGEX starts with (.*) so if it matches the first line at all it matches from the start of it."""
+    return RETWEETED_REGEX.match(text.partition('\n')[0])
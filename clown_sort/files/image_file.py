@@ -8,9 +8,8 @@ Tags: https://exiftool.org/TagNames/EXIF.html
 import io
 import re
 from pathlib import Path
-from typing import Optional, Union
+from typing import NamedTuple, Optional, Union
 
-import pytesseract
 from PIL import Image, TiffImagePlugin
 from PIL.ExifTags import TAGS
 from rich.pretty import pprint
@@ -18,7 +17,15 @@ from rich.pretty import pprint
 from clown_sort.config import Config
 from clown_sort.filename_extractor import FilenameExtractor
 from clown_sort.files.sortable_file import RuleMatch, SortableFile
-from clown_sort.util.filesystem_helper import copy_file_creation_time
+from clown_sort.lib.decoded_image_cache import decoded_images
+from clown_sort.lib.exif_splicer import copy_with_exif
+from clown_sort.lib.ocr_engine import OcrError, ocr_engine
+from clown_sort.lib.ocr_preprocessing import preprocess_for_ocr
+from clown_sort.lib.perceptual_hash import Thumbnail, dhash
+from clown_sort.lib.text_detection import detect_text, quick_pass_found_text, quick_pass_image
+from clown_sort.util.constants import QUICK
+from clown_sort.util.filesystem_helper import break_link, copy_file_creation_time, file_content_hash
+from clown_sort.util.instrumentation import EXIF_SPLICE, NAMING, OCR, REENCODE, instrumentation
 from clown_sort.util.logging import log
 from clown_sort.util.rich_helper import console, error_text, warning_text
 
@@ -31,14 +38,30 @@ EXIF_CODES = {
 }
 
 
+class OcrResult(NamedTuple):
+    text: Optional[str]
+    had_error: bool = False
+
+
 class ImageFile(SortableFile):
+    def __init__(self, file_path: Union[str, Path]) -> None:
+        super().__init__(file_path)
+        self._perceptual_hash: Optional[int] = None
+        self._near_duplicate_thumbnail: Optional[Thumbnail] = None
+
     def copy_file_to_sorted_dir(self, destination_path: Path, match: Optional[re.Match] = None) -> None:
         """
         Copies to a new file and injects the ImageDescription exif tag.
         If :destination_subdir is given new file will be in :destination_subdir off
         of the configured :destination_dir. Returns new file path.
         """
-        exif_data = self.raw_exif_dict()
+        exif_data = Image.Exif()
+        original_exif = self.raw_exif_dict()
+
+        # Modify a copy because the original belongs to the shared decoded image
+        if len(original_exif) > 0:
+            exif_data.load(original_exif.tobytes())
+
         self._log_copy_file(destination_path, match)
 
         if self.extracted_text() is not None:
@@ -48,7 +71,18 @@ class ImageFile(SortableFile):
             return
 
         try:
-            self.pillow_image_obj().save(destination_path, exif=exif_data)
+            # Only re-encode the image if the EXIF can't be spliced into the original bytes (e.g. TIFFs)
+            with instrumentation.span(EXIF_SPLICE, self.file_path):
+                exif_was_spliced = copy_with_exif(self.file_path, destination_path, exif_data)
+
+            if not exif_was_spliced:
+                log.debug(f"Re-encoding '{self.file_path}' to add EXIF data...")
+                break_link(destination_path)
+                image = self.pillow_image_obj()
+
+                with instrumentation.span(REENCODE, self.file_path):
+                    image.save(destination_path, exif=exif_data)
+
             copy_file_creation_time(self.file_path, destination_path)
         except (NotImplementedError, TypeError, ValueError) as e:
             console.print_exception()
@@ -70,29 +104,47 @@ class ImageFile(SortableFile):
                 or len(self.basename) > FILENAME_LENGTH_TO_CONSIDER_SORTED:
             self._new_basename = self.basename
         else:
-            self._filename_extractor = FilenameExtractor(self)
-            self._new_basename = self._filename_extractor.filename()
+            with instrumentation.span(NAMING, self.file_path):
+                self._filename_extractor = FilenameExtractor(self)
+                self._new_basename = self._filename_extractor.filename()
 
         self._new_basename = self._new_basename.replace('""', '"')
         return self._new_basename
 
     def thumbnail_bytes(self) -> bytes:
         """Return bytes for a thumbnail."""
-        image = self.pillow_image_obj()
+        image = self.pillow_image_obj().copy()  # thumbnail() resizes in place
         image.thumbnail(THUMBNAIL_DIMENSIONS)
         _thumbnail_bytes = io.BytesIO()
         image.save(_thumbnail_bytes, format="PNG")
         return _thumbnail_bytes.getvalue()
 
+    def perceptual_hash(self) -> int:
+        """dHash of the image for finding near duplicates."""
+        if self._perceptual_hash is None:
+            self._perceptual_hash = dhash(self.pillow_image_obj())
+
+        return self._perceptual_hash
+
+    def near_duplicate_thumbnail(self) -> Thumbnail:
+        """Grayscale thumbnail for checking that a near duplicate really is the same picture."""
+        if self._near_duplicate_thumbnail is None:
+            self._near_duplicate_thumbnail = Thumbnail.of(self.pillow_image_obj())
+
+        return self._near_duplicate_thumbnail
+
     def extracted_text(self) -> Optional[str]:
         """Use Tesseract to OCR the text in the image, which is returned as a string."""
         if self.text_extraction_attempted:
             return self._extracted_text
 
-        self._extracted_text = ImageFile.ocr_text(self.pillow_image_obj(), str(self.file_path))
+        self._extracted_text = self._cached_text_extraction(self._ocr_text)
         self.text_extraction_attempted = True
         return self._extracted_text
 
+    def needs_text_extraction(self) -> bool:
+        return not self.text_extraction_attempted
+
     def exif_dict(self) -> dict:
         """Return a key/value list of exif tags where keys are strings."""
         raw_exif_tags = self.pillow_image_obj().getexif()
@@ -119,12 +171,47 @@ class ImageFile(SortableFile):
         return new_dict
 
     def pillow_image_obj(self) -> Image.Image:
-        """Return the file as Pillow Image object."""
-        return Image.open(self.file_path)
+        """
+        Return the file as a decoded Pillow Image object. The object is shared (see DecodedImageCache)
+        so copy() it before modifying it.
+        """
+        return decoded_images.get(self.file_path)
+
+    def release_resources(self) -> None:
+        decoded_images.release(self.file_path)
 
     def can_be_presented_in_popup(self) -> bool:
         return True
 
+    def _sorted_copy_hash(self, copy_path: Path) -> str:
+        """Copies have the ImageDescription added to their EXIF so they have to be hashed."""
+        return file_content_hash(copy_path)
+
+    def _text_extractor_key(self) -> Optional[str]:
+        engine_cache_key = ocr_engine(Config.ocr_engine).cache_key()
+        preprocessing = Config.ocr_preprocessing()
+
+        if engine_cache_key is None:
+            return None
+
+        key_parts = [engine_cache_key]
+
+        if preprocessing is not None:
+            key_parts.append(preprocessing.cache_key())
+        if Config.text_detection is not None:
+            key_parts.append(f"text_detection={Config.text_detection} min_edge_density={Config.min_edge_density}")
+
+        return ' '.join(key_parts)
+
+    def _ocr_text(self) -> Optional[str]:
+        image = self.pillow_image_obj()
+
+        with instrumentation.span(OCR, self.file_path):
+            ocr_result = ImageFile.ocr_result(image, str(self.file_path))
+
+        self._text_extraction_failed = ocr_result.had_error
+        return ocr_result.text
+
     def __repr__(self) -> str:
         return f"ImageFile('{self.file_path}')"
 
@@ -134,17 +221,49 @@ class ImageFile(SortableFile):
 
     @staticmethod
     def ocr_text(image: Image.Image, image_name: str) -> Optional[str]:
-        """Use pytesseract to OCR the text in the image and return it as a string."""
+        """
+        Use the configured OCR engine to OCR the text in the image (preprocessed if configured) and return it
+        as a string. If --text-detection is set images that probably don't have any text aren't fully OCR'd.
+        """
+        return ImageFile.ocr_result(image, image_name).text
+
+    @staticmethod
+    def ocr_result(image: Image.Image, image_name: str) -> OcrResult:
+        """Same as ocr_text() but also says whether the OCR failed (e.g. a tesseract error or a truncated image)."""
         text = None
+        preprocessing = Config.ocr_preprocessing()
+        engine = ocr_engine(Config.ocr_engine)
 
         try:
-            text = pytesseract.image_to_string(image)
-        except pytesseract.pytesseract.TesseractError as e:
+            has_text = True
+
+            if Config.text_detection is not None:
+                text_detection = detect_text(image, Config.min_edge_density)
+                log.debug(f"'{image_name}' {text_detection.description()}")
+                has_text = text_detection.has_text
+
+            # Images that aren't going to be OCR'd don't need preprocessing
+            if preprocessing is not None and (has_text or Config.text_detection == QUICK):
+                image = preprocess_for_ocr(image, preprocessing)
+
+            if has_text:
+                text = engine.image_to_string(image)
+            elif Config.text_detection == QUICK:
+                text = engine.image_to_string(quick_pass_image(image))
+
+                if quick_pass_found_text(text):
+                    log.debug(f"Quick OCR pass found text in '{image_name}', OCRing it at full resolution...")
+                    text = engine.image_to_string(image)
+            else:
+                log.debug(f"Skipping OCR of '{image_name}'...")
+        except OcrError as e:
             console.print_exception()
             console.print(warning_text(f"Tesseract OCR failure '{image_name}'! No OCR text extracted..."))
+            return OcrResult(None, had_error=True)
         except OSError as e:
             if 'truncated' in str(e):
                 console.print(warning_text(f"Truncated image file '{image_name}'!"))
+                return OcrResult(None, had_error=True)
             else:
                 console.print_exception()
                 console.print(f"Error while extracting '{image_name}'!", style='bright_red')
@@ -154,4 +273,4 @@ class ImageFile(SortableFile):
             console.print(f"Error while extracting '{image_name}'!", style='bright_red')
             raise e
 
-        return None if text is None else text.strip()
+        return OcrResult(None if text is None else text.strip())
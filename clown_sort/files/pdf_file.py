@@ -2,21 +2,43 @@
 Wrapper for PDF files.
 """
 import io
+import re
+import threading
+from importlib.metadata import version
+from math import ceil
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
 
 from pdfalyzer.decorators.pdf_file import PdfFile as PdfalyzerFile
+from pypdf import PdfReader
 
 from clown_sort.config import Config, check_for_pymupdf
-from clown_sort.files.sortable_file import SortableFile
+from clown_sort.files.sortable_file import RuleMatch, SortableFile
+from clown_sort.lib.ocr_engine import PYTESSERACT, ocr_engine
 from clown_sort.lib.page_range import PageRange
+from clown_sort.lib.pdf_page_extractor import ALWAYS, NEVER, PdfPageExtractor, open_pdf
 from clown_sort.util.constants import PDF_ERRORS
+from clown_sort.util.instrumentation import PDF_EXTRACT, instrumentation
 from clown_sort.util.logging import log
-from clown_sort.util.rich_helper import WARNING, console, print_error
+from clown_sort.util.parallel import parallel_map_in_order
+from clown_sort.util.rich_helper import WARNING, console, print_dim_bullet, print_error, warning_text
 
 DEFAULT_PDF_ERRORS_DIR = Path.cwd().joinpath(PDF_ERRORS)
 MAX_DISPLAY_HEIGHT = 600
 SCALE_FACTOR = 0.4
+BATCHES_PER_WORKER = 4  # Smaller batches keep all the workers busy when some pages take much longer (e.g. scans)
+PAGE_COUNT_VARIANT = 'page_count'  # Text extraction cache variant that stores the number of pages
+# pdfalyzer starts the text of each page with a "PAGE N" panel
+PDFALYZER_PAGE_PANEL_REGEX = re.compile('^╭─+╮\\n│ +PAGE (\\d+) +│\\n╰─+╯$', re.MULTILINE)
+# PyMuPDF isn't thread safe and thumbnails can be rendered by the popup prefetch thread and the main thread
+PYMUPDF_LOCK = threading.Lock()
+
+
+class ExtractedPage(NamedTuple):
+    page_number: int
+    text: str
+    had_error: bool = False
+    was_ocrd: Optional[bool] = None  # None if pdfalyzer did the extraction (it doesn't say)
 
 
 class PdfFile(SortableFile):
@@ -24,28 +46,125 @@ class PdfFile(SortableFile):
     Wrapper for PDF files.
 
     Attributes:
-        text_extraction_attempted (bool): Whether text extraction has been attempted.
-        _extracted_text (Optional[str]): The extracted text from the PDF.
+        text_extraction_attempted (bool): Whether the text of the whole document has been extracted.
+        _extracted_text (Optional[str]): The extracted text of the whole document.
+        _page_texts (Dict[int, str]): Text of each page extracted (or read from the cache) so far, keyed by page number.
+        _page_count (Optional[int]): Number of pages in the document (None until it's needed).
         _page_numbers_of_errors (List[int]): List of page numbers where errors occurred during extraction.
+        _sorting_text (Optional[str]): Text of the first few pages when there are limits on how much to extract for sorting.
+        _extracted_page_count (int): Number of pages whose text has been extracted (not read from the cache).
+        _ocr_page_count (Optional[int]): How many of those pages were OCR'd (None if pdfalyzer did the extraction).
         _is_presentable_in_popup (Optional[bool]): `[class variable]` Cached value indicating if the PDF
             can be presented in a popup.
     """
 
     _is_presentable_in_popup = None
 
+    def __init__(self, file_path: Union[str, Path]) -> None:
+        super().__init__(file_path)
+        self._page_texts: Dict[int, str] = {}
+        self._page_count: Optional[int] = None
+        self._page_numbers_of_errors: List[int] = []
+        self._sorting_text: Optional[str] = None
+        self._extracted_page_count = 0
+        self._ocr_page_count: Optional[int] = None
+
     def extracted_text(self, page_range: Optional[PageRange] = None) -> Optional[str]:
-        """Use PyPDF to extract text page by page and use Tesseract to OCR any embedded images."""
-        if self.text_extraction_attempted:
+        """
+        Use PyPDF to extract text page by page and use Tesseract to OCR any embedded images. Each page's text
+        is cached separately so any page range can be put together from the pages that have already been
+        extracted (this run or a previous one) and only the missing pages are extracted.
+        """
+        if page_range is None and self.text_extraction_attempted:
             return self._extracted_text
 
+        with instrumentation.span(PDF_EXTRACT, self.file_path):
+            page_numbers = self._page_numbers(page_range)
+
+            if page_numbers is None:
+                text = None
+            else:
+                self._extract_missing_pages(page_numbers)
+                text = _join_page_texts([self._page_texts[page_number] for page_number in page_numbers])
+
+        self._print_extraction_summary()
+
+        if page_range is None:
+            self._extracted_text = text
+            self.text_extraction_attempted = True
+
+        return text
+
+    def search_text(self) -> str:
+        """If there are limits on how much of a PDF to extract for sorting just enough pages are extracted."""
+        if self.text_extraction_attempted or all(limit is None for limit in Config.pdf_sorting_limits()):
+            return super().search_text()
+        elif self._sorting_text is None:
+            with instrumentation.span(PDF_EXTRACT, self.file_path):
+                self._sorting_text = self._extract_text_for_sorting()
+
+        return self._sorting_text
+
+    def page_texts(self, page_range: Optional[PageRange] = None) -> Iterator[Tuple[int, str]]:
+        """Yield (page number, text) one page at a time so the caller can stop whenever it has enough."""
+        page_numbers = self._page_numbers(page_range) or []
+        self._load_cached_pages(page_numbers)
+        missing_page_numbers = [page_number for page_number in page_numbers if page_number not in self._page_texts]
+        extracted_pages = _extract_pages(self.file_path, missing_page_numbers, Config.print_as_parsed)
+
+        for page_number in page_numbers:
+            # Pages are extracted in order so the next extracted page is this one
+            if page_number not in self._page_texts:
+                extracted_page = next(extracted_pages, None)
+
+                if extracted_page is None:
+                    return
 
-        pdf_file = PdfalyzerFile(self.file_path)
-        self._extracted_text = pdf_file.extract_text(page_range, log, Config.print_as_parsed)
+                self._record_page(extracted_page)
+
+            yield page_number, self._page_texts[page_number]
+
+    def needs_text_extraction(self) -> bool:
+        return not self.text_extraction_attempted and self._sorting_text is None
+
+    def load_cached_text(self) -> bool:
+        """
+        Populate the extracted text if every page is in the text extraction cache. Otherwise the pages that
+        are cached are loaded so only the rest have to be extracted (even if that happens in a worker process).
+        """
+        if self._page_count is None and self._cached_page_count() is None:
+            return False
+
+        page_numbers = self._page_numbers(None) or []
+        self._load_cached_pages(page_numbers)
+
+        if any(page_number not in self._page_texts for page_number in page_numbers):
+            return False
+
+        self._extracted_text = _join_page_texts([self._page_texts[page_number] for page_number in page_numbers])
         self.text_extraction_attempted = True
-        return self._extracted_text
+        return True
+
+    def cache_extracted_text(self, file_hash: Optional[str] = None) -> None:
+        """
+        Write the page count and the text of every page extracted so far (e.g. in a worker process) to the cache.
+        Pages that had errors aren't cached so they are extracted again next time.
+        """
+        if self._page_count is None:
+            return
+
+        self._put_cached_text(str(self._page_count), PAGE_COUNT_VARIANT, file_hash)
+
+        for page_number, text in self._page_texts.items():
+            if page_number not in self._page_numbers_of_errors:
+                self._put_cached_text(text, _page_variant(page_number), file_hash)
 
     def thumbnail_bytes(self) -> Optional[bytes]:
-        """Return bytes for a thumbnail image."""
+        """Return bytes for a thumbnail image. Only one thread at a time can use PyMuPDF."""
+        with PYMUPDF_LOCK:
+            return self._render_thumbnail()
+
+    def _render_thumbnail(self) -> Optional[bytes]:
         import fitz  # TODO: Can we do this without PyMuPDF dependency?
 
         try:
@@ -92,5 +211,256 @@ class PdfFile(SortableFile):
 
         return bool(type(self)._is_presentable_in_popup)
 
+    def _extract_missing_pages(self, page_numbers: List[int]) -> None:
+        """
+        Extract the pages that aren't in _page_texts or the cache. If --pdf-page-jobs is set and there's more
+        than one batch of pages they're extracted in parallel by a pool of workers that's reused for every PDF.
+        """
+        self._load_cached_pages(page_numbers)
+        missing_page_numbers = [page_number for page_number in page_numbers if page_number not in self._page_texts]
+        page_batches = self._page_batches(missing_page_numbers) if Config.pdf_page_jobs > 1 else []
+
+        if len(page_batches) <= 1:
+            extracted_pages = _extract_pages(self.file_path, missing_page_numbers, Config.print_as_parsed)
+        else:
+            log.debug(f"Extracting text from '{self.file_path}' in {len(page_batches)} batches of pages...")
+            batches = [(self.file_path, batch_page_numbers) for batch_page_numbers in page_batches]
+
+            extracted_batches = parallel_map_in_order(_extract_page_batch, batches, Config.pdf_page_jobs, reuse_pool=True)
+
+            # Batches come back in page order so the text can be printed as each one finishes
+            extracted_pages = (extracted_page for extracted_batch in extracted_batches for extracted_page in extracted_batch)
+
+        for extracted_page in extracted_pages:
+            if Config.print_as_parsed and len(page_batches) > 1:
+                print(extracted_page.text)
+
+            self._record_page(extracted_page)
+
+        # Pages that couldn't be extracted at all (e.g. the PDF couldn't be opened) are treated as empty
+        for page_number in page_numbers:
+            if page_number not in self._page_texts:
+                self._page_texts[page_number] = ''
+                self._page_numbers_of_errors.append(page_number)
+
+    def _record_page(self, extracted_page: ExtractedPage) -> None:
+        """Keep the text of a freshly extracted page and write it to the cache unless there was an error."""
+        page_number = extracted_page.page_number
+        self._page_texts[page_number] = extracted_page.text
+        self._extracted_page_count += 1
+
+        if extracted_page.had_error:
+            self._page_numbers_of_errors.append(page_number)
+        else:
+            self._put_cached_text(extracted_page.text, _page_variant(page_number))
+
+        if extracted_page.was_ocrd is not None:
+            self._ocr_page_count = (self._ocr_page_count or 0) + int(extracted_page.was_ocrd)
+
+    def _load_cached_pages(self, page_numbers: List[int]) -> None:
+        """Load whichever of the pages that haven't been loaded yet are in the text extraction cache."""
+        page_numbers = [page_number for page_number in page_numbers if page_number not in self._page_texts]
+
+        if len(page_numbers) == 0 or Config.extraction_cache is None or self._text_extractor_key() is None:
+            return
+
+        variants = [_page_variant(page_number) for page_number in page_numbers]
+        cached = Config.extraction_cache.get_many(self.content_hash(), self._text_extractor_key(), variants)
+
+        if cached:
+            log.debug(f"Using cached text for {len(cached)} of {len(page_numbers)} pages of '{self.file_path}' ({self._text_extractor_key()})")
+
+        for page_number, variant in zip(page_numbers, variants):
+            if variant in cached:
+                self._page_texts[page_number] = cached[variant].text or ''
+
+    def _page_numbers(self, page_range: Optional[PageRange]) -> Optional[List[int]]:
+        """The page numbers in page_range (all the pages if None) clipped to the document. None if it can't be read."""
+        if self._page_count is None and self._cached_page_count() is None:
+            reader = open_pdf(self.file_path)
+
+            if reader is None:
+                return None
+
+            self._page_count = len(reader.pages)
+            self._put_cached_text(str(self._page_count), PAGE_COUNT_VARIANT)
+
+        return list(range(*_page_bounds(page_range, self._page_count)))
+
+    def _cached_page_count(self) -> Optional[int]:
+        """Set _page_count from the text extraction cache if it's there."""
+        cached = self._get_cached_text(PAGE_COUNT_VARIANT)
+
+        if cached is not None and cached.text is not None:
+            self._page_count = int(cached.text)
+
+        return self._page_count
+
+    def _extract_text_for_sorting(self) -> str:
+        """
+        Extract pages until one of the --pdf-max-pages etc. limits is reached. Only the new page is looked at
+        after each page (rules are matched against the filename and that page's text) so the time it takes
+        grows linearly with the number of pages.
+        """
+        page_texts = []
+        char_count = 0
+        folders: Set[str] = set()
+
+        for _page_number, page_text in self.page_texts():
+            page_texts.append(page_text)
+            char_count += len(page_text)
+
+            if Config.pdf_max_pages is not None and len(page_texts) >= Config.pdf_max_pages:
+                break
+            elif Config.pdf_max_chars is not None and char_count >= Config.pdf_max_chars:
+                break
+            elif Config.pdf_stop_after_folders is not None:
+                page_search_text = self._search_text_for(page_text)
+                folders.update(rule_match.folder for rule_match in RuleMatch.get_rule_matches(page_search_text))
+
+                if len(folders) >= Config.pdf_stop_after_folders:
+                    break
+
+        log.debug(f"Extracted {len(page_texts)} pages of '{self.file_path}' for sorting...")
+        self._print_extraction_summary()
+        return self._search_text_for(_join_page_texts(page_texts))
+
+    def _print_extraction_summary(self) -> None:
+        if self._ocr_page_count is not None and self._extracted_page_count > 0:
+            print_dim_bullet(f"OCR'd {self._ocr_page_count} of {self._extracted_page_count} pages")
+
+        if self._page_numbers_of_errors:
+            pages = ', '.join(str(page_number) for page_number in self._page_numbers_of_errors)
+            console.print(warning_text(f"Errors extracting text from page(s) {pages} of '{self.file_path}'"))
+
+    def _page_batches(self, page_numbers: List[int]) -> List[List[int]]:
+        """Split page_numbers into a few batches per worker process."""
+        batch_size = max(1, ceil(len(page_numbers) / (Config.pdf_page_jobs * BATCHES_PER_WORKER)))
+        return [page_numbers[i:i + batch_size] for i in range(0, len(page_numbers), batch_size)]
+
+    def _text_extractor_key(self) -> Optional[str]:
+        if Config.pdf_ocr == ALWAYS:
+            # pdfalyzer always does its own OCR with pytesseract regardless of the configured OCR engine
+            ocr_cache_key = ocr_engine(PYTESSERACT).cache_key()
+            return None if ocr_cache_key is None else f"pdfalyzer {version('pdfalyzer')} {ocr_cache_key}"
+
+        extractor_key = f"pypdf {version('pypdf')} pdf_ocr={Config.pdf_ocr}"
+
+        if Config.pdf_ocr == NEVER:
+            return extractor_key
+
+        ocr_cache_key = ocr_engine(Config.ocr_engine).cache_key()
+        return None if ocr_cache_key is None else f"{extractor_key} min_density={Config.pdf_ocr_min_density} {ocr_cache_key}"
+
     def __repr__(self) -> str:
         return f"PdfFile('{self.file_path}')"
+
+
+def _join_page_texts(page_texts: List[Optional[str]]) -> str:
+    """Join the text of pages the same way pdfalyzer does when extracting the whole document."""
+    # pdfalyzer ends each page's text with a newline and puts a blank line between pages
+    return "\n\n\n".join(text for text in page_texts if text).strip()
+
+
+def _page_bounds(page_range: Optional[PageRange], page_count: int) -> Tuple[int, int]:
+    """First page number and one past the last page number of page_range clipped to the document."""
+    first_page, last_page = (1, page_count + 1) if page_range is None else page_range.to_tuple()
+    return max(first_page, 1), min(last_page, page_count + 1)
+
+
+def _page_variant(page_number: int) -> str:
+    """Text extraction cache variant for a single page."""
+    return f"page:{page_number}"
+
+
+def _extract_pages(file_path: Path, page_numbers: List[int], print_as_parsed: bool) -> Iterator[ExtractedPage]:
+    """Extract the text of each page in page_numbers, one at a time, in order."""
+    if len(page_numbers) == 0:
+        return
+
+    if Config.pdf_ocr == ALWAYS:
+        yield from _extract_pages_with_pdfalyzer(file_path, page_numbers, print_as_parsed)
+        return
+
+    reader = open_pdf(file_path)
+
+    if reader is None:
+        return
+
+    page_extractor = _page_extractor(reader)
+
+    for page_number in page_numbers:
+        ocr_page_count = page_extractor.ocr_page_count
+        text = page_extractor.page_text(page_number)
+
+        if print_as_parsed:
+            print(text)
+
+        had_error = page_number in page_extractor.page_numbers_of_errors
+        yield ExtractedPage(page_number, text, had_error, page_extractor.ocr_page_count > ocr_page_count)
+
+
+def _extract_pages_with_pdfalyzer(file_path: Path, page_numbers: List[int], print_as_parsed: bool) -> Iterator[ExtractedPage]:
+    """
+    pdfalyzer opens the PDF and walks all of its pages every time it's called so each call extracts a chunk
+    of consecutive pages (see _page_chunks()) whose text is then split back up into pages. If it can't be
+    split (e.g. a newer pdfalyzer draws the "PAGE N" panels differently) the chunk's pages are extracted one
+    at a time instead. pdfalyzer reports its own extraction errors.
+    """
+    pdfalyzer_file = PdfalyzerFile(file_path)
+
+    for chunk in _page_chunks(page_numbers):
+        text = _pdfalyzer_text(pdfalyzer_file, chunk, print_as_parsed)
+        page_texts = {chunk[0]: text} if len(chunk) == 1 else _split_pdfalyzer_pages(text)
+
+        if list(page_texts.keys()) != chunk:
+            msg = f"Can't split pdfalyzer's text of pages {chunk[0]}-{chunk[-1]} of '{file_path}' into pages"
+            log.warning(f"{msg}, extracting them one at a time...")
+            page_texts = {page_number: _pdfalyzer_text(pdfalyzer_file, [page_number], False) for page_number in chunk}
+
+        for page_number in chunk:
+            yield ExtractedPage(page_number, page_texts[page_number])
+
+
+def _pdfalyzer_text(pdfalyzer_file: PdfalyzerFile, page_numbers: List[int], print_as_parsed: bool) -> str:
+    """Text pdfalyzer extracts from the consecutive pages in page_numbers."""
+    page_range = PageRange(f"{page_numbers[0]}-{page_numbers[-1] + 1}")
+    return (pdfalyzer_file.extract_text(page_range, log, print_as_parsed) or '').strip()
+
+
+def _page_chunks(page_numbers: List[int]) -> Iterator[List[int]]:
+    """
+    Consecutive page numbers in chunks that double in size (1, 2, 4, ... pages) so a document is extracted
+    in O(log N) calls to pdfalyzer but a caller that stops after the first few pages (e.g. because of
+    --pdf-stop-after-folders) doesn't have to wait for the whole document.
+    """
+    chunk: List[int] = []
+    max_chunk_size = 1
+
+    for page_number in page_numbers:
+        if chunk and (page_number != chunk[-1] + 1 or len(chunk) >= max_chunk_size):
+            yield chunk
+            chunk = []
+            max_chunk_size *= 2
+
+        chunk.append(page_number)
+
+    if chunk:
+        yield chunk
+
+
+def _split_pdfalyzer_pages(text: str) -> Dict[int, str]:
+    """Split the text pdfalyzer extracted from several pages into the text it would have returned for each page."""
+    panels = list(PDFALYZER_PAGE_PANEL_REGEX.finditer(text))
+    page_ends = [panel.start() for panel in panels[1:]] + [len(text)]
+    return {int(panel.group(1)): text[panel.start():end].strip() for panel, end in zip(panels, page_ends)}
+
+
+def _page_extractor(reader: PdfReader) -> PdfPageExtractor:
+    return PdfPageExtractor(reader, ocr_engine(Config.ocr_engine), Config.pdf_ocr, Config.pdf_ocr_min_density)
+
+
+def _extract_page_batch(batch: Tuple[Path, List[int]]) -> List[ExtractedPage]:
+    """Runs in a worker process. The parent prints the text so it comes out in page order."""
+    file_path, page_numbers = batch
+    return list(_extract_pages(file_path, page_numbers, False))
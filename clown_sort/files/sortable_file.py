@@ -4,13 +4,11 @@ Base class for sortable files of any type.
 import re
 import platform
 import shutil
-from glob import glob
 from os import path, remove
 from pathlib import Path
 from subprocess import run
-from typing import List, Optional, Union
+from typing import Callable, Iterator, List, Optional, Union
 
-from exiftool import ExifToolHelper
 from rich.console import Console, ConsoleOptions, RenderResult
 from rich.panel import Panel
 from rich.prompt import Confirm
@@ -19,9 +17,13 @@ from unidecode import unidecode
 
 from clown_sort.config import Config
 from clown_sort.filename_extractor import FilenameExtractor
+from clown_sort.lib.exiftool_session import exiftool_session
+from clown_sort.lib.extraction_cache import CachedText
 from clown_sort.lib.rule_match import RuleMatch
-from clown_sort.sort_selector import process_file_with_popup
-from clown_sort.util.filesystem_helper import copy_file_creation_time, loggable_filename
+from clown_sort.sort_selector import PopupData, process_file_with_popup
+from clown_sort.util.filesystem_helper import (COPY, HARDLINK, REFLINK, SYMLINK, break_link,
+     copy_file_creation_time, file_content_hash, link_file, loggable_filename, walk_files)
+from clown_sort.util.instrumentation import COPY_FILE, LINK_FILE, MOVE_FILE, RULE_MATCH, SORT_FILE, instrumentation
 from clown_sort.util.logging import log
 from clown_sort.util.rich_helper import (bullet_text, comma_join, console,
      copying_file_log_message, indented_bullet, mild_warning, moving_file_log_message,
@@ -29,6 +31,7 @@ from clown_sort.util.rich_helper import (bullet_text, comma_join, console,
 
 MAX_EXTRACTION_LENGTH = 4096
 NOT_MOVING_FILE = "Not moving file to processed dir because it's"
+LINK_MODE_VERBS = {COPY: 'Copying', HARDLINK: 'Hardlinking', REFLINK: 'Reflinking', SYMLINK: 'Symlinking'}
 NO_SORT_FOLDERS_MSG = bullet_text('No sort folders matched so copying to base sorted dir...', style='color(209)')
 
 
@@ -39,17 +42,32 @@ class SortableFile:
         self.basename_without_ext: str = str(Path(self.basename).with_suffix(''))
         self.extname: str = self.file_path.suffix
         self.text_extraction_attempted: bool = False
+        self.near_duplicate_of: Optional[Path] = None
+        self.popup_data: Optional[PopupData] = None  # Prepared ahead of time for manual sorting (see PopupPrefetcher)
 
+        self._content_hash: Optional[str] = None
         self._extracted_text: Optional[str] = None
+        self._text_is_borrowed: bool = False
+        self._text_extraction_failed: bool = False  # Failures may be transient (e.g. OCR errors) so they aren't cached
         self._new_basename: Optional[str] = None
         self._filename_extractor: Optional[FilenameExtractor] = None
         self._paths_of_sorted_copies: List[Path] = []
 
     def sort_file(self) -> None:
         """Sort the file to destination_dir subdir based on the filename and any extracted text."""
+        try:
+            with instrumentation.span(SORT_FILE, self.file_path):
+                self._sort_file()
+        finally:
+            self.release_resources()
+
+    def _sort_file(self) -> None:
         console.print(self)
-        search_text = unidecode(self.basename_without_ext + ' ' + (self.extracted_text() or ''))
-        rule_matches = RuleMatch.get_rule_matches(search_text)
+        search_text = self.search_text()
+
+        with instrumentation.span(RULE_MATCH, self.file_path):
+            rule_matches = RuleMatch.get_rule_matches(search_text)
+
         sort_folders = [rm.folder for rm in rule_matches]
 
         # Handle the case where there are no matches to any configured folders.
@@ -104,10 +122,20 @@ class SortableFile:
                 if not SortableFile.confirm_file_overwrite(destination_path):
                     continue
 
+            # Write the first copy, then link the others to it (unless --link-mode is 'copy')
+            if len(self._paths_of_sorted_copies) == 0 or Config.link_mode == COPY:
+                with instrumentation.span(COPY_FILE, self.file_path):
+                    self.copy_file_to_sorted_dir(destination_path, match)
+            else:
+                with instrumentation.span(LINK_FILE, self.file_path):
+                    self.link_file_to_sorted_dir(self._paths_of_sorted_copies[0], destination_path, match)
+
             self._paths_of_sorted_copies.append(destination_path)
-            self.copy_file_to_sorted_dir(destination_path, match)
 
-        self.move_to_processed_dir()
+        self._record_sorted_copies()
+
+        with instrumentation.span(MOVE_FILE, self.file_path):
+            self.move_to_processed_dir()
 
     def move_to_processed_dir(self) -> None:
         """Finalize the file handling, either leaving, deleting, or moving to processed files dir."""
@@ -119,6 +147,9 @@ class SortableFile:
         if self.file_path in self._paths_of_sorted_copies:
             console.print(bullet_text(Text('Not moving original file to processed dir...', style='color(127)')))
             return
+        elif Config.symlink_targets and self.file_path.resolve() in Config.symlink_targets:
+            console.print(bullet_text(Text('Not moving file other sorted files link to...', style='color(127)')))
+            return
 
         if Config.delete_originals:
             self._delete_original()
@@ -126,6 +157,19 @@ class SortableFile:
 
         self._move_to_processed_dir()
 
+    def search_text(self) -> str:
+        """The text that sort rules are matched against."""
+        return self._search_text_for(self.extracted_text())
+
+    def record_in_sorted_manifest(self) -> None:
+        """Record that this file (which is in the sorted dir) has been evaluated against the current sort rules."""
+        if Config.sorted_manifest is not None and not Config.dry_run and self.file_path.exists():
+            Config.sorted_manifest.record(self.file_path, Config.rule_set, self.content_hash())
+
+    def release_resources(self) -> None:
+        """Free anything (decoded images etc.) held for this file once it's been handled. Overridden in subclasses."""
+        pass
+
     def new_basename(self) -> str:
         """Basename to rename this file to. Overridden in ImageFile for images with OCR text."""
         return self.basename
@@ -136,12 +180,7 @@ class SortableFile:
 
     def exif_dict(self) -> dict:
         """Return the EXIF data as a dict."""
-        try:
-            with ExifToolHelper() as exiftool:
-                return exiftool.get_metadata(self.file_path)[0]
-        except:
-            log.warning("ExifTool not found; EXIF data ignored. 'brew install exiftool' may solve this.")
-            return {}
+        return exiftool_session.metadata(self.file_path)
 
     def copy_file_to_sorted_dir(self, destination_path: Path, match: Optional[re.Match] = None):
         """Move or copy the file to destination_subdir."""
@@ -154,9 +193,21 @@ class SortableFile:
         if Config.dry_run:
             console.print(indented_bullet("Dry run so not actually copying...", style='dim'))
         else:
+            break_link(destination_path)
             shutil.copy2(self.file_path, destination_path)
             copy_file_creation_time(self.file_path, destination_path)
 
+    def link_file_to_sorted_dir(self, sorted_copy: Path, destination_path: Path, match: Optional[re.Match] = None):
+        """Link destination_path to a copy of this file already written to the sorted dir (per --link-mode)."""
+        self._log_copy_file(destination_path, match, LINK_MODE_VERBS[Config.link_mode])
+
+        if Config.dry_run:
+            console.print(indented_bullet("Dry run so not actually linking...", style='dim'))
+            return
+
+        if link_file(sorted_copy, destination_path, Config.link_mode) in [COPY, REFLINK]:
+            copy_file_creation_time(self.file_path, destination_path)
+
     def sort_destination_path(self, subdir: Optional[Union[Path, str]] = None) -> Path:
         """Get the destination folder."""
         destination_path = Config.sorted_screenshots_dir
@@ -189,6 +240,114 @@ class SortableFile:
         """Returns file size in bytes."""
         return self.file_path.stat().st_size
 
+    def content_hash(self) -> str:
+        """SHA256 of the file's contents."""
+        if self._content_hash is None:
+            self._content_hash = file_content_hash(self.file_path)
+
+        return self._content_hash
+
+    def needs_text_extraction(self) -> bool:
+        """True if extracted_text() still has expensive work (OCR etc.) to do. Overridden in subclasses."""
+        return False
+
+    def load_cached_text(self) -> bool:
+        """Populate the extracted text from the text extraction cache. Returns True if it was there."""
+        cached = self._get_cached_text()
+
+        if cached is None:
+            return False
+
+        self._extracted_text = cached.text
+        self.text_extraction_attempted = True
+        return True
+
+    def borrow_extracted_text(self, text: str) -> None:
+        """Use text extracted from another file (e.g. a near duplicate) instead of extracting it from this one."""
+        self._extracted_text = text
+        self._text_is_borrowed = True
+        self.text_extraction_attempted = True
+
+    def cache_extracted_text(self, file_hash: Optional[str] = None) -> None:
+        """
+        Write text that was extracted somewhere else (e.g. a worker process) to the cache. If file_hash is
+        provided the text is cached for that file (e.g. a copy of this one) instead of this one.
+        Borrowed text isn't cached because it wasn't actually extracted from this file.
+        """
+        if self._text_is_borrowed or self._text_extraction_failed or not self.text_extraction_attempted:
+            return
+
+        self._put_cached_text(self._extracted_text, file_hash=file_hash)
+
+    def _text_extractor_key(self) -> Optional[str]:
+        """
+        Identifies the engine, version, and settings used to extract text for the text extraction cache.
+        None means the text can't be cached. Overridden in subclasses.
+        """
+        return None
+
+    def _search_text_for(self, text: Optional[str]) -> str:
+        return unidecode(self.basename_without_ext + ' ' + (text or ''))
+
+    def _get_cached_text(self, variant: str = '') -> Optional[CachedText]:
+        if Config.extraction_cache is None or self._text_extractor_key() is None:
+            return None
+
+        cached = Config.extraction_cache.get(self.content_hash(), self._text_extractor_key(), variant)
+
+        if cached is not None:
+            log.debug(f"Using cached text for '{self.file_path}' ({self._text_extractor_key()} {variant})")
+
+        return cached
+
+    def _cached_text_extraction(self, extract: Callable[[], Optional[str]], variant: str = '') -> Optional[str]:
+        """
+        Return the result of extract() from the text extraction cache or call it and cache the result.
+        extract() sets _text_extraction_failed if it failed, in which case the result isn't cached.
+        """
+        cached = self._get_cached_text(variant)
+
+        if cached is not None:
+            return cached.text
+
+        text = extract()
+
+        if not self._text_extraction_failed:
+            self._put_cached_text(text, variant)
+
+        return text
+
+    def _put_cached_text(self, text: Optional[str], variant: str = '', file_hash: Optional[str] = None) -> None:
+        """Write text to the text extraction cache (if there is one) for this file or for file_hash if provided."""
+        if Config.extraction_cache is not None and self._text_extractor_key() is not None:
+            Config.extraction_cache.put(file_hash or self.content_hash(), self._text_extractor_key(), text, variant)
+
+    def _record_sorted_copies(self) -> None:
+        """
+        The copies just written to the sorted dir don't need to be evaluated again by --rescan-sorted until the
+        rules change. Their text is cached too in case their contents differ from the original's (EXIF etc.).
+        Every copy has the same contents (they're written from the same file and text, or linked to the first
+        one) so only the first one is hashed.
+        """
+        if Config.sorted_manifest is None or Config.dry_run:
+            return
+
+        copy_hash: Optional[str] = None
+
+        for copy_path in self._paths_of_sorted_copies:
+            if not copy_path.exists():
+                continue
+
+            if copy_hash is None:
+                copy_hash = self._sorted_copy_hash(copy_path)
+                self.cache_extracted_text(copy_hash)
+
+            Config.sorted_manifest.record(copy_path, Config.rule_set, copy_hash)
+
+    def _sorted_copy_hash(self, copy_path: Path) -> str:
+        """Content hash of a copy written by copy_file_to_sorted_dir(). Overridden in subclasses that modify it."""
+        return self.content_hash()
+
     def _extracted_str(self, max_chars: Optional[int] = None) -> str:
         """Raw string version of extracted text but truncated to max_chars if provided."""
         txt = self.extracted_text()
@@ -210,13 +369,13 @@ class SortableFile:
         filename = loggable_filename(self.file_path, Config)
         return Panel(filename, expand=False, style='bright_white reverse')
 
-    def _log_copy_file(self, destination_path: Path, match: Optional[re.Match] = None) -> None:
+    def _log_copy_file(self, destination_path: Path, match: Optional[re.Match] = None, verb: str = 'Copying') -> None:
         """Log info about a file copy."""
         if Config.debug:
-            console.print(copying_file_log_message(self.basename, destination_path))
+            console.print(copying_file_log_message(self.basename, destination_path, verb))
             return
 
-        log_msg = Text('').append('Copying to ', style='dim')
+        log_msg = Text('').append(f"{verb} to ", style='dim')
 
         if destination_path.parent == Config.destination_dir:
             console.print(indented_bullet(log_msg.append('root sorted dir...')))
@@ -295,15 +454,9 @@ class SortableFile:
             yield f"   {self.exif_dict()}\n\n"
 
     @classmethod
-    def all_sorted_files(cls) -> List[Path]:
-        """Return all the files in the sorted directory."""
-        file_paths = []
-
-        for pattern in ['*', '**/*']:
-            glob_pattern = Config.sorted_screenshots_dir.joinpath(pattern)
-            file_paths.extend(glob(str(glob_pattern)))
-
-        return [Path(f) for f in file_paths]
+    def all_sorted_files(cls) -> Iterator[Path]:
+        """Yield all the files in the sorted directory as they're found."""
+        return walk_files(Config.sorted_screenshots_dir)
 
     @staticmethod
     def confirm_file_overwrite(file_path: Path) -> bool:
@@ -0,0 +1,89 @@
+"""
+Bounded LRU cache of decoded Pillow images so each image is read from disk and decoded once per run
+no matter how many times its pixels / EXIF are needed. Images are fully loaded and their file
+handles closed as soon as they're decoded so they don't pile up open file descriptors.
+"""
+import threading
+from collections import OrderedDict
+from os import stat_result
+from pathlib import Path
+from typing import Tuple
+
+from PIL import Image
+
+from clown_sort.util.instrumentation import DECODE, instrumentation
+from clown_sort.util.logging import log
+
+DEFAULT_MAX_DECODED_IMAGES = 8
+
+
+class DecodedImageCache:
+    def __init__(self, max_images: int = DEFAULT_MAX_DECODED_IMAGES) -> None:
+        self.max_images = max_images
+        self.decode_count = 0
+        self._lock = threading.Lock()
+        self._images: OrderedDict[Path, Tuple[Tuple[int, int], Image.Image]] = OrderedDict()
+
+    def get(self, file_path: Path) -> Image.Image:
+        """
+        Returns the decoded image, decoding it if it's not cached or the file changed since it was cached.
+        Callers share the returned object so they must copy() it before doing anything that modifies it.
+        """
+        file_path = Path(file_path)
+        file_version = _file_version(file_path.stat())
+
+        with self._lock:
+            cached = self._images.get(file_path)
+
+            if cached is not None and cached[0] == file_version:
+                self._images.move_to_end(file_path)
+                return cached[1]
+
+        image = decode_image(file_path)
+
+        with self._lock:
+            self.decode_count += 1
+            self._images[file_path] = (file_version, image)
+            self._images.move_to_end(file_path)
+
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+
+        return image
+
+    def release(self, file_path: Path) -> None:
+        """Drop the decoded image (if any) when the caller knows it won't be needed again."""
+        with self._lock:
+            self._images.pop(Path(file_path), None)
+
+    def cached_bytes(self, file_path: Path) -> int:
+        """Approximate memory used by the decoded image (0 if it isn't cached)."""
+        with self._lock:
+            cached = self._images.get(Path(file_path))
+
+        if cached is None:
+            return 0
+
+        image = cached[1]
+        return image.size[0] * image.size[1] * len(image.getbands())
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+
+def decode_image(file_path: Path) -> Image.Image:
+    """Read and decode the image then close the file."""
+    log.debug(f"Decoding '{file_path}'...")
+
+    with instrumentation.span(DECODE, file_path), Image.open(file_path) as image:
+        image.load()
+        image.getexif()  # TIFF EXIF is read lazily from the open file so it has to happen now
+
+    return image
+
+
+def _file_version(file_stat: stat_result) -> Tuple[int, int]:
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+
+decoded_images = DecodedImageCache()
@@ -0,0 +1,164 @@
+"""
+Watch a directory for new files and report them once they've stopped changing. Uses inotify on
+Linux and falls back to polling the directory everywhere else.
+
+inotify: https://man7.org/linux/man-pages/man7/inotify.7.html
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+from clown_sort.util.logging import log
+
+SETTLE_SECONDS = 1.0    # A file must go this long without changing before it's considered complete
+POLL_SECONDS = 2.0      # How often the polling watcher lists the directory
+TIMEOUT_SECONDS = 0.5   # Max time settled_files() blocks waiting for something to happen
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+INOTIFY_BUFFER_BYTES = 64 * 1024
+
+
+class DirectoryWatcher(ABC):
+    """Base class. Subclasses implement _changed_paths() to report files that may have been written."""
+
+    def __init__(self, dir: Path, settle_seconds: float = SETTLE_SECONDS) -> None:
+        self.dir = Path(dir)
+        self.settle_seconds = settle_seconds
+        self._pending: Dict[Path, Tuple[Tuple[int, int], float]] = {}  # path -> ((size, mtime), unchanged since)
+
+    def settled_files(self, timeout: float = TIMEOUT_SECONDS) -> List[Path]:
+        """Wait up to 'timeout' seconds then return the new files that have stopped changing."""
+        now = time.monotonic()
+        wait_seconds = timeout if len(self._pending) == 0 else min(timeout, self.settle_seconds / 2)
+
+        for file_path in self._changed_paths(wait_seconds):
+            self._pending[file_path] = ((-1, -1), now)
+
+        return self._pop_settled_files()
+
+    def close(self) -> None:
+        pass
+
+    @abstractmethod
+    def _changed_paths(self, timeout: float) -> Set[Path]:
+        """Wait up to 'timeout' seconds and return the paths of any files that were created or written to."""
+
+    def _pop_settled_files(self) -> List[Path]:
+        now = time.monotonic()
+        settled_files = []
+
+        for file_path, (file_version, unchanged_since) in list(self._pending.items()):
+            try:
+                file_stat = file_path.stat()
+            except FileNotFoundError:
+                del self._pending[file_path]  # Moved or deleted before it settled
+                continue
+
+            current_version = (file_stat.st_size, file_stat.st_mtime_ns)
+
+            if current_version != file_version:
+                self._pending[file_path] = (current_version, now)
+            elif now - unchanged_since >= self.settle_seconds:
+                del self._pending[file_path]
+                settled_files.append(file_path)
+
+        return sorted(settled_files)
+
+
+class InotifyWatcher(DirectoryWatcher):
+    def __init__(self, dir: Path, settle_seconds: float = SETTLE_SECONDS) -> None:
+        super().__init__(dir, settle_seconds)
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+        if self._fd < 0:
+            self._raise_os_error()
+
+        mask = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO
+
+        if self._libc.inotify_add_watch(self._fd, os.fsencode(self.dir), mask) < 0:
+            os.close(self._fd)
+            self._raise_os_error()
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+    def _changed_paths(self, timeout: float) -> Set[Path]:
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return set()
+
+        buffer = os.read(self._fd, INOTIFY_BUFFER_BYTES)
+        changed_paths = set()
+        offset = 0
+
+        while offset < len(buffer):
+            _wd, mask, _cookie, name_length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            name = buffer[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+
+            if mask & IN_Q_OVERFLOW:
+                log.warning(f"Too many changes in '{self.dir}' at once, some files may have been missed...")
+            elif name:
+                changed_paths.add(self.dir.joinpath(os.fsdecode(name)))
+
+        return changed_paths
+
+    def _raise_os_error(self) -> None:
+        error_number = ctypes.get_errno()
+        raise OSError(error_number, os.strerror(error_number), str(self.dir))
+
+
+class PollingWatcher(DirectoryWatcher):
+    def __init__(self, dir: Path, settle_seconds: float = SETTLE_SECONDS, poll_seconds: float = POLL_SECONDS) -> None:
+        super().__init__(dir, settle_seconds)
+        self.poll_seconds = poll_seconds
+        self._last_listing = self._list_dir()
+        self._last_poll_at = time.monotonic()
+
+    def _changed_paths(self, timeout: float) -> Set[Path]:
+        time.sleep(min(timeout, max(0, self._last_poll_at + self.poll_seconds - time.monotonic())))
+
+        if time.monotonic() - self._last_poll_at < self.poll_seconds:
+            return set()
+
+        listing = self._list_dir()
+        changed_paths = {file_path for file_path, version in listing.items() if self._last_listing.get(file_path) != version}
+        self._last_listing = listing
+        self._last_poll_at = time.monotonic()
+        return changed_paths
+
+    def _list_dir(self) -> Dict[Path, Tuple[int, int]]:
+        listing = {}
+
+        with os.scandir(self.dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    entry_stat = entry.stat()
+                    listing[Path(entry.path)] = (entry_stat.st_size, entry_stat.st_mtime_ns)
+
+        return listing
+
+
+def directory_watcher(dir: Path, settle_seconds: float = SETTLE_SECONDS) -> DirectoryWatcher:
+    """inotify if it's available, otherwise polling."""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(dir, settle_seconds)
+        except (AttributeError, OSError) as e:
+            log.warning(f"Can't use inotify to watch '{dir}' ({e}), polling instead...")
+
+    return PollingWatcher(dir, settle_seconds)
@@ -0,0 +1,176 @@
+"""
+Find files with identical contents. Files are grouped by size, then the groups that still have more
+than one member are narrowed down by hashing the first and last blocks of each file, and only the
+files that still collide are read in full. Files that are already hardlinks of each other are
+treated as a single file. Files that have changed since they were found aren't collapsed into hardlinks.
+"""
+import hashlib
+import mmap
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+from clown_sort.util.logging import log
+
+PARTIAL_HASH_BYTES = 64 * 1024  # Size of the blocks at the start and end of the file that are hashed first
+HASH_THREADS = 8                # hashlib releases the GIL while hashing so threads read and hash in parallel
+
+FileId = Tuple[int, int]  # (st_dev, st_ino)
+
+
+class DuplicateGroup(NamedTuple):
+    size: int
+    paths: List[Path]  # Every path with these contents (including paths that are already hardlinked together)
+    file_ids: List[FileId]  # The distinct files among 'paths'
+    mtimes_ns: Dict[FileId, int]  # st_mtime_ns of each file when it was found
+
+    @property
+    def wasted_bytes(self) -> int:
+        return self.size * (len(self.file_ids) - 1)
+
+
+def find_duplicates(
+        file_paths: Iterable[Path],
+        threads: int = HASH_THREADS,
+        partial_hash_bytes: int = PARTIAL_HASH_BYTES
+) -> List[DuplicateGroup]:
+    """Groups of paths with identical non-empty contents, biggest waste of space first."""
+    paths_by_file_id: Dict[FileId, List[Path]] = defaultdict(list)
+    file_ids_by_size: Dict[int, List[FileId]] = defaultdict(list)
+    mtimes_ns: Dict[FileId, int] = {}
+
+    for file_path in file_paths:
+        try:
+            file_stat = os.stat(file_path)
+        except OSError as e:
+            log.warning(f"Can't stat '{file_path}' ({e.strerror}), skipping...")
+            continue
+
+        if file_stat.st_size == 0:
+            continue
+
+        file_id = _stat_file_id(file_stat)
+
+        if file_id not in paths_by_file_id:
+            file_ids_by_size[file_stat.st_size].append(file_id)
+            mtimes_ns[file_id] = file_stat.st_mtime_ns
+
+        paths_by_file_id[file_id].append(Path(file_path))
+
+    candidates = [(size, file_ids) for size, file_ids in file_ids_by_size.items() if len(file_ids) > 1]
+    log.debug(f"{sum(len(ids) for _size, ids in candidates)} files in {len(candidates)} groups share a size...")
+    duplicate_groups = []
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        def split_by_hash(groups: List[Tuple[int, List[FileId]]], hasher: Callable[[Path, int], Hashable]) -> List[Tuple[int, List[FileId]]]:
+            """Hash one path of every file in the groups, returning the sub groups that still collide."""
+            jobs = [(size, file_id) for size, file_ids in groups for file_id in file_ids]
+            digests = executor.map(lambda job: _safe_hash(hasher, paths_by_file_id[job[1]][0], job[0]), jobs)
+            file_ids_by_digest: Dict[Tuple[int, Hashable], List[FileId]] = defaultdict(list)
+
+            for (size, file_id), digest in zip(jobs, digests):
+                if digest is not None:
+                    file_ids_by_digest[(size, digest)].append(file_id)
+
+            return [(size, file_ids) for (size, _digest), file_ids in file_ids_by_digest.items() if len(file_ids) > 1]
+
+        candidates = split_by_hash(candidates, lambda file_path, size: partial_hash(file_path, size, partial_hash_bytes))
+        log.debug(f"{sum(len(ids) for _size, ids in candidates)} files in {len(candidates)} groups share a partial hash...")
+
+        # Files small enough to have been hashed in full by the partial hash don't need hashing again
+        small_groups = [group for group in candidates if group[0] <= 2 * partial_hash_bytes]
+        large_groups = [group for group in candidates if group[0] > 2 * partial_hash_bytes]
+        candidates = small_groups + split_by_hash(large_groups, lambda file_path, _size: full_hash(file_path))
+
+    for size, file_ids in candidates:
+        paths = sorted(path for file_id in file_ids for path in paths_by_file_id[file_id])
+        duplicate_groups.append(DuplicateGroup(size, paths, file_ids, {file_id: mtimes_ns[file_id] for file_id in file_ids}))
+
+    return sorted(duplicate_groups, key=lambda group: (-group.wasted_bytes, group.paths[0]))
+
+
+def partial_hash(file_path: Path, size: int, block_bytes: int = PARTIAL_HASH_BYTES) -> bytes:
+    """Hash of the first and last block_bytes of the file (the whole file if it's smaller than two blocks)."""
+    with open(file_path, 'rb') as file:
+        if size <= 2 * block_bytes:
+            return hashlib.blake2b(file.read()).digest()
+
+        digest = hashlib.blake2b(file.read(block_bytes))
+        file.seek(-block_bytes, os.SEEK_END)
+        digest.update(file.read(block_bytes))
+        return digest.digest()
+
+
+def full_hash(file_path: Path) -> bytes:
+    """Hash of the whole file read through a memory map so the kernel handles readahead and there are no copies."""
+    with open(file_path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            return hashlib.blake2b(mapped_file).digest()
+
+
+def collapse_into_hardlinks(group: DuplicateGroup) -> int:
+    """
+    Replace every file in the group with a hardlink to the first path's file. Each replacement is
+    atomic (link to a temp name then rename over the duplicate). Files that disappeared or whose size or
+    mtime changed since find_duplicates() stat'ed them are left alone. Returns the number of bytes freed.
+    """
+    keep_path = group.paths[0]
+    keep_stat = _unchanged_stat(group, keep_path)
+    bytes_freed = 0
+
+    if keep_stat is None:
+        return 0
+
+    for duplicate_path in group.paths[1:]:
+        if duplicate_path.is_symlink():
+            continue
+
+        duplicate_stat = _unchanged_stat(group, duplicate_path)
+
+        if duplicate_stat is None or _stat_file_id(duplicate_stat) == _stat_file_id(keep_stat):
+            continue
+
+        tmp_path = duplicate_path.with_name(f".{duplicate_path.name}.clown_sort_link")
+
+        try:
+            os.link(keep_path, tmp_path)
+            os.replace(tmp_path, duplicate_path)
+        except OSError as e:
+            log.warning(f"Couldn't hardlink '{duplicate_path}' to '{keep_path}' ({e.strerror}), leaving it...")
+            tmp_path.unlink(missing_ok=True)
+            continue
+
+        if duplicate_stat.st_nlink == 1:
+            bytes_freed += group.size
+
+    return bytes_freed
+
+
+def _safe_hash(hasher: Callable[[Path, int], Hashable], file_path: Path, size: int) -> Hashable:
+    """Files that disappear or can't be read are left out of the results."""
+    try:
+        return hasher(file_path, size)
+    except (OSError, ValueError) as e:
+        log.warning(f"Can't read '{file_path}' ({e}), skipping...")
+        return None
+
+
+def _unchanged_stat(group: DuplicateGroup, file_path: Path) -> Optional[os.stat_result]:
+    """The file's stat if it's still the same file with the same size and mtime as when it was found, otherwise None."""
+    try:
+        file_stat = os.stat(file_path)
+    except OSError as e:
+        log.warning(f"Can't stat '{file_path}' ({e.strerror}), skipping...")
+        return None
+
+    if file_stat.st_size != group.size or group.mtimes_ns.get(_stat_file_id(file_stat)) != file_stat.st_mtime_ns:
+        log.warning(f"'{file_path}' changed since it was hashed, skipping...")
+        return None
+
+    return file_stat
+
+
+def _stat_file_id(file_stat: os.stat_result) -> FileId:
+    return (file_stat.st_dev, file_stat.st_ino)
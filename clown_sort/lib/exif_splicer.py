@@ -0,0 +1,180 @@
+"""
+Copy a JPEG or PNG while replacing its EXIF block without decoding or re-encoding the pixels.
+JPEG: the EXIF lives in an APP1 segment that must come right after SOI (or after the JFIF APP0).
+PNG: the EXIF lives in an eXIf chunk that must come before the first IDAT chunk (and there can only be one).
+
+JPEG structure: https://en.wikipedia.org/wiki/JPEG#Syntax_and_structure
+PNG eXIf chunk: https://www.w3.org/TR/png/#eXIf
+"""
+import shutil
+import struct
+import zlib
+from os import replace
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import BinaryIO, Callable, Optional
+
+from PIL import Image
+
+from clown_sort.util.logging import log
+
+EXIF_HEADER = b'Exif\x00\x00'
+JPEG_SOI = b'\xff\xd8'
+JPEG_APP0 = 0xE0
+JPEG_APP1 = 0xE1
+JPEG_SOS = 0xDA
+JPEG_MAX_SEGMENT_BYTES = 65533  # The 2 byte length field includes itself
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class UnsupportedImageError(Exception):
+    """The file isn't a JPEG / PNG or isn't structured the way we expect."""
+
+
+def copy_with_exif(source_path: Path, destination_path: Path, exif: Image.Exif) -> bool:
+    """
+    Copy source_path to destination_path with its EXIF replaced by exif, leaving the image data
+    untouched. Returns False (and writes nothing) if the file type isn't supported.
+    """
+    splice = _splicer(source_path)
+
+    if splice is None:
+        return False
+
+    exif_bytes = exif.tobytes()
+
+    if not exif_bytes.startswith(EXIF_HEADER):
+        exif_bytes = EXIF_HEADER + exif_bytes
+
+    # Write to a temp file in the same dir so a failure never leaves a half written destination
+    tmp_file = NamedTemporaryFile(dir=Path(destination_path).parent, prefix='.', delete=False)
+    tmp_path = Path(tmp_file.name)
+    replaced = False
+
+    try:
+        with tmp_file, open(source_path, 'rb') as source:
+            try:
+                splice(source, tmp_file, exif_bytes)
+            except (UnsupportedImageError, struct.error) as e:
+                log.debug(f"Can't splice EXIF into '{source_path}' ({e})")
+                return False
+
+        shutil.copymode(source_path, tmp_path)
+        replace(tmp_path, destination_path)
+        replaced = True
+    finally:
+        if not replaced:
+            tmp_path.unlink(missing_ok=True)
+
+    return True
+
+
+def _splicer(file_path: Path) -> Optional[Callable[[BinaryIO, BinaryIO, bytes], None]]:
+    """Choose the splicer based on the file's magic bytes."""
+    with open(file_path, 'rb') as file:
+        signature = file.read(len(PNG_SIGNATURE))
+
+    if signature.startswith(JPEG_SOI):
+        return _splice_jpeg_exif
+    elif signature == PNG_SIGNATURE:
+        return _splice_png_exif
+    else:
+        return None
+
+
+def _splice_jpeg_exif(source: BinaryIO, destination: BinaryIO, exif_bytes: bytes) -> None:
+    """Copy the segments before the image data minus any EXIF APP1s, inserting ours after SOI / APP0."""
+    if len(exif_bytes) > JPEG_MAX_SEGMENT_BYTES:
+        raise UnsupportedImageError(f"{len(exif_bytes)} bytes of EXIF won't fit in a JPEG APP1 segment")
+
+    exif_segment = struct.pack('>BBH', 0xFF, JPEG_APP1, len(exif_bytes) + 2) + exif_bytes
+    destination.write(source.read(2))
+    exif_written = False
+
+    while True:
+        marker_type = _read_jpeg_marker(source)
+        marker = bytes([0xFF, marker_type])
+
+        if marker_type == JPEG_SOS:
+            break
+
+        length = struct.unpack('>H', source.read(2))[0]
+        payload = source.read(length - 2)
+
+        if len(payload) != length - 2:
+            raise UnsupportedImageError('truncated JPEG segment')
+        elif marker_type == JPEG_APP0 and not exif_written:
+            destination.write(marker + struct.pack('>H', length) + payload)
+            continue
+
+        if not exif_written:
+            destination.write(exif_segment)
+            exif_written = True
+
+        if marker_type == JPEG_APP1 and payload.startswith(EXIF_HEADER):
+            continue  # Drop the old EXIF
+
+        destination.write(marker + struct.pack('>H', length) + payload)
+
+    if not exif_written:
+        destination.write(exif_segment)
+
+    # Start of scan through EOI (plus anything trailing, e.g. MPO images) goes through as is
+    destination.write(marker)
+    shutil.copyfileobj(source, destination)
+
+
+def _read_jpeg_marker(source: BinaryIO) -> int:
+    """Returns the type of the next marker. Any number of 0xFF fill bytes can come before a marker."""
+    marker = source.read(2)
+
+    if len(marker) < 2 or marker[0] != 0xFF:
+        raise UnsupportedImageError(f"bad JPEG marker {marker!r}")
+
+    marker_type = marker[1]
+
+    while marker_type == 0xFF:
+        fill_or_type = source.read(1)
+
+        if len(fill_or_type) == 0:
+            raise UnsupportedImageError('truncated JPEG marker')
+
+        marker_type = fill_or_type[0]
+
+    return marker_type
+
+
+def _splice_png_exif(source: BinaryIO, destination: BinaryIO, exif_bytes: bytes) -> None:
+    """
+    Copy the chunks minus any eXIf, inserting ours before the first IDAT. Chunks after the first IDAT are
+    checked too because some older writers put the eXIf after the image data (and Pillow still reads it).
+    """
+    exif_data = exif_bytes[len(EXIF_HEADER):]  # eXIf chunks are the bare TIFF structure
+    exif_chunk = struct.pack('>I', len(exif_data)) + b'eXIf' + exif_data
+    exif_chunk += struct.pack('>I', zlib.crc32(b'eXIf' + exif_data))
+    destination.write(source.read(len(PNG_SIGNATURE)))
+    exif_written = False
+
+    while True:
+        header = source.read(8)
+
+        if len(header) < 8:
+            raise UnsupportedImageError('PNG has no IEND chunk' if exif_written else 'PNG has no IDAT chunk')
+
+        length, chunk_type = struct.unpack('>I4s', header)
+        chunk = source.read(length + 4)  # Data + CRC
+
+        if len(chunk) != length + 4:
+            raise UnsupportedImageError(f"truncated PNG {chunk_type!r} chunk")
+        elif chunk_type == b'IDAT' and not exif_written:
+            destination.write(exif_chunk)
+            exif_written = True
+
+        if chunk_type != b'eXIf':
+            destination.write(header + chunk)
+
+        if chunk_type == b'IEND':
+            break
+
+    # Anything trailing IEND goes through as is
+    shutil.copyfileobj(source, destination)
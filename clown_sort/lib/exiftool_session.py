@@ -0,0 +1,80 @@
+"""
+A single exiftool process (run with -stay_open) shared by everything in the run. Starting
+exiftool is expensive (it's a Perl program) so it's started once on first use and shut down at exit.
+
+pyexiftool: https://sylikc.github.io/pyexiftool/
+"""
+import atexit
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+from exiftool import ExifToolHelper
+from exiftool.exceptions import ExifToolException, ExifToolOutputEmptyError
+
+from clown_sort.util.logging import log
+
+EXIFTOOL_EXECUTABLE = 'exiftool'
+BATCH_SIZE = 100  # Max files per exiftool invocation
+EXIFTOOL_NOT_FOUND_MSG = "ExifTool not found; EXIF data ignored. 'brew install exiftool' may solve this."
+
+
+class ExifToolSession:
+    def __init__(self, executable: str = EXIFTOOL_EXECUTABLE) -> None:
+        self.executable = executable
+        self.is_unavailable = False
+        self._exiftool: Optional[ExifToolHelper] = None
+        self._lock = threading.Lock()
+
+    def get_metadata(self, file_paths: Iterable[Union[str, Path]]) -> List[dict]:
+        """Metadata for each of file_paths (in the same order). Files exiftool can't read get {}."""
+        file_paths = [str(file_path) for file_path in file_paths]
+        metadata_by_path: Dict[str, dict] = {}
+
+        for i in range(0, len(file_paths), BATCH_SIZE):
+            for metadata in self._execute_batch(file_paths[i:i + BATCH_SIZE]):
+                metadata_by_path[metadata.get('SourceFile')] = metadata
+
+        return [metadata_by_path.get(file_path, {}) for file_path in file_paths]
+
+    def metadata(self, file_path: Union[str, Path]) -> dict:
+        """Metadata for a single file."""
+        return self.get_metadata([file_path])[0]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._exiftool is not None and self._exiftool.running:
+                log.debug("Shutting down exiftool...")
+                self._exiftool.terminate()
+
+            self._exiftool = None
+
+    def _execute_batch(self, file_paths: List[str]) -> List[dict]:
+        with self._lock:
+            if self.is_unavailable:
+                return []
+
+            try:
+                if self._exiftool is None:
+                    log.debug("Starting exiftool...")
+                    # check_execute=False because exiftool exits non-zero if any one file is unreadable
+                    self._exiftool = ExifToolHelper(executable=self.executable, check_execute=False)
+
+                return self._exiftool.get_metadata(file_paths)
+            except ExifToolOutputEmptyError:
+                log.debug(f"exiftool couldn't read any of {file_paths}")
+            except FileNotFoundError:
+                log.warning(EXIFTOOL_NOT_FOUND_MSG)
+                self.is_unavailable = True
+            except ExifToolException as e:
+                log.warning(f"exiftool failed on {len(file_paths)} files ({e}), restarting it...")
+                if self._exiftool is not None and self._exiftool.running:
+                    self._exiftool.terminate()
+
+                self._exiftool = None
+
+            return []
+
+
+exiftool_session = ExifToolSession()
+atexit.register(exiftool_session.shutdown)
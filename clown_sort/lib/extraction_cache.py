@@ -0,0 +1,112 @@
+"""
+Persistent cache of OCR / text extraction results keyed by the hash of the file's contents, the
+extractor (OCR engine, version, and settings), and a variant (e.g. a page range).
+Lives in DESTINATION_DIR so files that get moved into Sorted/ or Processed/ never get OCR'd twice.
+"""
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from clown_sort.lib.sqlite_store import SqliteStore
+from clown_sort.util.logging import log
+
+CACHE_FILENAME = '.clown_sort_cache.sqlite'
+DEFAULT_MAX_CACHE_MB = 512
+ROW_OVERHEAD_BYTES = 128  # Rough accounting for the hash, extractor key, etc.
+EVICT_TO_FRACTION = 0.9
+MAX_SQL_VARIABLES = 500  # Stay well under SQLite's limit on the number of '?'s in a statement
+
+
+class CachedText(NamedTuple):
+    text: Optional[str]  # None is a legitimate cached result (nothing could be extracted)
+
+
+class ExtractionCache(SqliteStore):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS extracted_text (
+            file_hash TEXT NOT NULL,
+            extractor TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            text TEXT,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (file_hash, extractor, variant)
+        );
+
+        CREATE INDEX IF NOT EXISTS extracted_text_last_used ON extracted_text (last_used);
+    """
+
+    def __init__(self, db_path: Path, max_bytes: int = DEFAULT_MAX_CACHE_MB * 1024 * 1024, rebuild: bool = False) -> None:
+        super().__init__(db_path)
+        self.max_bytes = max_bytes
+
+        if rebuild:
+            log.warning(f"Rebuilding text extraction cache '{self.db_path}'...")
+            self._execute('DELETE FROM extracted_text')
+
+        self._total_bytes = self._fetchall('SELECT COALESCE(SUM(size), 0) FROM extracted_text')[0][0]
+
+    def get(self, file_hash: str, extractor: str, variant: str = '') -> Optional[CachedText]:
+        """Returns None on a cache miss."""
+        key = (file_hash, extractor, variant)
+        rows = self._fetchall('SELECT text FROM extracted_text WHERE file_hash=? AND extractor=? AND variant=?', key)
+
+        if len(rows) == 0:
+            return None
+
+        self._execute('UPDATE extracted_text SET last_used=? WHERE file_hash=? AND extractor=? AND variant=?', (time.time(), *key))
+        return CachedText(rows[0][0])
+
+    def get_many(self, file_hash: str, extractor: str, variants: List[str]) -> Dict[str, CachedText]:
+        """The cached entries for whichever of variants (e.g. the pages of a PDF) are in the cache, keyed by variant."""
+        cached: Dict[str, CachedText] = {}
+
+        for i in range(0, len(variants), MAX_SQL_VARIABLES):
+            batch = variants[i:i + MAX_SQL_VARIABLES]
+            placeholders = ', '.join('?' * len(batch))
+            where = f"file_hash=? AND extractor=? AND variant IN ({placeholders})"
+
+            with self._lock:
+                rows = self._fetchall(f"SELECT variant, text FROM extracted_text WHERE {where}", (file_hash, extractor, *batch))
+
+                if rows:
+                    self._execute(f"UPDATE extracted_text SET last_used=? WHERE {where}", (time.time(), file_hash, extractor, *batch))
+
+            cached.update((variant, CachedText(text)) for variant, text in rows)
+
+        return cached
+
+    def put(self, file_hash: str, extractor: str, text: Optional[str], variant: str = '') -> None:
+        size = ROW_OVERHEAD_BYTES + len((text or '').encode())
+
+        with self._lock:
+            existing = self._fetchall(
+                'SELECT size FROM extracted_text WHERE file_hash=? AND extractor=? AND variant=?',
+                (file_hash, extractor, variant)
+            )
+
+            self._execute(
+                'INSERT OR REPLACE INTO extracted_text VALUES (?, ?, ?, ?, ?, ?)',
+                (file_hash, extractor, variant, text, size, time.time())
+            )
+
+            self._total_bytes += size - (existing[0][0] if existing else 0)
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache is comfortably under max_bytes."""
+        target_bytes = int(self.max_bytes * EVICT_TO_FRACTION)
+        rows = self._fetchall('SELECT rowid, size FROM extracted_text ORDER BY last_used')
+        evicted_rowids = []
+
+        for rowid, size in rows:
+            if self._total_bytes <= target_bytes:
+                break
+
+            evicted_rowids.append((rowid,))
+            self._total_bytes -= size
+
+        log.debug(f"Evicting {len(evicted_rowids)} entries from text extraction cache...")
+        self._executemany('DELETE FROM extracted_text WHERE rowid=?', evicted_rowids)
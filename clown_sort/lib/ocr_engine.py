@@ -0,0 +1,135 @@
+"""
+OCR backends. 'pytesseract' launches a new tesseract process (which has to reload the language
+model) for every image. 'tesserocr' calls libtesseract in process and keeps the model loaded
+between images, which is much faster for lots of small screenshots. Neither is imported until it's
+used so parsing the command line doesn't pay for pytesseract's imports.
+
+tesserocr: https://github.com/sirfz/tesserocr
+"""
+import importlib.util
+import threading
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from clown_sort.util.logging import log
+
+if TYPE_CHECKING:
+    import tesserocr
+    from PIL import Image
+
+OCR_LANGUAGE = 'eng'
+PYTESSERACT = 'pytesseract'
+TESSEROCR = 'tesserocr'
+DEFAULT_OCR_ENGINE = PYTESSERACT
+
+
+class OcrError(Exception):
+    """The OCR engine failed on a particular image."""
+
+
+class OcrEngine(ABC):
+    """Base class for OCR backends. Subclasses implement image_to_string() and engine_version()."""
+    name: str = ''
+
+    def __init__(self) -> None:
+        self._cache_key: Optional[str] = None
+
+    @abstractmethod
+    def image_to_string(self, image: 'Image.Image') -> str:
+        """OCR the image. Raises OcrError if the engine can't handle this image."""
+
+    @abstractmethod
+    def engine_version(self) -> Optional[str]:
+        """Version of the underlying tesseract or None if it's not available."""
+
+    def cache_key(self) -> Optional[str]:
+        """Identifies the engine, version, and settings for the text extraction cache. None if unavailable."""
+        if self._cache_key is None:
+            engine_version = self.engine_version()
+
+            if engine_version is None:
+                return None
+
+            self._cache_key = f"{self.name} {engine_version} lang={OCR_LANGUAGE}"
+
+        return self._cache_key
+
+    @classmethod
+    def is_installed(cls) -> bool:
+        return True
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+
+class PytesseractEngine(OcrEngine):
+    name = PYTESSERACT
+
+    def image_to_string(self, image: 'Image.Image') -> str:
+        import pytesseract
+
+        try:
+            return pytesseract.image_to_string(image, lang=OCR_LANGUAGE)
+        except pytesseract.TesseractError as e:
+            raise OcrError(str(e)) from e
+
+    def engine_version(self) -> Optional[str]:
+        import pytesseract
+
+        try:
+            return str(pytesseract.get_tesseract_version())
+        except pytesseract.TesseractNotFoundError:
+            return None
+
+
+class TesserocrEngine(OcrEngine):
+    """
+    Keeps one libtesseract handle per thread alive for the life of the process. The handles
+    aren't thread safe so threads don't share them.
+    """
+    name = TESSEROCR
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._thread_local = threading.local()
+
+    def image_to_string(self, image: 'Image.Image') -> str:
+        api = self._api()
+
+        try:
+            api.SetImage(image)
+            return api.GetUTF8Text()
+        except RuntimeError as e:
+            raise OcrError(str(e)) from e
+        finally:
+            api.Clear()
+
+    def engine_version(self) -> Optional[str]:
+        import tesserocr
+        # tesseract_version() looks like "tesseract 5.3.0\n leptonica-1.82.0\n ..."
+        return tesserocr.tesseract_version().split()[1]
+
+    def _api(self) -> 'tesserocr.PyTessBaseAPI':
+        if getattr(self._thread_local, 'api', None) is None:
+            from tesserocr import PyTessBaseAPI
+            log.debug(f"Loading tesserocr language model '{OCR_LANGUAGE}'...")
+            self._thread_local.api = PyTessBaseAPI(lang=OCR_LANGUAGE)
+
+        return self._thread_local.api
+
+    @classmethod
+    def is_installed(cls) -> bool:
+        return importlib.util.find_spec('tesserocr') is not None
+
+
+OCR_ENGINE_CLASSES = {engine_class.name: engine_class for engine_class in [PytesseractEngine, TesserocrEngine]}
+OCR_ENGINE_NAMES: List[str] = list(OCR_ENGINE_CLASSES.keys())
+_ocr_engines: Dict[str, OcrEngine] = {}
+
+
+def ocr_engine(name: str) -> OcrEngine:
+    """Returns the process wide instance of the named OCR engine (created on first use)."""
+    if name not in _ocr_engines:
+        _ocr_engines[name] = OCR_ENGINE_CLASSES[name]()
+
+    return _ocr_engines[name]
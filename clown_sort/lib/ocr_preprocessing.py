@@ -0,0 +1,129 @@
+"""
+Optional preprocessing of images before they're OCR'd (--ocr-preprocess). Retina screenshots are 2-3x the
+resolution tesseract needs and full RGBA, which makes OCR much slower than it has to be. Images are flattened
+onto white and converted to grayscale, dark mode screenshots are inverted so the text is dark on a light
+background, and the image is scaled so a line of text is about target_text_height pixels tall. Cropping
+uniform margins and binarizing (with Otsu's threshold) are optional.
+
+Tesseract image quality tips: https://tesseract-ocr.github.io/tessdoc/ImproveQuality.html
+Otsu's method: https://en.wikipedia.org/wiki/Otsu%27s_method
+"""
+from typing import NamedTuple, Optional
+
+import numpy as np
+from PIL import Image
+
+from clown_sort.util.constants import DEFAULT_TEXT_HEIGHT
+from clown_sort.util.logging import log
+
+MIN_SCALE = 0.25
+MAX_SCALE = 3.0
+RESCALE_TOLERANCE = 0.15  # Don't bother resampling if the text is already within 15% of the target height
+MIN_LINE_HEIGHT = 4       # Runs of rows with ink that are shorter than this are rules, underlines, noise, etc.
+MAX_TEXT_ROW_INK = 0.5    # Rows that are more than half ink are part of a picture, not a line of text
+MARGIN_TOLERANCE = 8      # Gray levels a pixel can differ from the margin color and still be part of the margin
+MARGIN_PADDING = 10       # Tesseract does better with a little whitespace around the text
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)  # ITU-R 601, same as Pillow's convert('L')
+WHITE = 255
+
+
+class OcrPreprocessing(NamedTuple):
+    binarize: bool = False
+    crop_margins: bool = False
+    target_text_height: int = DEFAULT_TEXT_HEIGHT
+
+    def cache_key(self) -> str:
+        """Preprocessing changes the OCR text so it's part of the text extraction cache key."""
+        key = f"preprocess text_height={self.target_text_height}"
+        key += ' binarize' if self.binarize else ''
+        return key + (' crop' if self.crop_margins else '')
+
+
+def preprocess_for_ocr(image: Image.Image, preprocessing: OcrPreprocessing) -> Image.Image:
+    """Returns a new grayscale (mode 'L') image; the original is left alone."""
+    gray = dark_text_on_light(grayscale_array(image))
+
+    if preprocessing.crop_margins:
+        gray = crop_uniform_margins(gray)
+
+    scale = text_scale_factor(gray, preprocessing.target_text_height)
+    preprocessed = Image.fromarray(gray)
+
+    if scale is not None:
+        new_size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+        log.debug(f"Scaling {image.size[0]}x{image.size[1]} image to {new_size[0]}x{new_size[1]} for OCR...")
+        preprocessed = preprocessed.resize(new_size, Image.Resampling.BOX if scale < 1 else Image.Resampling.LANCZOS)
+
+    if preprocessing.binarize:
+        # Binarize after resampling, which would otherwise turn the edges gray again
+        pixels = np.asarray(preprocessed)
+        preprocessed = Image.fromarray(np.where(pixels > otsu_threshold(pixels), WHITE, 0).astype(np.uint8))
+
+    return preprocessed
+
+
+def grayscale_array(image: Image.Image) -> np.ndarray:
+    """Luminance of the image as a uint8 array with any transparent pixels composited onto white."""
+    if image.mode == 'L':
+        return np.asarray(image)
+
+    rgba = np.asarray(image.convert('RGBA'), dtype=np.float32)
+    luminance = rgba[..., :3] @ LUMA_WEIGHTS
+    alpha = rgba[..., 3] / WHITE
+    return np.rint(luminance * alpha + WHITE * (1 - alpha)).astype(np.uint8)
+
+
+def dark_text_on_light(gray: np.ndarray) -> np.ndarray:
+    """Invert dark mode screenshots (the background is whatever most of the pixels are)."""
+    return WHITE - gray if np.median(gray) < WHITE / 2 else gray
+
+
+def crop_uniform_margins(gray: np.ndarray, padding: int = MARGIN_PADDING) -> np.ndarray:
+    """Crop off the margins that are all the same color as the edges of the image, leaving a little padding."""
+    border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    content = np.abs(gray.astype(np.int16) - int(np.median(border))) > MARGIN_TOLERANCE
+    rows = np.flatnonzero(content.any(axis=1))
+    cols = np.flatnonzero(content.any(axis=0))
+
+    if len(rows) == 0:
+        return gray
+
+    top, bottom = max(rows[0] - padding, 0), min(rows[-1] + padding + 1, gray.shape[0])
+    left, right = max(cols[0] - padding, 0), min(cols[-1] + padding + 1, gray.shape[1])
+    return gray[top:bottom, left:right]
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """Gray level that best separates the pixels into dark and light (maximizes the between class variance)."""
+    histogram = np.bincount(gray.ravel(), minlength=WHITE + 1).astype(np.float64)
+    dark_weight = np.cumsum(histogram)
+    light_weight = dark_weight[-1] - dark_weight
+    cumulative_sum = np.cumsum(histogram * np.arange(WHITE + 1))
+    dark_mean = cumulative_sum / np.maximum(dark_weight, 1)
+    light_mean = (cumulative_sum[-1] - cumulative_sum) / np.maximum(light_weight, 1)
+    return int(np.argmax(dark_weight * light_weight * (dark_mean - light_mean) ** 2))
+
+
+def text_line_height(gray: np.ndarray) -> Optional[float]:
+    """
+    Median height of the runs of consecutive rows that contain some (but not too much) dark ink, which for
+    a screenshot of text is the height of its lines of text. None if there's nothing that looks like text.
+    """
+    ink_fraction = (gray <= otsu_threshold(gray)).mean(axis=1)
+    text_rows = (ink_fraction > 0) & (ink_fraction < MAX_TEXT_ROW_INK)
+    run_edges = np.flatnonzero(np.diff(np.concatenate(([0], text_rows.astype(np.int8), [0]))))
+    run_lengths = run_edges[1::2] - run_edges[::2]
+    run_lengths = run_lengths[run_lengths >= MIN_LINE_HEIGHT]
+    return float(np.median(run_lengths)) if len(run_lengths) > 0 else None
+
+
+def text_scale_factor(gray: np.ndarray, target_text_height: int) -> Optional[float]:
+    """How much to scale the image so its text is target_text_height pixels tall. None if it's close enough."""
+    line_height = text_line_height(gray)
+
+    if line_height is None:
+        return None
+
+    scale = min(max(target_text_height / line_height, MIN_SCALE), MAX_SCALE)
+    log.debug(f"Text line height {line_height:.1f} px, OCR scale factor {scale:.2f}")
+    return None if abs(scale - 1) <= RESCALE_TOLERANCE else scale
@@ -0,0 +1,123 @@
+"""
+Page by page PDF text extraction that reads each page's text layer first and only OCRs the images
+on pages that don't have much text (scans, image only pages). Born digital PDFs already have all
+their text in the text layer so OCRing their logos, charts, etc. is mostly wasted CPU.
+
+Text density is measured in non-whitespace characters per square inch of the page's MediaBox.
+A dense page of text runs 20-40 chars / sq in; a scanned page with no text layer is 0.
+
+pypdf and Pillow are imported when they're needed so the argument parser can use the constants here.
+"""
+import io
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+
+from clown_sort.lib.ocr_engine import OcrEngine, OcrError
+from clown_sort.util.logging import log
+
+if TYPE_CHECKING:
+    from pypdf import PageObject, PdfReader
+
+# --pdf-ocr policies
+ALWAYS = 'always'   # Hand the whole document to pdfalyzer, which OCRs every embedded image
+SPARSE = 'sparse'   # Only OCR the images on pages whose text layer is sparser than the threshold
+NEVER = 'never'     # Text layer only
+PDF_OCR_POLICIES = [SPARSE, ALWAYS, NEVER]
+DEFAULT_PDF_OCR_POLICY = SPARSE
+
+DEFAULT_MIN_TEXT_DENSITY = 1.0  # Chars per square inch, i.e. ~90 chars on a letter size page
+POINTS_PER_INCH = 72
+
+
+class PdfPageExtractor:
+    def __init__(self, reader: 'PdfReader', ocr_engine: OcrEngine, ocr_policy: str = SPARSE, min_text_density: float = DEFAULT_MIN_TEXT_DENSITY) -> None:
+        self.reader = reader
+        self.ocr_engine = ocr_engine
+        self.ocr_policy = ocr_policy
+        self.min_text_density = min_text_density
+        self.ocr_page_count = 0  # Pages whose images were OCR'd
+        self.page_numbers_of_errors: List[int] = []
+
+    @property
+    def page_count(self) -> int:
+        return len(self.reader.pages)
+
+    def page_text(self, page_number: int) -> str:
+        """Text layer of the page (1 indexed) plus the OCR text of its images if the text layer is too sparse."""
+        page = self.reader.pages[page_number - 1]
+
+        try:
+            text = (page.extract_text() or '').strip()
+        except Exception as e:  # pypdf raises all kinds of things on malformed content streams
+            self._record_error(page_number, f"{type(e).__name__} extracting text layer of page {page_number}: {e}")
+            text = ''
+
+        if not self._needs_ocr(page, text):
+            return text
+
+        return '\n\n'.join([text] + self._ocr_images(page, page_number)).strip()
+
+    def _needs_ocr(self, page: 'PageObject', text: str) -> bool:
+        if self.ocr_policy == NEVER:
+            return False
+        elif self.ocr_policy == ALWAYS:
+            return True
+
+        density = text_density(page, text)
+        log.debug(f"Page text density {density:.2f} chars / sq in (OCR threshold {self.min_text_density})")
+        return density < self.min_text_density
+
+    def _ocr_images(self, page: 'PageObject', page_number: int) -> List[str]:
+        from PIL import Image
+        image_texts = []
+
+        try:
+            images = list(page.images)
+        except Exception as e:
+            self._record_error(page_number, f"{type(e).__name__} reading images on page {page_number}: {e}")
+            return image_texts
+
+        if images:
+            self.ocr_page_count += 1  # Pages without any images don't count as OCR'd
+
+        for image_number, image in enumerate(images, start=1):
+            try:
+                with Image.open(io.BytesIO(image.data)) as image_obj:
+                    image_text = self.ocr_engine.image_to_string(image_obj).strip()
+            except (OcrError, OSError, TypeError, ValueError) as e:
+                self._record_error(page_number, f"{type(e).__name__} OCRing image {image_number} on page {page_number}: {e}")
+                continue
+
+            if image_text:
+                image_texts.append(image_text)
+
+        return image_texts
+
+    def _record_error(self, page_number: int, msg: str) -> None:
+        log.warning(msg)
+
+        if page_number not in self.page_numbers_of_errors:
+            self.page_numbers_of_errors.append(page_number)
+
+
+def text_density(page: 'PageObject', text: str) -> float:
+    """Non-whitespace characters per square inch of the page."""
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    square_inches = abs(width * height) / POINTS_PER_INCH ** 2
+
+    if square_inches == 0:
+        return 0.0
+
+    return sum(1 for char in text if not char.isspace()) / square_inches
+
+
+def open_pdf(file_path: Path) -> Optional['PdfReader']:
+    """PdfReader for the file or None (with a warning) if pypdf can't open it."""
+    from pypdf import PdfReader
+    from pypdf.errors import PyPdfError
+
+    try:
+        return PdfReader(file_path)
+    except (OSError, PyPdfError, ValueError) as e:
+        log.warning(f"Couldn't open '{file_path}' ({e})...")
+        return None
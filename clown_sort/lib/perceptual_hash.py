@@ -0,0 +1,153 @@
+"""
+Perceptual hashes for spotting near duplicate screenshots (e.g. two screenshots of the same tweet that
+differ by a few pixels). dHash shrinks the image to a 9x8 grayscale thumbnail and records whether each
+pixel is brighter than its neighbor to the right; similar images have hashes that differ in few bits.
+Hashes are stored in a BK-tree so finding the ones within a few bits of a new hash doesn't require
+comparing against every hash seen so far.
+
+Screenshots with the same layout (e.g. two different tweets rendered the same way) can have hashes that
+are only a few bits apart, so before one image's text is reused for another (--near-duplicates reuse-ocr)
+the two images have to be the same size and their grayscale thumbnails have to be nearly identical pixel
+for pixel. Different text changes several percent of the thumbnail pixels; a notification badge, JPEG
+artifacts, or a changed like count change a fraction of a percent.
+
+dHash: https://www.hackerfactor.com/blog/index.php?/archives/529-Kind-of-Like-That.html
+BK-tree: https://en.wikipedia.org/wiki/BK-tree
+"""
+import threading
+from pathlib import Path
+from typing import Dict, Generic, List, NamedTuple, Optional, Tuple, TypeVar
+
+import numpy as np
+from PIL import Image
+
+DHASH_SIZE = 8  # 8x8 = 64 bit hashes
+NEAR_DUPLICATE_MAX_DISTANCE = 6  # Max number of differing bits for two images to be considered near duplicates
+THUMBNAIL_WIDTH = 128            # Width of the grayscale thumbnails compared before reusing an image's text
+CHANGED_PIXEL_THRESHOLD = 24     # Difference in gray level for a thumbnail pixel to count as changed
+MAX_CHANGED_PIXELS = 0.01        # Fraction of changed thumbnail pixels above which the images aren't the same
+
+T = TypeVar('T')
+
+
+def dhash(image: Image.Image, hash_size: int = DHASH_SIZE) -> int:
+    """Difference hash of the image as a hash_size**2 bit integer."""
+    thumbnail = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(hash1: int, hash2: int) -> int:
+    return (hash1 ^ hash2).bit_count()
+
+
+class Thumbnail(NamedTuple):
+    """Small grayscale copy of an image for checking that two near duplicates really are the same picture."""
+    image_size: Tuple[int, int]
+    pixels: np.ndarray
+
+    @classmethod
+    def of(cls, image: Image.Image) -> 'Thumbnail':
+        height = max(1, round(image.height * THUMBNAIL_WIDTH / image.width))
+        thumbnail = image.convert('L').resize((THUMBNAIL_WIDTH, height), Image.Resampling.BOX)
+        return cls(image.size, np.asarray(thumbnail, dtype=np.uint8))
+
+    def matches(self, other: 'Thumbnail') -> bool:
+        """True if the images are the same size and hardly any of the thumbnails' pixels differ."""
+        if self.image_size != other.image_size:
+            return False
+
+        differences = np.abs(self.pixels.astype(np.int16) - other.pixels.astype(np.int16))
+        return bool((differences > CHANGED_PIXEL_THRESHOLD).mean() <= MAX_CHANGED_PIXELS)
+
+
+class BKTree(Generic[T]):
+    """
+    Tree of hashes where each child's edge is labeled with its distance from its parent. By the triangle
+    inequality a search only has to descend into the children whose label is within max_distance of the
+    query's distance to the parent.
+    """
+    def __init__(self) -> None:
+        # Each node is (hash, values with that hash, children keyed by distance from this node)
+        self._root: Optional[Tuple[int, List[T], Dict[int, tuple]]] = None
+        self._size = 0
+
+    def add(self, hash: int, value: T) -> None:
+        self._size += 1
+
+        if self._root is None:
+            self._root = (hash, [value], {})
+            return
+
+        node = self._root
+
+        while True:
+            distance = hamming_distance(hash, node[0])
+
+            if distance == 0:
+                node[1].append(value)
+                return
+            elif distance not in node[2]:
+                node[2][distance] = (hash, [value], {})
+                return
+
+            node = node[2][distance]
+
+    def find(self, hash: int, max_distance: int) -> List[Tuple[int, T]]:
+        """(distance, value) for every value whose hash is within max_distance of hash, closest first."""
+        matches = []
+        nodes_to_check = [] if self._root is None else [self._root]
+
+        while nodes_to_check:
+            node_hash, values, children = nodes_to_check.pop()
+            distance = hamming_distance(hash, node_hash)
+
+            if distance <= max_distance:
+                matches.extend((distance, value) for value in values)
+
+            nodes_to_check.extend(
+                child for child_distance, child in children.items()
+                if distance - max_distance <= child_distance <= distance + max_distance
+            )
+
+        return sorted(matches, key=lambda match: match[0])
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class NearDuplicateIndex:
+    """
+    Perceptual hashes of the images seen so far this run plus the text extracted from each of them.
+    Thumbnails are only kept for the images they're passed in for (i.e. when text may be reused).
+    """
+
+    def __init__(self, max_distance: int = NEAR_DUPLICATE_MAX_DISTANCE) -> None:
+        self.max_distance = max_distance
+        self._tree: BKTree[Path] = BKTree()
+        self._thumbnails: Dict[Path, Thumbnail] = {}
+        self._extracted_texts: Dict[Path, str] = {}
+        self._lock = threading.Lock()
+
+    def find_or_add(self, file_path: Path, image_hash: int, thumbnail: Optional[Thumbnail] = None) -> Optional[Path]:
+        """
+        Returns the closest near duplicate of file_path seen so far (if any) then adds file_path to the index.
+        If thumbnail is given only images whose thumbnails match it count as near duplicates.
+        """
+        with self._lock:
+            matches = [path for _distance, path in self._tree.find(image_hash, self.max_distance)]
+            self._tree.add(image_hash, file_path)
+
+            if thumbnail is not None:
+                matches = [path for path in matches if path in self._thumbnails and thumbnail.matches(self._thumbnails[path])]
+                self._thumbnails[file_path] = thumbnail
+
+        return matches[0] if matches else None
+
+    def record_extracted_text(self, file_path: Path, text: Optional[str]) -> None:
+        if text:
+            self._extracted_texts[file_path] = text
+
+    def extracted_text(self, file_path: Path) -> Optional[str]:
+        return self._extracted_texts.get(file_path)
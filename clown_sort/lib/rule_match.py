@@ -6,6 +6,7 @@ from dataclasses import dataclass
 from typing import List, Optional
 
 from clown_sort.config import Config
+from clown_sort.lib.rule_set import RuleSet
 
 
 @dataclass
@@ -14,26 +15,28 @@ class RuleMatch:
     match: re.Match
 
     @classmethod
-    def get_rule_matches(cls, search_text: Optional[str]) -> List['RuleMatch']:
-        """Find any folders that could be relevant by matching against search_string both with and w/out underscores."""
+    def get_rule_matches(cls, search_text: Optional[str], rule_set: Optional[RuleSet] = None) -> List['RuleMatch']:
+        """
+        Find any folders that could be relevant by matching against search_string both with and w/out underscores.
+        Uses Config.rule_set unless a different rule_set is provided.
+        """
         if search_text is None:
             return []
 
+        rule_set = Config.rule_set if rule_set is None else rule_set
+
         if '_' not in search_text:
-            return cls._get_raw_matches(search_text)
+            return cls._get_raw_matches(search_text, rule_set)
 
         # \b word boundary doesn't match underscores so we replace with spaces and search again
-        matched_rules = cls._get_raw_matches(search_text) + cls._get_raw_matches(search_text.replace('_', ' '))
+        matched_rules = cls._get_raw_matches(search_text, rule_set) + cls._get_raw_matches(search_text.replace('_', ' '), rule_set)
         # Abuse dict comprehension to uniquify the matches and remove dupes.
         return [rm for rm in {rule.folder: rule for rule in matched_rules}.values()]
 
     @classmethod
-    def _get_raw_matches(cls, search_text: Optional[str]) -> List['RuleMatch']:
+    def _get_raw_matches(cls, search_text: Optional[str], rule_set: RuleSet) -> List['RuleMatch']:
         """Find any folders that could be relevant."""
         if search_text is None:
             return []
 
-        return [
-            cls(sr.folder, sr.regex.search(search_text))
-            for sr in Config.sort_rules if sr.regex.search(search_text)
-        ]
+        return [cls(sort_rule.folder, match) for sort_rule, match in rule_set.search(search_text)]
@@ -0,0 +1,215 @@
+"""
+Compiled set of SortRules that can be matched against a piece of text in a single pass.
+
+Each rule's regex is parsed once to find the literal strings that any match of the regex must contain.
+When matching, the (lowercased) text is checked for those literals and only the rules whose literals
+are present are actually evaluated with the regex engine.
+"""
+import hashlib
+import re
+from re import _constants as sre_constants
+from re import _parser as sre_parser
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from clown_sort.sort_rule import SortRule
+from clown_sort.util.logging import log
+
+# Cap on the number of alternatives tracked as exact strings before falling back to a looser requirement
+MAX_EXACT_STRINGS = 16
+
+Literals = FrozenSet[str]
+
+# The only non-ASCII chars that IGNORECASE regexes match against ASCII letters. str.lower() leaves
+# most of them alone (and turns 'İ' into two chars) so they are mapped by hand before lowercasing.
+ASCII_CASE_FOLDS = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
+
+class _RegexInfo(NamedTuple):
+    """
+    exact: The complete set of strings a regex (fragment) can match, if small and knowable.
+    required: A set of strings at least one of which must appear in any match (None means no requirement).
+    """
+    exact: Optional[Literals] = None
+    required: Optional[Literals] = None
+
+
+ANYTHING = _RegexInfo()
+EMPTY_STRING = _RegexInfo(exact=frozenset(['']))
+
+
+class RuleSet:
+    def __init__(self, sort_rules: List[SortRule]) -> None:
+        self.sort_rules = list(sort_rules)
+        self.rule_digests = [rule_digest(sort_rule) for sort_rule in self.sort_rules]
+        # Changes if any rule is added, removed, modified, or reordered
+        self.digest = hashlib.sha256('\n'.join(self.rule_digests).encode()).hexdigest()
+        self._rule_idxs_by_literal: Dict[str, List[int]] = {}
+        self._always_evaluate: List[int] = []
+
+        for i, sort_rule in enumerate(self.sort_rules):
+            literals = required_literals(sort_rule.regex)
+
+            if literals is None:
+                log.debug(f"No required literals found for '{sort_rule.folder}' rule '{sort_rule.regex.pattern}'")
+                self._always_evaluate.append(i)
+                continue
+
+            for literal in literals:
+                self._rule_idxs_by_literal.setdefault(literal, []).append(i)
+
+    def search(self, text: str) -> List[Tuple[SortRule, re.Match]]:
+        """Return (rule, match) tuples for every rule whose regex matches 'text', in rule order."""
+        return [
+            (self.sort_rules[i], match)
+            for i in self._candidate_rule_idxs(text)
+            if (match := self.sort_rules[i].regex.search(text))
+        ]
+
+    def _candidate_rule_idxs(self, text: str) -> List[int]:
+        """Indexes of the rules that could possibly match 'text'."""
+        if not text.isascii() and any(chr(c) in text for c in ASCII_CASE_FOLDS):
+            text = text.translate(ASCII_CASE_FOLDS)
+
+        lowercased_text = text.lower()
+        candidate_idxs: Set[int] = set(self._always_evaluate)
+
+        for literal, rule_idxs in self._rule_idxs_by_literal.items():
+            if literal in lowercased_text:
+                candidate_idxs.update(rule_idxs)
+
+        return sorted(candidate_idxs)
+
+    def __len__(self) -> int:
+        return len(self.sort_rules)
+
+
+def rule_digest(sort_rule: SortRule) -> str:
+    """Identifies a rule by its folder, regex, and regex flags."""
+    rule_str = f"{sort_rule.folder}\0{sort_rule.regex.pattern}\0{sort_rule.regex.flags}"
+    return hashlib.sha256(rule_str.encode()).hexdigest()
+
+
+def required_literals(regex: re.Pattern) -> Optional[Literals]:
+    """
+    Find a set of lowercase strings at least one of which must appear in any text 'regex' matches.
+    Returns None if no such set could be determined.
+    """
+    try:
+        parsed = sre_parser.parse(regex.pattern, regex.flags)
+    except Exception as e:
+        log.warning(f"Failed to parse regex '{regex.pattern}' ({e}), it will always be evaluated")
+        return None
+
+    literals = _requirement(_sequence_info(parsed))
+
+    if literals is None or '' in literals:
+        return None
+
+    return literals
+
+
+def _sequence_info(subpattern: Iterable) -> _RegexInfo:
+    """Info for a sequence of regex nodes that must match one after the other."""
+    current_run = EMPTY_STRING.exact  # Exact strings for the run of exact nodes currently being built
+    required = None
+    is_exact = True
+
+    for op, arg in subpattern:
+        info = _node_info(op, arg)
+
+        if info.exact is not None and len(current_run) * len(info.exact) <= MAX_EXACT_STRINGS:
+            current_run = frozenset(a + b for a in current_run for b in info.exact)
+            continue
+
+        # The run of exact strings is broken so keep its requirement if it's the best one seen so far
+        is_exact = False
+        required = _most_selective(required, _requirement(_RegexInfo(exact=current_run)))
+
+        if info.exact is None:
+            required = _most_selective(required, info.required)
+            current_run = EMPTY_STRING.exact
+        else:
+            current_run = info.exact
+
+    if is_exact:
+        return _RegexInfo(exact=current_run)
+
+    return _RegexInfo(required=_most_selective(required, _requirement(_RegexInfo(exact=current_run))))
+
+
+def _node_info(op, arg) -> _RegexInfo:
+    """Info for a single node of a parsed regex."""
+    if op is sre_constants.LITERAL:
+        return _literal_info([arg])
+    elif op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return EMPTY_STRING  # Zero width
+    elif op is sre_constants.SUBPATTERN:
+        return _sequence_info(arg[-1])
+    elif op is sre_constants.ATOMIC_GROUP:
+        return _sequence_info(arg)
+    elif op is sre_constants.BRANCH:
+        return _alternation([_sequence_info(branch) for branch in arg[1]])
+    elif op is sre_constants.IN:
+        if any(item_op is not sre_constants.LITERAL for item_op, _item_arg in arg):
+            return ANYTHING  # Ranges, categories, and negations
+
+        return _literal_info([item_arg for _item_op, item_arg in arg])
+    elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, sre_constants.POSSESSIVE_REPEAT):
+        min_repeats, max_repeats, item = arg
+        item_info = _sequence_info(item)
+
+        if min_repeats == 0:
+            if max_repeats == 1 and item_info.exact is not None:
+                return _RegexInfo(exact=item_info.exact | {''})
+
+            return ANYTHING
+        elif min_repeats == max_repeats == 1:
+            return item_info
+        else:
+            return _RegexInfo(required=_requirement(item_info))
+
+    return ANYTHING
+
+
+def _literal_info(codepoints: List[int]) -> _RegexInfo:
+    """Info for a node that matches exactly one of 'codepoints'."""
+    chars = frozenset(chr(c).lower() for c in codepoints)
+
+    if len(chars) > MAX_EXACT_STRINGS or not all(c.isascii() for c in chars):
+        return ANYTHING
+
+    return _RegexInfo(exact=chars)
+
+
+def _alternation(branches: List[_RegexInfo]) -> _RegexInfo:
+    """Info for a regex that matches any one of 'branches'."""
+    if all(branch.exact is not None for branch in branches):
+        exact = frozenset().union(*[branch.exact for branch in branches])
+
+        if len(exact) <= MAX_EXACT_STRINGS:
+            return _RegexInfo(exact=exact)
+
+    requirements = [_requirement(branch) for branch in branches]
+
+    if any(requirement is None for requirement in requirements):
+        return ANYTHING
+
+    return _RegexInfo(required=frozenset().union(*requirements))
+
+
+def _requirement(info: _RegexInfo) -> Optional[Literals]:
+    """Collapse an info into just the set of strings one of which must appear (or None)."""
+    if info.exact is None:
+        return info.required
+    elif '' in info.exact:
+        return None
+
+    return info.exact
+
+
+def _most_selective(first: Optional[Literals], second: Optional[Literals]) -> Optional[Literals]:
+    """Choose the requirement whose shortest literal is longest."""
+    if first is None or second is None:
+        return first or second
+
+    return max(first, second, key=lambda literals: (min(len(s) for s in literals), -len(literals)))
@@ -0,0 +1,116 @@
+"""
+Index of the basenames of every file in the Sorted/ tree so looking up all the copies of a file is a
+single query instead of a scan of the whole tree. The index persists between runs and each dir's
+mtime is stored with it so a refresh only has to re-list the dirs that had files added or removed.
+"""
+import os
+from pathlib import Path
+from typing import List, Optional, Set
+
+from clown_sort.lib.sqlite_store import SqliteStore
+from clown_sort.util.filesystem_helper import list_dir
+from clown_sort.util.instrumentation import SCAN, instrumentation
+from clown_sort.util.logging import log
+
+INDEX_FILENAME = '.clown_sort_index.sqlite'
+
+
+class SortedFileIndex(SqliteStore):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS dirs (
+            path TEXT PRIMARY KEY,
+            parent TEXT,
+            mtime_ns INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            dir TEXT NOT NULL,
+            basename TEXT NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+        CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+        CREATE INDEX IF NOT EXISTS files_basename ON files(basename);
+    """
+
+    def __init__(self, db_path: Path, rebuild: bool = False) -> None:
+        super().__init__(db_path)
+        self.relisted_dir_count = 0
+
+        if rebuild:
+            log.warning(f"Rebuilding sorted file index '{self.db_path}'...")
+            self._execute('DELETE FROM dirs')
+            self._execute('DELETE FROM files')
+
+    def refresh(self, root_dir: Path) -> None:
+        """Bring the index up to date with root_dir, re-listing only the dirs whose mtime changed."""
+        with instrumentation.span(SCAN, root_dir):
+            self._refresh(root_dir)
+
+    def _refresh(self, root_dir: Path) -> None:
+        dirs_to_check = [(os.fspath(root_dir), None)]
+        seen_dirs: Set[str] = set()
+
+        while dirs_to_check:
+            dir, parent = dirs_to_check.pop()
+
+            try:
+                mtime_ns = os.stat(dir).st_mtime_ns
+            except OSError as e:
+                log.warning(f"Can't read '{dir}' ({e.strerror}), skipping...")
+                continue
+
+            seen_dirs.add(dir)
+
+            if self._indexed_mtime_ns(dir) == mtime_ns:
+                subdirs = [row[0] for row in self._fetchall('SELECT path FROM dirs WHERE parent=?', (dir,))]
+            else:
+                subdirs = self._relist_dir(dir, parent, mtime_ns)
+
+            dirs_to_check.extend((subdir, dir) for subdir in subdirs)
+
+        self._remove_dirs_not_in(seen_dirs)
+
+    def paths(self, basename: str) -> List[Path]:
+        """All the indexed files called basename."""
+        return [Path(row[0]) for row in self._fetchall('SELECT path FROM files WHERE basename=?', (basename,))]
+
+    def remove(self, file_path: Path) -> None:
+        """Forget file_path (e.g. because it was moved out of the tree)."""
+        self._execute('DELETE FROM files WHERE path=?', (str(file_path),))
+
+    def _relist_dir(self, dir: str, parent: Optional[str], mtime_ns: int) -> List[str]:
+        """Replace the indexed contents of dir with what's there now. Returns the subdirs."""
+        log.debug(f"Indexing '{dir}'...")
+        self.relisted_dir_count += 1
+
+        try:
+            subdirs, file_entries = list_dir(dir)
+        except OSError as e:
+            log.warning(f"Can't read '{dir}' ({e.strerror}), skipping...")
+            return []
+
+        file_rows = [(entry.path, dir, entry.name) for entry in file_entries]
+
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.execute('DELETE FROM files WHERE dir=?', (dir,))
+            self._db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', file_rows)
+            self._db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)', (dir, parent, mtime_ns))
+            self._db.execute('COMMIT')
+
+        return subdirs
+
+    def _remove_dirs_not_in(self, seen_dirs: Set[str]) -> None:
+        """Drop dirs (and their files) that were deleted or are no longer under the root."""
+        removed_dirs = [row for row in self._fetchall('SELECT path FROM dirs') if row[0] not in seen_dirs]
+
+        if removed_dirs:
+            log.debug(f"Removing {len(removed_dirs)} deleted dirs from the sorted file index...")
+            self._executemany('DELETE FROM files WHERE dir=?', removed_dirs)
+            self._executemany('DELETE FROM dirs WHERE path=?', removed_dirs)
+
+    def _indexed_mtime_ns(self, dir: str) -> Optional[int]:
+        rows = self._fetchall('SELECT mtime_ns FROM dirs WHERE path=?', (dir,))
+        return rows[0][0] if rows else None
@@ -0,0 +1,120 @@
+"""
+Manifest of the files in the Sorted/ dir recording what each one looked like (size, mtime, content hash)
+when it was last evaluated and which sort rules it was evaluated against. Lets --rescan-sorted skip
+files that haven't changed since the last time and only check the rules that are new since then.
+"""
+import json
+from os import stat_result
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional, Set
+
+from clown_sort.lib.rule_set import RuleSet
+from clown_sort.lib.sqlite_store import SqliteStore
+from clown_sort.util.filesystem_helper import file_content_hash
+from clown_sort.util.logging import log
+
+MANIFEST_FILENAME = '.clown_sort_manifest.sqlite'
+
+
+class ManifestEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    content_hash: str
+    rules_digest: str
+
+
+class SortedManifest(SqliteStore):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sorted_files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            rules_digest TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS rule_sets (
+            digest TEXT PRIMARY KEY,
+            rule_digests TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: Path, rebuild: bool = False) -> None:
+        super().__init__(db_path)
+
+        if rebuild:
+            log.warning(f"Rebuilding sorted files manifest '{self.db_path}'...")
+            self._execute('DELETE FROM sorted_files')
+            self._execute('DELETE FROM rule_sets')
+
+    def get(self, file_path: Path) -> Optional[ManifestEntry]:
+        rows = self._fetchall('SELECT size, mtime_ns, content_hash, rules_digest FROM sorted_files WHERE path=?', (str(file_path),))
+        return ManifestEntry(*rows[0]) if rows else None
+
+    def record(self, file_path: Path, rule_set: RuleSet, content_hash: Optional[str] = None) -> None:
+        """Record that file_path, as it is right now, has been evaluated against all of rule_set's rules."""
+        file_stat = file_path.stat()
+        content_hash = content_hash or file_content_hash(file_path)
+        self._record_rule_set(rule_set)
+
+        self._execute(
+            'INSERT OR REPLACE INTO sorted_files VALUES (?, ?, ?, ?, ?)',
+            (str(file_path), file_stat.st_size, file_stat.st_mtime_ns, content_hash, rule_set.digest)
+        )
+
+    def rules_to_evaluate(self, file_path: Path, content_hash: Callable[[], str], rule_set: RuleSet) -> Optional[RuleSet]:
+        """
+        Returns None if file_path hasn't changed and has already been evaluated against every rule in rule_set.
+        Returns just the rules that are new since the last evaluation if file_path hasn't changed.
+        Returns all of rule_set for new or modified files. content_hash is only called if the mtime changed.
+        """
+        entry = self.get(file_path)
+
+        if entry is None or not self._is_unchanged(file_path, entry, file_path.stat(), content_hash):
+            return rule_set
+        elif entry.rules_digest == rule_set.digest:
+            return None
+
+        evaluated_rule_digests = self._rule_digests(entry.rules_digest)
+
+        if evaluated_rule_digests is None:
+            return rule_set
+
+        new_rules = [
+            sort_rule for sort_rule, digest in zip(rule_set.sort_rules, rule_set.rule_digests)
+            if digest not in evaluated_rule_digests
+        ]
+
+        return RuleSet(new_rules) if new_rules else None
+
+    def remove_deleted_files(self) -> None:
+        """Forget about files that no longer exist."""
+        deleted_paths = [row for row in self._fetchall('SELECT path FROM sorted_files') if not Path(row[0]).exists()]
+
+        if deleted_paths:
+            log.debug(f"Removing {len(deleted_paths)} deleted files from the sorted files manifest...")
+            self._executemany('DELETE FROM sorted_files WHERE path=?', deleted_paths)
+
+    def _is_unchanged(self, file_path: Path, entry: ManifestEntry, file_stat: stat_result, content_hash: Callable[[], str]) -> bool:
+        if entry.size != file_stat.st_size:
+            return False
+        elif entry.mtime_ns == file_stat.st_mtime_ns:
+            return True
+
+        # Touched but maybe not modified
+        if content_hash() != entry.content_hash:
+            return False
+
+        # Keep the new mtime so the file isn't hashed again on the next rescan
+        self._execute('UPDATE sorted_files SET mtime_ns=? WHERE path=?', (file_stat.st_mtime_ns, str(file_path)))
+        return True
+
+    def _record_rule_set(self, rule_set: RuleSet) -> None:
+        self._execute(
+            'INSERT OR IGNORE INTO rule_sets VALUES (?, ?)',
+            (rule_set.digest, json.dumps(rule_set.rule_digests))
+        )
+
+    def _rule_digests(self, rules_digest: str) -> Optional[Set[str]]:
+        rows = self._fetchall('SELECT rule_digests FROM rule_sets WHERE digest=?', (rules_digest,))
+        return set(json.loads(rows[0][0])) if rows else None
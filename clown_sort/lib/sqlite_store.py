@@ -0,0 +1,45 @@
+"""
+Base class for the small SQLite databases clown_sort keeps alongside the sorted files.
+"""
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Iterable, List, Tuple
+
+from clown_sort.util.logging import log
+
+
+class SqliteStore:
+    # Subclasses provide the CREATE TABLE IF NOT EXISTS etc. statements for their tables
+    SCHEMA: str = ''
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = Path(db_path)
+        self._lock = threading.RLock()
+        log.debug(f"Opening {type(self).__name__} '{self.db_path}'...")
+        # isolation_level=None means autocommit, WAL makes that cheap.
+        self._db = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(self.SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _execute(self, sql: str, params: Iterable[Any] = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, tuple(params))
+
+    def _executemany(self, sql: str, rows: Iterable[Iterable[Any]]) -> None:
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.executemany(sql, rows)
+            self._db.execute('COMMIT')
+
+    def _fetchall(self, sql: str, params: Iterable[Any] = ()) -> List[Tuple]:
+        with self._lock:
+            return self._db.execute(sql, tuple(params)).fetchall()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}('{self.db_path}')"
@@ -0,0 +1,210 @@
+"""
+Reproducible corpus of synthetic screenshots and PDFs for clown_sort_bench. Text is rendered with Pillow
+into images that look like the things FilenameExtractor knows how to name (tweets, reddit posts and
+replies, Dune Analytics query results), generic screenshots full of keywords that match crypto.csv rules,
+blank screenshots with no text at all, and multi page image only PDFs (i.e. scans that have to be OCR'd).
+
+The same seed, files_per_kind, and pdf_pages always produce the same files. A corpus.json manifest records
+the options and the text rendered into each file so a corpus can be reused and so the later stages can
+still be benchmarked when tesseract isn't installed.
+"""
+import json
+import textwrap
+from datetime import datetime, timedelta
+from pathlib import Path
+from random import Random
+from typing import List, NamedTuple, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+from clown_sort.util.logging import log
+
+# Kinds of files in the corpus
+TWEET = 'tweet'
+REDDIT = 'reddit'
+DUNE = 'dune'
+KEYWORDS = 'keywords'
+BLANK = 'blank'
+PDF = 'pdf'
+CORPUS_KINDS = [TWEET, REDDIT, DUNE, KEYWORDS, BLANK, PDF]
+
+MANIFEST_FILENAME = 'corpus.json'
+MANIFEST_VERSION = 1  # Bump when the generated files change so old corpuses get regenerated
+FIRST_TIMESTAMP = datetime(2022, 6, 13, 9, 30, 0)
+
+# Each of these matches at least one crypto.csv rule; none of the FILLER_WORDS match any
+CRYPTO_KEYWORDS = [
+    'Aave', 'a16z', 'Alex Mashinsky', 'Binance', 'BlockFi', 'Celsius', 'Coinbase', 'Do Kwon', 'FTX',
+    'Michael Saylor', 'MicroStrategy', 'Sam Bankman-Fried', 'Solana', 'Tether', 'Three Arrows Capital',
+    'Uniswap', 'Voyager',
+]
+
+FILLER_WORDS = [
+    'about', 'again', 'also', 'because', 'before', 'believe', 'chart', 'could', 'every', 'going', 'happen',
+    'honestly', 'just', 'know', 'later', 'market', 'maybe', 'money', 'never', 'nobody', 'people', 'price',
+    'really', 'remember', 'said', 'should', 'still', 'think', 'thread', 'today', 'told', 'what', 'when',
+    'will', 'would', 'year',
+]
+
+SUBREDDITS = ['CryptoCurrency', 'Buttcoin', 'CryptoMarkets', 'ethfinance']
+USERNAMES = ['moonboy_4000', 'degen_dave', 'rekt_capital', 'satoshi_fan', 'wen_lambo', 'ngmi_nancy']
+TIME_UNITS = ['seconds', 'minutes', 'hours', 'days']
+
+IMAGE_WIDTH = 1200
+FONT_SIZE = 26
+LINE_SPACING = 1.5
+MARGIN = 40
+WRAP_WIDTH = 80  # Chars per line at FONT_SIZE
+DARK_MODE_ODDS = 0.25
+LIGHT_BACKGROUND = (255, 255, 255)
+DARK_BACKGROUND = (21, 32, 43)
+LIGHT_TEXT = (231, 233, 234)
+DARK_TEXT = (15, 20, 25)
+BLANK_BACKGROUNDS = [(255, 255, 255), (0, 0, 0), (21, 32, 43), (236, 240, 243)]
+BLANK_SIZE = (1440, 900)
+PDF_PAGE_SIZE = (1275, 1650)  # Letter size at 150 DPI
+PDF_RESOLUTION = 150.0
+
+
+class CorpusFile(NamedTuple):
+    file_path: Path
+    kind: str
+    text: str  # The text rendered into the file ('' for blank images)
+
+
+def generate_corpus(corpus_dir: Path, seed: int, files_per_kind: int, pdf_pages: int) -> List[CorpusFile]:
+    """Write files_per_kind files of each of the CORPUS_KINDS to corpus_dir, replacing any that are already there."""
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    rng = Random(seed)
+    corpus: List[CorpusFile] = []
+    file_number = 0
+
+    for kind in CORPUS_KINDS:
+        for _i in range(files_per_kind):
+            if kind == PDF:
+                page_texts = [_keywords_text(rng) for _page in range(pdf_pages)]
+                file_path = corpus_dir.joinpath(f"Synthetic scanned report {file_number:03d}.pdf")
+                _write_pdf(file_path, page_texts, rng)
+                corpus.append(CorpusFile(file_path, kind, '\n\n'.join(page_texts)))
+            else:
+                file_path = corpus_dir.joinpath(_screenshot_filename(file_number))
+
+                if kind == BLANK:
+                    Image.new('RGB', BLANK_SIZE, rng.choice(BLANK_BACKGROUNDS)).save(file_path)
+                    text = ''
+                else:
+                    text = TEXT_GENERATORS[kind](rng)
+                    render_text_image(text, rng.random() < DARK_MODE_ODDS).save(file_path)
+
+                corpus.append(CorpusFile(file_path, kind, text))
+
+            file_number += 1
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'seed': seed,
+        'files_per_kind': files_per_kind,
+        'pdf_pages': pdf_pages,
+        'files': [{'filename': f.file_path.name, 'kind': f.kind, 'text': f.text} for f in corpus],
+    }
+
+    corpus_dir.joinpath(MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=2))
+    log.debug(f"Generated {len(corpus)} file synthetic corpus in '{corpus_dir}'")
+    return corpus
+
+
+def load_corpus(corpus_dir: Path, seed: int, files_per_kind: int, pdf_pages: int) -> Optional[List[CorpusFile]]:
+    """The corpus in corpus_dir if it was generated with the same options and all its files are there, otherwise None."""
+    manifest_path = corpus_dir.joinpath(MANIFEST_FILENAME)
+
+    if not manifest_path.is_file():
+        return None
+
+    manifest = json.loads(manifest_path.read_text())
+    options = [manifest.get(key) for key in ['version', 'seed', 'files_per_kind', 'pdf_pages']]
+
+    if options != [MANIFEST_VERSION, seed, files_per_kind, pdf_pages]:
+        log.debug(f"Corpus in '{corpus_dir}' was generated with different options {options}")
+        return None
+
+    corpus = [CorpusFile(corpus_dir.joinpath(f['filename']), f['kind'], f['text']) for f in manifest['files']]
+    return corpus if all(corpus_file.file_path.is_file() for corpus_file in corpus) else None
+
+
+def render_text_image(text: str, dark_mode: bool = False, width: int = IMAGE_WIDTH) -> Image.Image:
+    """Render text (wrapped to fit) onto a screenshot sized image."""
+    font = ImageFont.load_default(size=FONT_SIZE)
+    lines = [wrapped for line in text.split('\n') for wrapped in (textwrap.wrap(line, WRAP_WIDTH) or [''])]
+    line_height = int(FONT_SIZE * LINE_SPACING)
+    background, text_color = (DARK_BACKGROUND, LIGHT_TEXT) if dark_mode else (LIGHT_BACKGROUND, DARK_TEXT)
+    image = Image.new('RGB', (width, 2 * MARGIN + line_height * len(lines)), background)
+    draw = ImageDraw.Draw(image)
+
+    for i, line in enumerate(lines):
+        draw.text((MARGIN, MARGIN + i * line_height), line, font=font, fill=text_color)
+
+    return image
+
+
+def _write_pdf(file_path: Path, page_texts: List[str], rng: Random) -> None:
+    """Image only PDF with one rendered page of text per element of page_texts (like a scanned document)."""
+    pages = []
+
+    for page_text in page_texts:
+        page = Image.new('L', PDF_PAGE_SIZE, 255)
+        text_image = render_text_image(page_text, width=PDF_PAGE_SIZE[0]).convert('L')
+        page.paste(text_image, (0, rng.randint(0, MARGIN * 4)))
+        pages.append(page)
+
+    pages[0].save(file_path, 'PDF', resolution=PDF_RESOLUTION, save_all=True, append_images=pages[1:])
+
+
+def _screenshot_filename(file_number: int) -> str:
+    """Filenames match the default macOS screenshot regex so they're sorted without --all."""
+    timestamp = FIRST_TIMESTAMP + timedelta(minutes=37 * file_number, seconds=file_number)
+    return f"Screen Shot {timestamp:%Y-%m-%d} at {timestamp.hour % 12 or 12}.{timestamp:%M.%S %p}.png"
+
+
+def _sentence(rng: Random, keyword_count: int = 1) -> str:
+    words = rng.choices(FILLER_WORDS, k=rng.randint(8, 20))
+
+    for keyword in rng.sample(CRYPTO_KEYWORDS, keyword_count):
+        words.insert(rng.randrange(len(words) + 1), keyword)
+
+    sentence = ' '.join(words)
+    return sentence[0].upper() + sentence[1:] + '.'
+
+
+def _tweet_text(rng: Random) -> str:
+    username = rng.choice(USERNAMES)
+    age = f"{rng.randint(1, 23)}{rng.choice('mh')}"
+    return f"{username.replace('_', ' ').title()}\n@{username} - {age}\n{_sentence(rng)} {_sentence(rng, 0)}"
+
+
+def _reddit_text(rng: Random) -> str:
+    """Alternates between posts and replies, which FilenameExtractor recognizes with different regexes."""
+    username = rng.choice(USERNAMES)
+    age = f"{rng.randint(2, 11)} {rng.choice(TIME_UNITS)} ago"
+
+    if rng.random() < 0.5:
+        return f"r/{rng.choice(SUBREDDITS)} - Posted by u/{username} {age}\n{_sentence(rng)}\n{_sentence(rng, 0)}"
+    else:
+        return f"{username} - {age}\n{_sentence(rng)}\nReply Give Award Share Report"
+
+
+def _dune_text(rng: Random) -> str:
+    title = f"{rng.choice(CRYPTO_KEYWORDS)} {rng.choice(['Daily Volume', 'Outflows', 'Reserves', 'Liquidations'])}"
+    rows = [f"2022-06-{day:02d}    {rng.randint(1000, 9999999):>10,}    {rng.uniform(-50, 50):6.2f}%" for day in range(1, 9)]
+    return f"Query results {title} @dune_wizard\n" + '\n'.join(['day    amount    change'] + rows)
+
+
+def _keywords_text(rng: Random) -> str:
+    return '\n'.join(_sentence(rng, rng.randint(1, 3)) for _i in range(rng.randint(2, 6)))
+
+
+TEXT_GENERATORS = {
+    TWEET: _tweet_text,
+    REDDIT: _reddit_text,
+    DUNE: _dune_text,
+    KEYWORDS: _keywords_text,
+}
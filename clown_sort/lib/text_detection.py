@@ -0,0 +1,59 @@
+"""
+Cheap check for whether an image is likely to contain any text before paying for a full OCR run
+(--text-detection). Text is lots of small, sharp, high contrast strokes so a screenshot of text has a
+high density of strong horizontal edges. Blank captures have none and photos / renders mostly have soft
+gradients. The check runs on a downsampled grayscale copy of the image and takes a few milliseconds.
+
+The check is deliberately conservative (busy photos usually get OCR'd anyway) because skipping an image
+that does have text loses that text while OCRing an image that doesn't only costs time.
+"""
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image
+
+from clown_sort.lib.ocr_preprocessing import grayscale_array
+from clown_sort.util.constants import DEFAULT_MIN_EDGE_DENSITY
+
+DETECTION_WIDTH = 1024  # Images are shrunk to this width before looking for edges
+EDGE_THRESHOLD = 48     # Difference in gray level between neighboring pixels for there to be an edge
+MIN_CONTRAST = 32       # Difference between the 1st and 99th percentile gray levels below which an image is blank
+QUICK_PASS_SCALE = 0.5
+MIN_QUICK_PASS_CHARS = 20  # Alphanumeric chars the quick pass has to find to be worth a full OCR
+
+
+class TextDetection(NamedTuple):
+    edge_density: float
+    contrast: float
+    has_text: bool
+
+    def description(self) -> str:
+        verdict = 'probably has text' if self.has_text else 'probably no text'
+        return f"{verdict} (edge density {self.edge_density:.4f}, contrast {self.contrast:.0f})"
+
+
+def detect_text(image: Image.Image, min_edge_density: float = DEFAULT_MIN_EDGE_DENSITY) -> TextDetection:
+    """Decide whether the image is likely to have text in it. The image isn't modified."""
+    if image.size[0] > DETECTION_WIDTH:
+        new_size = (DETECTION_WIDTH, max(1, round(image.size[1] * DETECTION_WIDTH / image.size[0])))
+        image = image.resize(new_size, Image.Resampling.BOX)
+
+    gray = grayscale_array(image).astype(np.int16)
+
+    if gray.shape[1] < 2:
+        return TextDetection(0.0, 0.0, False)
+
+    low, high = np.percentile(gray, [1, 99])
+    contrast = float(high - low)
+    edge_density = float((np.abs(np.diff(gray, axis=1)) > EDGE_THRESHOLD).mean())
+    return TextDetection(edge_density, contrast, contrast >= MIN_CONTRAST and edge_density >= min_edge_density)
+
+
+def quick_pass_image(image: Image.Image) -> Image.Image:
+    """Low resolution copy of the image for a quick OCR pass."""
+    new_size = (max(1, round(image.size[0] * QUICK_PASS_SCALE)), max(1, round(image.size[1] * QUICK_PASS_SCALE)))
+    return image.resize(new_size, Image.Resampling.BOX)
+
+
+def quick_pass_found_text(text: str) -> bool:
+    return sum(1 for char in text if char.isalnum()) >= MIN_QUICK_PASS_CHARS
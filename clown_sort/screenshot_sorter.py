@@ -0,0 +1,268 @@
+"""
+Sorting screenshots: finding the files to sort, extracting their text (in parallel if --jobs is set),
+and handing them to the popup for --manual-sort. Imported by the sort_screenshots() and
+extract_text_from_files() entry points after the arguments are parsed so --help, --version, and the other
+scripts don't have to load the image, OCR, and PDF libraries.
+"""
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Set, Union
+
+from clown_sort import is_file_to_sort
+from clown_sort.config import Config
+from clown_sort.files.image_file import ImageFile
+from clown_sort.files.sortable_file import SortableFile
+from clown_sort.lib.directory_watcher import DirectoryWatcher, directory_watcher
+from clown_sort.lib.perceptual_hash import NearDuplicateIndex, Thumbnail
+from clown_sort.lib.rule_match import RuleMatch
+from clown_sort.lib.rule_set import RuleSet
+from clown_sort.sort_selector import PopupPrefetcher, process_file_with_popup
+from clown_sort.util.constants import FLAG, REUSE_OCR
+from clown_sort.util.filesystem_helper import IMAGE_FILE_EXTENSIONS, files_in_dir, is_image, is_pdf, walk_files
+from clown_sort.util.instrumentation import SCAN, instrumentation
+from clown_sort.util.logging import log
+from clown_sort.util.parallel import parallel_map_in_order
+from clown_sort.util.rich_helper import console, warning_text
+
+
+def sort_screenshots() -> None:
+    """Sort the screenshots according to the Config set up by the sort_screenshots() entry point."""
+    if Config.rescan_sorted:
+        _rescan_sorted_screenshots()
+        return
+
+    if Config.manual_sort:
+        for file_to_sort in _with_popups_prefetched(_files_for_manual_sort()):
+            process_file_with_popup(file_to_sort)
+
+        return
+
+    # Start watching before sorting what's already there so nothing created in the meantime is missed
+    watcher = directory_watcher(Config.screenshots_dir) if Config.watch else None
+    backlog = screenshot_paths(Config.screenshots_dir)
+    files_to_sort = prepared_for_sorting(backlog)
+
+    if Config.manual_fallback:
+        files_to_sort = _with_popups_prefetched(files_to_sort, unmatched_only=True)
+
+    for file_to_sort in files_to_sort:
+        file_to_sort.sort_file()
+
+    if watcher is not None:
+        _watch_for_screenshots(watcher, set(f.file_path for f in backlog))
+
+
+def _rescan_sorted_screenshots():
+    """
+    Rescan sorted folders. The whole walk is done before sorting starts because sorting writes new copies
+    into Sorted/ that would otherwise be picked up (and moved out of Sorted/) if their folder hadn't been
+    walked yet. Only the paths are kept in memory; each file is loaded when it's sorted. Symlinks aren't
+    rescanned and the files they point to aren't moved out of Sorted/.
+    """
+    console.print(f"Rescanning '{Config.sorted_screenshots_dir}'...")
+    filename_regex = Config.filename_regex if Config.screenshots_only else None
+    symlinks: List[str] = []
+    file_paths = list(walk_files(Config.sorted_screenshots_dir, IMAGE_FILE_EXTENSIONS, filename_regex, symlinks))
+    Config.symlink_targets = set(Path(symlink).resolve() for symlink in symlinks)
+    rules_to_evaluate: Dict[Path, RuleSet] = {}
+    counts = {'evaluated': 0, 'skipped': 0}
+
+    def files_to_evaluate() -> Iterator[SortableFile]:
+        """Skip files that haven't changed and have been evaluated against the current rules."""
+        for file_path in file_paths:
+            sortable_file = build_sortable_file(file_path)
+
+            if Config.sorted_manifest is not None:
+                rule_set = Config.sorted_manifest.rules_to_evaluate(file_path, sortable_file.content_hash, Config.rule_set)
+
+                if rule_set is None:
+                    log.debug(f"Skipping unchanged file '{file_path}'...")
+                    counts['skipped'] += 1
+                    continue
+                elif rule_set is not Config.rule_set:
+                    rules_to_evaluate[file_path] = rule_set
+
+            counts['evaluated'] += 1
+            yield sortable_file
+
+    for sortable_file in prepared_for_sorting(files_to_evaluate()):
+        rule_set = rules_to_evaluate.pop(sortable_file.file_path, Config.rule_set)
+
+        # If only the rules added since the last rescan need checking and none of them match there's nothing to do
+        if rule_set is not Config.rule_set and len(RuleMatch.get_rule_matches(sortable_file.search_text(), rule_set)) == 0:
+            log.debug(f"No new rules match '{sortable_file.file_path}'...")
+            sortable_file.release_resources()
+        else:
+            sortable_file.sort_file()
+
+        sortable_file.record_in_sorted_manifest()
+
+    if Config.sorted_manifest is not None:
+        Config.sorted_manifest.remove_deleted_files()
+
+    console.print(
+        f"Re-evaluated {counts['evaluated']} files in '{Config.sorted_screenshots_dir}' "
+        f"(skipped {counts['skipped']} unchanged files already checked against the current rules).",
+        style='bright_green'
+    )
+
+
+def prepared_for_sorting(sortable_files: Iterable[SortableFile]) -> Iterator[SortableFile]:
+    """
+    Yields sortable_files in the same order they came in. If Config.jobs > 1 the OCR / text extraction
+    and filename selection are done in a pool of worker processes while the files are yielded to be
+    copied and moved one at a time in this process, so console output and overwrite prompts stay in order.
+    If --near-duplicates is set images that look like one that came before them are flagged or reuse its text.
+    """
+    if Config.near_duplicates is None:
+        yield from _with_text_extracted(sortable_files)
+        return
+
+    near_duplicates = NearDuplicateIndex()
+
+    for sortable_file in _with_text_extracted(_with_near_duplicates_found(sortable_files, near_duplicates)):
+        _handle_near_duplicate(sortable_file, near_duplicates)
+        yield sortable_file
+        # By the time the next file is requested this one has been sorted so its text has been extracted
+        text = sortable_file.extracted_text() if sortable_file.text_extraction_attempted else None
+        near_duplicates.record_extracted_text(sortable_file.file_path, text)
+
+
+def _with_text_extracted(sortable_files: Iterable[SortableFile]) -> Iterator[SortableFile]:
+    if Config.jobs <= 1:
+        yield from sortable_files
+        return
+
+    def should_submit(sortable_file: SortableFile) -> bool:
+        if not sortable_file.needs_text_extraction() or sortable_file.load_cached_text():
+            return False
+
+        # The near duplicate comes first so its text will be available by the time this file is yielded
+        return Config.near_duplicates != REUSE_OCR or sortable_file.near_duplicate_of is None
+
+    for sortable_file in parallel_map_in_order(_extract_text_and_new_basename, sortable_files, Config.jobs, should_submit):
+        sortable_file.cache_extracted_text()
+        yield sortable_file
+
+
+def _with_near_duplicates_found(sortable_files: Iterable[SortableFile], near_duplicates: NearDuplicateIndex) -> Iterator[SortableFile]:
+    """
+    Set near_duplicate_of for each image that looks like an image that came before it. If Config.jobs > 1
+    the images are decoded and hashed in a pool of worker processes and only looked up in the index here.
+    """
+    if Config.jobs > 1:
+        sortable_files = parallel_map_in_order(_hash_image, sortable_files, Config.jobs, lambda f: isinstance(f, ImageFile))
+
+    for sortable_file in sortable_files:
+        if isinstance(sortable_file, ImageFile):
+            try:
+                # Text is only reused if the images really are the same picture (see perceptual_hash.py)
+                thumbnail = sortable_file.near_duplicate_thumbnail() if Config.near_duplicates == REUSE_OCR else None
+                image_hash = sortable_file.perceptual_hash()
+                sortable_file.near_duplicate_of = near_duplicates.find_or_add(sortable_file.file_path, image_hash, thumbnail)
+            except OSError as e:
+                log.warning(f"Can't compute perceptual hash of '{sortable_file.file_path}' ({e})...")
+
+            if Config.jobs > 1:
+                sortable_file.release_resources()  # Only decoded here if the worker couldn't hash it
+
+        yield sortable_file
+
+
+def _handle_near_duplicate(sortable_file: SortableFile, near_duplicates: NearDuplicateIndex) -> None:
+    near_duplicate = sortable_file.near_duplicate_of
+
+    if near_duplicate is None:
+        return
+    elif Config.near_duplicates == FLAG:
+        console.print(warning_text(f"'{sortable_file.basename}' looks like a near duplicate of '{near_duplicate.name}'"))
+    elif not sortable_file.text_extraction_attempted and not sortable_file.load_cached_text():
+        text = near_duplicates.extracted_text(near_duplicate)
+
+        if text is not None:
+            console.print(f"Reusing the text of near duplicate '{near_duplicate.name}' for '{sortable_file.basename}'...", style='dim')
+            sortable_file.borrow_extracted_text(text)
+
+
+def _files_for_manual_sort() -> Iterator[SortableFile]:
+    for file_to_sort in screenshot_paths(Config.screenshots_dir):
+        if file_to_sort.can_be_presented_in_popup():
+            yield file_to_sort
+        else:
+            print(f"'{file_to_sort.file_path}' is not suitable for manual sort, skipping...")
+
+
+def _with_popups_prefetched(sortable_files: Iterable[SortableFile], unmatched_only: bool = False) -> Iterable[SortableFile]:
+    """Prepare the popups for the next few files in the background unless --prefetch is 0."""
+    if Config.prefetch < 1:
+        return sortable_files
+
+    return PopupPrefetcher(sortable_files, Config.prefetch, Config.prefetch_max_mb * 1024 * 1024, unmatched_only)
+
+
+def screenshot_paths(dir: Path) -> List[SortableFile]:
+    """Returns a list of ImageFiles for all the screenshots to be sorted."""
+    with instrumentation.span(SCAN, dir):
+        file_paths = [f for f in files_in_dir(Config.screenshots_dir) if is_file_to_sort(f)]
+
+    return sorted([build_sortable_file(f) for f in file_paths], key=lambda f: f.basename)
+
+
+def build_sortable_file(file_path: Union[str, Path]) -> SortableFile:
+    """Decide if it's a PDF, image, or other type of file. PdfFile (and pdfalyzer) is only loaded if there's a PDF."""
+    if is_image(file_path):
+        return ImageFile(file_path)
+    elif is_pdf(file_path):
+        from clown_sort.files.pdf_file import PdfFile
+        return PdfFile(file_path)
+    else:
+        return SortableFile(file_path)
+
+
+def _watch_for_screenshots(watcher: DirectoryWatcher, already_sorted: Set[Path]) -> None:
+    """Sort new files as they show up in SCREENSHOTS_DIR until interrupted, reloading the rules when they change."""
+    console.print(f"\nWatching '{Config.screenshots_dir}' for new files (Ctrl-C to stop)...", style='bright_green')
+
+    try:
+        while True:
+            new_files = watcher.settled_files()
+
+            if Config.reload_sort_rules_if_changed():
+                console.print(f"Reloaded {len(Config.sort_rules)} sort rules...", style='bright_green')
+
+            for file_path in new_files:
+                if file_path in already_sorted or not is_file_to_sort(file_path):
+                    log.debug(f"Ignoring '{file_path}'...")
+                    continue
+
+                build_sortable_file(file_path).sort_file()
+
+                # With --leave-in-place (or --dry-run) later modify events for the file shouldn't sort it again
+                if file_path.exists():
+                    already_sorted.add(file_path)
+    except KeyboardInterrupt:
+        console.print(f"\nStopped watching '{Config.screenshots_dir}'.")
+    finally:
+        watcher.close()
+
+
+def _hash_image(image_file: ImageFile) -> ImageFile:
+    """Runs in a worker process. Returns image_file with the hashes _with_near_duplicates_found() needs populated."""
+    try:
+        image_file.perceptual_hash()
+
+        if Config.near_duplicates == REUSE_OCR:
+            image_file.near_duplicate_thumbnail()
+    except OSError:
+        pass  # The parent process logs the error when it tries again
+    finally:
+        image_file.release_resources()
+
+    return image_file
+
+
+def _extract_text_and_new_basename(sortable_file: SortableFile) -> SortableFile:
+    """Runs in a worker process. Returns sortable_file with the text it will be sorted on and its new basename populated."""
+    sortable_file.search_text()
+    sortable_file.new_basename()
+    sortable_file.release_resources()
+    return sortable_file
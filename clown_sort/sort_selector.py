@@ -3,15 +3,25 @@ Open a GUI window to allow manual name / select.
 TODO: rename to something more appropriate
 """
 import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from os import path, remove
-from typing import Union
+from typing import TYPE_CHECKING, Deque, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 from clown_sort.config import Config
 from clown_sort.filename_extractor import FilenameExtractor
+from clown_sort.lib.decoded_image_cache import decoded_images
+from clown_sort.lib.rule_match import RuleMatch
+from clown_sort.util.constants import DEFAULT_PREFETCH_FILES, DEFAULT_PREFETCH_MAX_MB
 from clown_sort.util.logging import log
-from clown_sort.util.rich_helper import bullet_text, console, indented_bullet
+from clown_sort.util.rich_helper import bullet_text, console, indented_bullet, warning_text
 from clown_sort.util.string_helper import is_empty
 
+if TYPE_CHECKING:
+    from clown_sort.files.image_file import ImageFile
+    from clown_sort.files.pdf_file import PdfFile
+    from clown_sort.files.sortable_file import SortableFile
+
 RADIO_COLS = 11
 SELECT_SIZE = 45
 DELETE = 'Delete'
@@ -21,14 +31,127 @@ SKIP = 'Skip'
 EXIT = 'Exit'
 
 
+class PopupData(NamedTuple):
+    """Everything the popup window needs that's slow to compute."""
+    suggested_filename: str
+    thumbnail_bytes: Optional[bytes]
+    sort_dirs: List[str]
+    sort_dirs_mtime_ns: Optional[int]  # mtime of the sorted dir when sort_dirs was listed
+
+
+def prepare_popup_data(image: Union['ImageFile', 'PdfFile']) -> PopupData:
+    """OCR the file (if it hasn't been already), suggest a filename, and render the thumbnail."""
+    sort_dirs_mtime_ns = _sort_dirs_mtime_ns()
+    sort_dirs = [path.basename(dir) for dir in Config.get_sort_dirs()]
+    return PopupData(FilenameExtractor(image).filename(), image.thumbnail_bytes(), sort_dirs, sort_dirs_mtime_ns)
+
+
+class PopupPrefetcher:
+    """
+    While the user is deciding what to do with the file in the popup window a background thread OCRs the
+    next few files and prepares their popups so they open immediately. Files are yielded in order with
+    their popup_data set. One thread is enough because OCR runs in a separate tesseract process (and
+    PyMuPDF, which renders PDF thumbnails, isn't thread safe so PdfFile only renders one at a time).
+
+    Prefetching stops when lookahead files are waiting or their prefetched data (thumbnails, text, and
+    decoded images) adds up to max_bytes. Files that disappear before their turn are skipped and work that
+    hasn't started yet is cancelled when iteration stops (e.g. the user clicks 'Exit').
+    If unmatched_only is True (--manual-fallback) popups are only prepared for files that don't match any rules.
+    """
+    def __init__(
+            self,
+            sortable_files: Iterable['SortableFile'],
+            lookahead: int = DEFAULT_PREFETCH_FILES,
+            max_bytes: int = DEFAULT_PREFETCH_MAX_MB * 1024 * 1024,
+            unmatched_only: bool = False
+    ) -> None:
+        self.lookahead = lookahead
+        self.max_bytes = max_bytes
+        self.unmatched_only = unmatched_only
+        self._sortable_files = iter(sortable_files)
+        self._pending: Deque[Tuple['SortableFile', Future]] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='popup_prefetch')
+
+    def __iter__(self) -> Iterator['SortableFile']:
+        try:
+            self._fill()
+
+            while self._pending:
+                sortable_file, future = self._pending.popleft()
+                self._wait_for(sortable_file, future)
+                self._fill()  # Prefetch the next files while the user looks at this one
+
+                if not sortable_file.file_path.exists():
+                    console.print(warning_text(f"'{sortable_file.file_path}' disappeared, skipping..."))
+                    continue
+
+                yield sortable_file
+                sortable_file.popup_data = None
+                sortable_file.release_resources()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Cancel any prefetching that hasn't started. Doesn't wait for a file that's being OCR'd."""
+        for sortable_file, future in self._pending:
+            if future.cancel():
+                log.debug(f"Cancelled prefetching '{sortable_file.file_path}'...")
+
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fill(self) -> None:
+        while len(self._pending) < self.lookahead and self._prefetched_bytes() < self.max_bytes:
+            try:
+                sortable_file = next(self._sortable_files)
+            except StopIteration:
+                return
+
+            self._pending.append((sortable_file, self._executor.submit(self._prefetch, sortable_file)))
+
+    def _prefetch(self, sortable_file: 'SortableFile') -> int:
+        """Runs in the prefetch thread. Returns roughly how many bytes of prefetched data are being held."""
+        if not sortable_file.file_path.exists():
+            return 0
+
+        log.debug(f"Prefetching '{sortable_file.file_path}'...")
+        search_text = sortable_file.search_text()
+
+        if self.unmatched_only and len(RuleMatch.get_rule_matches(search_text)) > 0:
+            return 0
+        elif not sortable_file.can_be_presented_in_popup():
+            return 0
+
+        popup_data = prepare_popup_data(sortable_file)
+        sortable_file.popup_data = popup_data
+        extracted_text = sortable_file.extracted_text() or ''
+        return len(popup_data.thumbnail_bytes or b'') + len(extracted_text) + decoded_images.cached_bytes(sortable_file.file_path)
+
+    def _wait_for(self, sortable_file: 'SortableFile', future: Future) -> None:
+        """If prefetching failed the popup data is prepared when the popup is opened instead."""
+        try:
+            future.result()
+        except Exception as e:
+            log.warning(f"Failed to prefetch '{sortable_file.file_path}' ({e}), will try again...")
+            sortable_file.popup_data = None
+
+    def _prefetched_bytes(self) -> int:
+        return sum(future.result() for _file, future in self._pending if future.done() and future.exception() is None)
+
+
 def process_file_with_popup(image: Union['ImageFile', 'PdfFile']) -> None:
     # Do the import here so as to allow usage without installing PySimpleGUI
     import FreeSimpleGUI as psg
     psg.theme('SystemDefault1')
-    suggested_filename = FilenameExtractor(image).filename()
-    sort_dirs = [path.basename(dir) for dir in Config.get_sort_dirs()]
+    popup_data = image.popup_data or prepare_popup_data(image)
+
+    # Prefetched sort dirs are stale if a new dir was created (e.g. in the previous popup) since they were listed
+    if popup_data.sort_dirs_mtime_ns != _sort_dirs_mtime_ns():
+        popup_data = popup_data._replace(sort_dirs=[path.basename(dir) for dir in Config.get_sort_dirs()])
+
+    suggested_filename = popup_data.suggested_filename
+    sort_dirs = popup_data.sort_dirs
     max_dirname_length = max([len(dir) for dir in sort_dirs])
-    thumbnail_bytes = image.thumbnail_bytes()
+    thumbnail_bytes = popup_data.thumbnail_bytes
 
     if thumbnail_bytes is None:
         log.warn(f"Failed to get a thumbnail; skipping...")
@@ -99,3 +222,10 @@ def process_file_with_popup(image: Union['ImageFile', 'PdfFile']) -> None:
     console.print(bullet_text(f"Moving '{image.file_path}' to '{new_filename}'..."))
     image.copy_file_to_sorted_dir(new_filename)
     image.move_to_processed_dir()
+
+
+def _sort_dirs_mtime_ns() -> Optional[int]:
+    try:
+        return Config.sorted_screenshots_dir.stat().st_mtime_ns
+    except OSError:
+        return None
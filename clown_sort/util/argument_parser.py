@@ -9,10 +9,17 @@ from pathlib import Path
 
 from rich_argparse_plus import RichHelpFormatterPlus
 
+from clown_sort.lib.duplicate_finder import HASH_THREADS
+from clown_sort.lib.extraction_cache import DEFAULT_MAX_CACHE_MB
+from clown_sort.lib.ocr_engine import DEFAULT_OCR_ENGINE, OCR_ENGINE_NAMES
 from clown_sort.lib.page_range import PageRange, PageRangeArgumentValidator
-from clown_sort.util.constants import (CRYPTO, DEFAULT_SCREENSHOTS_DIR, DEFAULT_DESTINATION_DIR,
-     DEFAULT_FILENAME_REGEX)
-from clown_sort.util.filesystem_helper import files_in_dir, is_pdf
+from clown_sort.lib.pdf_page_extractor import (ALWAYS, DEFAULT_MIN_TEXT_DENSITY, DEFAULT_PDF_OCR_POLICY, NEVER,
+     PDF_OCR_POLICIES, SPARSE)
+from clown_sort.util.constants import (CRYPTO, DEFAULT_BENCH_FILES_PER_KIND, DEFAULT_BENCH_OUTPUT,
+     DEFAULT_BENCH_PDF_PAGES, DEFAULT_BENCH_SEED, DEFAULT_SCREENSHOTS_DIR, DEFAULT_DESTINATION_DIR,
+     DEFAULT_FILENAME_REGEX, DEFAULT_MIN_EDGE_DENSITY, DEFAULT_PREFETCH_FILES, DEFAULT_PREFETCH_MAX_MB,
+     DEFAULT_TEXT_HEIGHT, FLAG, NEAR_DUPLICATE_MODES, QUICK, REUSE_OCR, SKIP, TEXT_DETECTION_MODES)
+from clown_sort.util.filesystem_helper import COPY, LINK_MODES, files_in_dir, is_pdf
 from clown_sort.util.logging import log
 
 DESCRIPTION = "Sort, rename, and tag screenshots (and the occasional PDF) according to rules."
@@ -64,6 +71,12 @@ parser.add_argument('-m', '--manual-sort', action='store_true',
 parser.add_argument('-mf', '--manual-fallback', action='store_true',
                     help='causes a popup to be presented for each file only as a fallback when no sort rules are matched (experimental)')
 
+parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH_FILES, metavar='N',
+                    help='with --manual-sort or --manual-fallback OCR and prepare the popups of the next N files in the background (0 to turn off)')
+
+parser.add_argument('--prefetch-max-mb', type=int, default=DEFAULT_PREFETCH_MAX_MB, metavar='MB',
+                    help='stop prefetching when the prepared files (thumbnails, text, decoded images) take up this much memory')
+
 parser.add_argument('-y', '--yes-overwrite', action='store_true',
                     help='skip confirmation prompt and always overwrite if a file with the same name already exists')
 
@@ -73,6 +86,20 @@ parser.add_argument('--hide-dirs', action='store_true',
 parser.add_argument('--anonymize-user-dir', action='store_true',
                     help='anonymize the user directory in log output')
 
+parser.add_argument('--link-mode', choices=LINK_MODES, default=COPY,
+                    help='when a file matches more than one sort folder write the first copy then put this kind of link '
+                         "to it in the other folders (falls back to 'copy' if the filesystem doesn't support it)")
+
+parser.add_argument('--near-duplicates', choices=NEAR_DUPLICATE_MODES, metavar='MODE',
+                    help=f"find images that look nearly identical to one already sorted this run and either '{FLAG}' them "
+                         f"or '{REUSE_OCR}' (use the earlier image's OCR text instead of OCRing again)")
+
+parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                    help='OCR and choose filenames for up to N files at a time in parallel worker processes')
+
+parser.add_argument('-w', '--watch', action='store_true',
+                    help='after sorting the files already in SCREENSHOTS_DIR keep running and sort new files as they appear')
+
 parser.add_argument('--rescan-sorted', action='store_true',
                     help="rescan already sorted files (useful if you updated your sorting rules)")
 
@@ -82,10 +109,91 @@ parser.add_argument('--delete-originals', action='store_true',
 parser.add_argument('--show-rules', action='store_true',
                     help='display the sorting rules and exit')
 
+parser.add_argument('--trace', metavar='FILE',
+                    help='write how long each stage of handling each file took to FILE as JSON lines')
+
 parser.add_argument('--debug', action='store_true',
                     help='turn on debug level logging')
 
 
+def add_ocr_engine_argument(arg_parser: ArgumentParser) -> None:
+    arg_parser.add_argument('--ocr-engine', choices=OCR_ENGINE_NAMES, default=DEFAULT_OCR_ENGINE,
+                            help="'tesserocr' keeps tesseract loaded between images and is much faster but must be installed separately")
+
+
+def add_ocr_preprocessing_arguments(arg_parser: ArgumentParser) -> None:
+    preprocessing_group = arg_parser.add_argument_group(
+        'OCR PREPROCESSING',
+        'Speed up OCR by scaling images so their text is a size tesseract handles well and by skipping images that probably have no text.'
+    )
+
+    preprocessing_group.add_argument('--ocr-preprocess', action='store_true',
+                                     help='preprocess images before OCRing them (much faster for high resolution screenshots)')
+
+    preprocessing_group.add_argument('--ocr-text-height', type=int, default=DEFAULT_TEXT_HEIGHT, metavar='PIXELS',
+                                     help='scale images so a line of text is about this many pixels tall')
+
+    preprocessing_group.add_argument('--ocr-binarize', action='store_true',
+                                     help='also convert images to pure black and white (implies --ocr-preprocess)')
+
+    preprocessing_group.add_argument('--ocr-crop-margins', action='store_true',
+                                     help='also crop off margins that are a single color (implies --ocr-preprocess)')
+
+    preprocessing_group.add_argument('--text-detection', choices=TEXT_DETECTION_MODES, metavar='MODE',
+                                     help=f"check images for signs of text before OCRing them. '{SKIP}' doesn't OCR images that "
+                                          f"probably have no text, '{QUICK}' OCRs them at low resolution first")
+
+    preprocessing_group.add_argument('--min-edge-density', type=float, default=DEFAULT_MIN_EDGE_DENSITY, metavar='FRACTION',
+                                     help='with --text-detection images with fewer strong edges than this (per pixel) probably have no text')
+
+
+def add_pdf_extraction_arguments(arg_parser: ArgumentParser) -> None:
+    arg_parser.add_argument('--pdf-page-jobs', type=int, default=1, metavar='N',
+                            help='extract the text of each PDF in batches of pages spread across N worker processes')
+
+    arg_parser.add_argument('--pdf-ocr', choices=PDF_OCR_POLICIES, default=DEFAULT_PDF_OCR_POLICY,
+                            help=f"'{SPARSE}' only OCRs the images on PDF pages with little or no text layer, "
+                                 f"'{ALWAYS}' OCRs every image (with pdfalyzer), '{NEVER}' only reads the text layer")
+
+    arg_parser.add_argument('--pdf-ocr-min-density', type=float, default=DEFAULT_MIN_TEXT_DENSITY, metavar='CHARS',
+                            help=f"with '--pdf-ocr {SPARSE}' pages whose text layer has fewer than this many characters per square inch are OCR'd")
+
+
+def add_cache_arguments(arg_parser: ArgumentParser) -> None:
+    """Options for the on disk cache of OCR / extracted text."""
+    cache_group = arg_parser.add_argument_group('TEXT EXTRACTION CACHE')
+    cache_mode = cache_group.add_mutually_exclusive_group()
+
+    cache_mode.add_argument('--no-cache', action='store_true',
+                            help="don't read or write the cache of OCR / extracted text or the manifest of already rescanned files")
+
+    cache_mode.add_argument('--rebuild-cache', action='store_true',
+                            help="discard everything in the cache of OCR / extracted text (and the manifest of rescanned files) and start over")
+
+    cache_group.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_CACHE_MB, metavar='MB',
+                             help='least recently used cache entries are evicted when the cache exceeds this size')
+
+
+add_ocr_engine_argument(parser)
+add_ocr_preprocessing_arguments(parser)
+add_pdf_extraction_arguments(parser)
+add_cache_arguments(parser)
+
+pdf_sorting_group = parser.add_argument_group(
+    'PDF SORTING',
+    'Stop extracting the text of a PDF for sorting once any of these limits is reached (full text is still extracted by extract_text_from_files).'
+)
+
+pdf_sorting_group.add_argument('--pdf-max-pages', type=int, metavar='N',
+                               help='only extract the first N pages')
+
+pdf_sorting_group.add_argument('--pdf-max-chars', type=int, metavar='N',
+                               help='stop after the page where the extracted text reaches N characters')
+
+pdf_sorting_group.add_argument('--pdf-stop-after-folders', type=int, metavar='N',
+                               help='stop after the page where the text extracted so far matches N sort folders')
+
+
 ############################################
 # Parse args for extract_text_from_files() #
 ############################################
@@ -106,6 +214,11 @@ extract_text_parser.add_argument('--print-as-parsed', '-p',
                                  action='store_true',
                                  help='print pages as they are parsed instead of waiting until document is fully parsed')
 
+add_ocr_engine_argument(extract_text_parser)
+add_ocr_preprocessing_arguments(extract_text_parser)
+add_pdf_extraction_arguments(extract_text_parser)
+add_cache_arguments(extract_text_parser)
+
 
 def parse_text_extraction_args() -> Namespace:
     args = extract_text_parser.parse_args()
@@ -178,3 +291,68 @@ purge_arg_parser.add_argument(
     help='Sorted subdirectories to purge non-image files from',
     metavar='DIR',
     nargs='+')
+
+
+####################################
+# Parse args for find_duplicates() #
+####################################
+find_duplicates_arg_parser = ArgumentParser(
+    add_help=False,
+    description="Find files with identical contents in the sorted directory structure.",
+    parents=[parser],
+)
+
+find_duplicates_arg_parser.add_argument('--hardlink', action='store_true',
+                                        help='replace each duplicate with a hardlink to a single copy of the file (requires --execute)')
+
+find_duplicates_arg_parser.add_argument('--hash-threads', type=int, default=HASH_THREADS, metavar='N',
+                                        help='number of threads reading and hashing files')
+
+
+#####################################
+# Parse args for clown_sort_bench() #
+#####################################
+bench_arg_parser = ArgumentParser(
+    formatter_class=RichHelpFormatterPlus,
+    description="Time each stage of sorting a reproducible synthetic corpus of screenshots and PDFs.",
+    epilog="Results are written as JSON so runs on different commits can be compared with --compare."
+)
+
+bench_arg_parser.add_argument('--corpus-dir', metavar='DIR',
+                              help='generate the corpus here and reuse it on later runs with the same options (default: a temp dir)')
+
+bench_arg_parser.add_argument('--output', '-o', default=DEFAULT_BENCH_OUTPUT, metavar='FILE',
+                              help='write the JSON results to FILE')
+
+bench_arg_parser.add_argument('--compare', metavar='FILE',
+                              help='show how each stage compares to the JSON results of an earlier run')
+
+bench_arg_parser.add_argument('--seed', type=int, default=DEFAULT_BENCH_SEED,
+                              help='random seed for generating the corpus')
+
+bench_arg_parser.add_argument('--files-per-kind', type=int, default=DEFAULT_BENCH_FILES_PER_KIND, metavar='N',
+                              help='number of tweets, reddit posts, Dune queries, keyword screenshots, blanks, and PDFs')
+
+bench_arg_parser.add_argument('--pdf-pages', type=int, default=DEFAULT_BENCH_PDF_PAGES, metavar='N',
+                              help='number of pages in each PDF')
+
+bench_arg_parser.add_argument('--repeat', type=int, default=1, metavar='N',
+                              help='sort the corpus N times and keep the fastest time for each stage')
+
+bench_arg_parser.add_argument('--debug', action='store_true', help='turn on debug level logging')
+add_ocr_engine_argument(bench_arg_parser)
+add_ocr_preprocessing_arguments(bench_arg_parser)
+add_pdf_extraction_arguments(bench_arg_parser)
+
+
+def parse_bench_args() -> Namespace:
+    args = bench_arg_parser.parse_args()
+
+    if min(args.files_per_kind, args.pdf_pages, args.repeat) < 1:
+        log.error("--files-per-kind, --pdf-pages, and --repeat must be at least 1")
+        sys.exit(-1)
+    elif args.compare and not Path(args.compare).is_file():
+        log.error(f"'{args.compare}' is not a file.")
+        sys.exit(-1)
+
+    return args
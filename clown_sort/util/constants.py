@@ -12,6 +12,32 @@ MAC_DEFAULT_SCREENSHOTS_DIR = Path.home().joinpath('Pictures', 'Screenshots')
 CRYPTO = 'crypto'
 PDF_ERRORS = 'pdf_errors'
 
+# How many files (and how much memory) to prepare ahead of the --manual-sort popup windows
+DEFAULT_PREFETCH_FILES = 3
+DEFAULT_PREFETCH_MAX_MB = 256
+
+# Option values needed to parse the command line live here instead of in the numpy based modules
+# that implement them so that parsing arguments doesn't have to import numpy and Pillow.
+# --near-duplicates modes (see lib/perceptual_hash.py)
+FLAG = 'flag'
+REUSE_OCR = 'reuse-ocr'
+NEAR_DUPLICATE_MODES = [FLAG, REUSE_OCR]
+
+# --text-detection modes (see lib/text_detection.py)
+SKIP = 'skip'    # Don't OCR images that probably have no text
+QUICK = 'quick'  # OCR images that probably have no text at low resolution and only do a full OCR if that finds text
+TEXT_DETECTION_MODES = [SKIP, QUICK]
+DEFAULT_MIN_EDGE_DENSITY = 0.005  # Screenshots of text are usually 0.02 - 0.08
+
+# --ocr-text-height (see lib/ocr_preprocessing.py)
+DEFAULT_TEXT_HEIGHT = 32  # Pixels from the top of the ascenders to the bottom of the descenders of a line of text
+
+# clown_sort_bench synthetic corpus (see lib/synthetic_corpus.py)
+DEFAULT_BENCH_SEED = 1
+DEFAULT_BENCH_FILES_PER_KIND = 4
+DEFAULT_BENCH_PDF_PAGES = 3
+DEFAULT_BENCH_OUTPUT = 'clown_sort_bench.json'
+
 
 ### Environment variables
 # build_env_var_string('XYZ') => 'CLOWN_SORT_XYZ'
@@ -2,15 +2,20 @@
 Functions and constants having to do with the filesystem.
 importlib explanation: https://fossies.org/linux/Python/Lib/importlib/resources.py
 """
+import ctypes
+import errno
+import hashlib
 import os
 import re
+import shutil
 import stat
+import sys
 import time
 from datetime import datetime
 from getpass import getuser
 from os import path
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Iterator, List, Optional, Pattern, Sequence, Tuple, Union
 
 from filedate.Utils import Copy
 from filedate import File
@@ -18,6 +23,7 @@ from rich.console import Console
 from rich.text import Text
 
 from clown_sort.util.constants import MAC_SCREENSHOT_REGEX, SCREENSHOT_REGEX
+from clown_sort.util.instrumentation import SCAN, instrumentation
 from clown_sort.util.logging import log
 from clown_sort.util.string_helper import spaces_to_underscores
 
@@ -30,6 +36,16 @@ MAC_SCREENSHOT_TIMESTAMP_FORMAT = '%Y-%m-%d at %I.%M.%S %p'
 ANONYMIZED_USERNAME = 'uzor'
 CURRENT_USERNAME = getuser()
 
+# Ways to put the same file in more than one sorted folder
+COPY = 'copy'
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+SYMLINK = 'symlink'
+LINK_MODES = [COPY, HARDLINK, REFLINK, SYMLINK]
+FICLONE = 0x40049409  # Linux ioctl to make a copy-on-write clone of a file (btrfs, XFS, etc.)
+
+_unavailable_link_modes: List[str] = []
+
 
 def files_in_dir(dir: Union[os.PathLike, str], with_extname: Optional[str] = None) -> List[str]:
     """Paths for non-hidden, non-directory files, optionally ending in 'with_extname'."""
@@ -41,11 +57,77 @@ def files_in_dir(dir: Union[os.PathLike, str], with_extname: Optional[str] = Non
     return files
 
 
+def walk_files(
+        dir: Union[os.PathLike, str],
+        extensions: Optional[Sequence[str]] = None,
+        filename_regex: Optional[Pattern] = None,
+        symlinks: Optional[List[str]] = None
+) -> Iterator[Path]:
+    """
+    Recursively yield non-hidden files under 'dir' as they're found, optionally only those ending in one
+    of 'extensions' and / or whose basename matches 'filename_regex'. Hidden dirs and symlinks are skipped
+    (the paths of the symlinks are appended to 'symlinks' if it's provided). Only the entries of the dir
+    currently being walked are held in memory. Each dir is listed in its own instrumentation span (the
+    time spent on the yielded files isn't part of it).
+    """
+    dirs_to_walk = [os.fspath(dir)]
+
+    while dirs_to_walk:
+        dir_to_walk = dirs_to_walk.pop()
+
+        try:
+            with instrumentation.span(SCAN, dir_to_walk):
+                subdirs, file_entries = list_dir(dir_to_walk, symlinks)
+        except OSError as e:
+            log.warning(f"Can't read '{e.filename}' ({e.strerror}), skipping...")
+            continue
+
+        dirs_to_walk.extend(subdirs)
+
+        for entry in file_entries:
+            if extensions is not None and path.splitext(entry.name)[1] not in extensions:
+                continue
+            elif filename_regex is not None and not filename_regex.match(entry.name):
+                continue
+            else:
+                yield Path(entry.path)
+
+
+def list_dir(dir: Union[os.PathLike, str], symlinks: Optional[List[str]] = None) -> Tuple[List[str], List[os.DirEntry]]:
+    """
+    List a single dir (not recursive). Returns the paths of the non-hidden subdirs and the entries for the
+    non-hidden files. Symlinks (to dirs or files) are skipped; their paths are appended to 'symlinks' if
+    it's provided. Raises OSError if 'dir' can't be read.
+    """
+    subdirs = []
+    file_entries = []
+
+    with os.scandir(dir) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            elif entry.is_symlink():
+                if symlinks is not None:
+                    symlinks.append(entry.path)
+            elif entry.is_dir():
+                subdirs.append(entry.path)
+            elif entry.is_file():
+                file_entries.append(entry)
+
+    return subdirs, file_entries
+
+
 def subdirs_of_dir(dir: Union[os.PathLike, str]) -> List[str]:
     """Find non-hidden subdirs in 'dir'."""
     return [file for file in _non_hidden_files_in_dir(dir) if path.isdir(file)]
 
 
+def file_content_hash(file_path: Union[os.PathLike, str]) -> str:
+    """SHA256 hex digest of the file's contents."""
+    with open(file_path, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
 def timestamp_for_filename() -> str:
     """Returns a string showing current time in a file name friendly format."""
     return datetime.now().strftime("%Y-%m-%dT%H.%M.%S")
@@ -109,6 +191,68 @@ def copy_file_creation_time(source_file: Path, destination_file: Path) -> None:
     _set_permissions(destination_file)
 
 
+def link_file(source_file: Path, destination_file: Path, link_mode: str) -> str:
+    """
+    Make destination_file a hardlink, reflink, symlink, or copy of source_file (replacing destination_file
+    if it exists). Falls back to a copy if the filesystem can't do link_mode. Returns the mode actually used.
+    """
+    if path.lexists(destination_file):
+        os.unlink(destination_file)
+
+    if link_mode != COPY:
+        try:
+            if link_mode == HARDLINK:
+                os.link(source_file, destination_file)
+            elif link_mode == REFLINK:
+                reflink(source_file, destination_file)
+            elif link_mode == SYMLINK:
+                os.symlink(path.relpath(source_file, destination_file.parent), destination_file)
+            else:
+                raise ValueError(f"Unknown link mode '{link_mode}'")
+
+            return link_mode
+        except OSError as e:
+            if link_mode not in _unavailable_link_modes:
+                log.warning(f"Failed to {link_mode} '{destination_file}' ({e}), copying instead...")
+                _unavailable_link_modes.append(link_mode)
+
+    shutil.copy2(source_file, destination_file)
+    return COPY
+
+
+def reflink(source_file: Path, destination_file: Path) -> None:
+    """Copy-on-write clone (shares the bytes on disk until one is modified). Raises OSError if unsupported."""
+    if sys.platform == 'darwin':
+        libc = ctypes.CDLL(None, use_errno=True)
+
+        if libc.clonefile(os.fsencode(source_file), os.fsencode(destination_file), 0) != 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number), str(destination_file))
+    elif sys.platform.startswith('linux'):
+        import fcntl
+
+        try:
+            with open(source_file, 'rb') as source, open(destination_file, 'wb') as destination:
+                fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+        except OSError:
+            Path(destination_file).unlink(missing_ok=True)
+            raise
+
+        shutil.copystat(source_file, destination_file)
+    else:
+        raise OSError(errno.ENOTSUP, f"reflinks aren't supported on {sys.platform}", str(destination_file))
+
+
+def break_link(file_path: Path) -> None:
+    """
+    Remove file_path if it's a symlink or one of several hardlinks so that writing to it can't
+    clobber the contents of other files.
+    """
+    if path.islink(file_path) or (path.exists(file_path) and os.stat(file_path).st_nlink > 1):
+        log.debug(f"Unlinking '{file_path}' before overwriting it...")
+        os.unlink(file_path)
+
+
 def set_timestamp_based_on_screenshot_filename(file_path: Path) -> None:
     """Infer a timestamp based on the filename and then change the 'Last Modified' property to match."""
     file_timestamp = extract_timestamp_from_filename(str(file_path))
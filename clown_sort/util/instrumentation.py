@@ -0,0 +1,255 @@
+"""
+Timing spans around each stage of sorting a file (OCR, PDF text extraction, rule matching, copying, etc.)
+so a slow run can be blamed on the right stage. Spans recorded in worker processes are sent back with
+the results (see parallel.py). --trace FILE writes each span to FILE as a line of JSON as soon as it ends
+and a summary of each stage and the slowest files is printed at the end of the run.
+
+Spans can be nested (e.g. the decode and ocr spans happen inside the sort_file span) so the totals of
+the stages add up to more than the time the run took. The slowest files are ranked by the total of their
+outermost spans.
+
+Spans aren't kept once they've been added to the summary (--watch can run forever). The percentiles come
+from a random sample of at most MAX_SAMPLES_PER_STAGE spans of each stage and only the slowest files are
+remembered once more than MAX_FILES_TRACKED files have been seen.
+"""
+import json
+import os
+import random
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from math import ceil
+from pathlib import Path
+from time import perf_counter, time
+from typing import IO, DefaultDict, Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from rich import box
+from rich.table import Table
+
+from clown_sort.util.rich_helper import console
+
+# Stages
+SCAN = 'scan'                # Listing the files in a directory
+SORT_FILE = 'sort_file'      # All of SortableFile.sort_file()
+DECODE = 'decode'            # Reading and decoding an image with Pillow
+OCR = 'ocr'                  # OCRing an image
+PDF_EXTRACT = 'pdf_extract'  # Extracting (and maybe OCRing) the text of a PDF
+NAMING = 'naming'            # Choosing the new filename from the extracted text
+RULE_MATCH = 'rule_match'    # Matching the text against the sort rules
+COPY_FILE = 'copy'           # Writing a copy to a sorted folder
+EXIF_SPLICE = 'exif_splice'  # Splicing the EXIF into a copy of an image without re-encoding it
+REENCODE = 'reencode'        # Re-encoding an image with Pillow to add the EXIF
+LINK_FILE = 'link'           # Linking to the first copy (per --link-mode)
+MOVE_FILE = 'move'           # Moving (or deleting) the original
+STAGES = [SCAN, SORT_FILE, DECODE, OCR, PDF_EXTRACT, NAMING, RULE_MATCH, COPY_FILE, EXIF_SPLICE, REENCODE, LINK_FILE, MOVE_FILE]
+
+SLOWEST_FILES_TO_SHOW = 10
+MAX_SAMPLES_PER_STAGE = 10_000
+MAX_FILES_TRACKED = 1_000
+
+
+class Span(NamedTuple):
+    stage: str
+    path: Optional[str]  # File (or dir for SCAN spans) the time was spent on
+    started_at: float    # Seconds since the epoch so spans from different processes line up
+    seconds: float
+    depth: int           # Number of spans this one is nested inside
+    pid: int
+
+    def to_json(self) -> str:
+        return json.dumps(self._asdict())
+
+
+class StageStats:
+    """Count, total, and max of a stage's spans plus a random sample of their durations (reservoir sampling)."""
+
+    def __init__(self, max_samples: int = MAX_SAMPLES_PER_STAGE) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.max_samples = max_samples
+        self.samples: List[float] = []
+
+    def add(self, seconds: float, randomizer: random.Random) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+        if len(self.samples) < self.max_samples:
+            self.samples.append(seconds)
+        else:
+            sample_index = randomizer.randrange(self.count)
+
+            if sample_index < self.max_samples:
+                self.samples[sample_index] = seconds
+
+    def percentile(self, percent: float) -> float:
+        """Exact until there are more than max_samples spans, estimated from the sample after that."""
+        return percentile(sorted(self.samples), percent)
+
+
+class Instrumentation:
+    """
+    Adds Spans to the per stage and per file totals (and writes them to the trace file if there is one).
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self, max_files_tracked: int = MAX_FILES_TRACKED) -> None:
+        self.stage_stats: Dict[str, StageStats] = {}
+        self.max_files_tracked = max_files_tracked
+        self._file_totals: Dict[str, float] = {}  # Total of the outermost spans of each file
+        self._file_stage_totals: DefaultDict[str, DefaultDict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._collected: Optional[List[Span]] = None
+        self._randomizer = random.Random()
+        self._trace_file: Optional[IO[str]] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, stage: str, path: Union[Path, str, None] = None) -> Iterator[None]:
+        """Time the body of the 'with' block as 'stage' of the work on 'path'."""
+        depth = self._depth()
+        self._local.depth = depth + 1
+        started_at = time()
+        start_time = perf_counter()
+
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            span_path = None if path is None else str(path)
+            self.record(Span(stage, span_path, started_at, perf_counter() - start_time, depth, os.getpid()))
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            if span.stage not in self.stage_stats:
+                self.stage_stats[span.stage] = StageStats()
+
+            self.stage_stats[span.stage].add(span.seconds, self._randomizer)
+
+            if span.path is not None and span.stage != SCAN:
+                self._record_file_span(span)
+
+            if self._collected is not None:
+                self._collected.append(span)
+
+            if self._trace_file is not None:
+                self._trace_file.write(span.to_json() + '\n')
+
+    def merge(self, spans: Iterable[Span]) -> None:
+        """Record spans from a worker process as if they'd happened inside whatever spans are open in this thread."""
+        depth = self._depth()
+
+        for span in spans:
+            self.record(span._replace(depth=span.depth + depth))
+
+    @contextmanager
+    def collect(self) -> Iterator[List[Span]]:
+        """Also keep the spans recorded inside the 'with' block in the yielded list (worker processes send them to the parent)."""
+        with self._lock:
+            collected, self._collected = self._collected, []
+            spans = self._collected
+
+        try:
+            yield spans
+        finally:
+            with self._lock:
+                self._collected = collected
+
+                if collected is not None:
+                    collected.extend(spans)
+
+    def reset(self) -> None:
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.stage_stats = {}
+            self._file_totals = {}
+            self._file_stage_totals.clear()
+
+    def open_trace(self, trace_path: Path) -> None:
+        """Write every span recorded from now on to trace_path as a line of JSON (overwriting the file)."""
+        self.close_trace()
+        self._trace_file = open(trace_path, 'w', buffering=1)  # Line buffered so a crash loses at most one span
+
+    def close_trace(self) -> None:
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+
+    def stages_table(self) -> Table:
+        """Count, total, and percentiles of the time spent in each stage."""
+        table = Table('Stage', 'Count', 'Total', 'p50', 'p95', 'Max', title='Time spent in each stage', box=box.SIMPLE)
+
+        for stage in sorted(self.stage_stats.keys(), key=_stage_order):
+            stats = self.stage_stats[stage]
+            durations = [stats.percentile(50), stats.percentile(95), stats.max]
+            table.add_row(stage, str(stats.count), f"{stats.total:.3f} s", *[f"{s * 1000:.1f} ms" for s in durations])
+
+        return table
+
+    def slowest_files_table(self, count: int = SLOWEST_FILES_TO_SHOW) -> Table:
+        """The files that took the longest and which stage took the longest for each of them."""
+        table = Table('File', 'Total', 'Slowest Stage', title=f"Slowest {count} files", box=box.SIMPLE)
+
+        with self._lock:
+            totals = dict(self._file_totals)
+            stage_totals = {path: dict(self._file_stage_totals[path]) for path in totals}
+
+        for path in sorted(totals.keys(), key=lambda p: totals[p], reverse=True)[:count]:
+            slowest_stage = max(stage_totals[path].items(), key=lambda item: item[1], default=None)
+            slowest_stage_str = '' if slowest_stage is None else f"{slowest_stage[0]} ({slowest_stage[1]:.3f} s)"
+            table.add_row(Path(path).name, f"{totals[path]:.3f} s", slowest_stage_str)
+
+        return table
+
+    def print_summary(self) -> None:
+        """Print the stage and slowest files tables (if anything was recorded)."""
+        if len(self.stage_stats) == 0:
+            return
+
+        console.print(self.stages_table())
+        slowest_files_table = self.slowest_files_table()
+
+        if slowest_files_table.row_count > 0:
+            console.print(slowest_files_table)
+
+    def _record_file_span(self, span: Span) -> None:
+        """Add span to the totals of its file. Must be called with the lock held."""
+        if span.depth == 0:
+            self._file_totals[span.path] = self._file_totals.get(span.path, 0.0) + span.seconds
+
+            if len(self._file_totals) > self.max_files_tracked:
+                self._forget_fastest_files()
+
+        if span.stage != SORT_FILE:
+            self._file_stage_totals[span.path][span.stage] += span.seconds
+
+    def _forget_fastest_files(self) -> None:
+        """Keep the slowest half of the files (and the stage totals of files whose outermost span is still open)."""
+        slowest_paths = sorted(self._file_totals.keys(), key=lambda p: self._file_totals[p], reverse=True)
+
+        for path in slowest_paths[self.max_files_tracked // 2:]:
+            del self._file_totals[path]
+            self._file_stage_totals.pop(path, None)
+
+        # Stage totals of files that never got an outermost span of their own would otherwise pile up
+        orphaned_paths = [path for path in self._file_stage_totals if path not in self._file_totals]
+
+        for path in orphaned_paths[:-self.max_files_tracked] if len(orphaned_paths) > self.max_files_tracked else []:
+            del self._file_stage_totals[path]
+
+    def _depth(self) -> int:
+        return getattr(self._local, 'depth', 0)
+
+
+def percentile(sorted_durations: List[float], percent: float) -> float:
+    """Nearest rank percentile of a sorted non-empty list."""
+    return sorted_durations[max(0, ceil(percent / 100 * len(sorted_durations)) - 1)]
+
+
+def _stage_order(stage: str) -> int:
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
+
+
+instrumentation = Instrumentation()
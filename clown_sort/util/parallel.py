@@ -0,0 +1,129 @@
+"""
+Helpers for fanning work out to a pool of worker processes.
+"""
+import atexit
+import multiprocessing
+import pickle
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
+
+from clown_sort.config import Config
+from clown_sort.util.instrumentation import Span, instrumentation
+
+# How many tasks per worker to keep queued up ahead of the results being consumed
+TASKS_PER_WORKER = 4
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+_shared_pool: Optional[Tuple[bytes, ProcessPoolExecutor]] = None  # (jobs and worker state it was started with, pool)
+_shared_pool_lock = threading.Lock()
+
+
+def process_pool(jobs: int) -> ProcessPoolExecutor:
+    """
+    A pool of 'jobs' worker processes configured like the current process. 'spawn' is used on all
+    platforms because forking a process that has open SQLite connections and threads is unsafe.
+    """
+    return ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=Config.load_worker_state,
+        initargs=(Config.worker_state(),)
+    )
+
+
+def shared_process_pool(jobs: int) -> ProcessPoolExecutor:
+    """
+    A process_pool(jobs) that's started the first time it's needed and reused until the process exits.
+    Starting spawned workers (a fresh interpreter that has to import clown_sort) can take longer than the
+    work itself, e.g. extracting the text of a short PDF. If the Config has changed since the pool was
+    started (e.g. --watch reloaded the rules) it's replaced by one with the current Config.
+    """
+    global _shared_pool
+    pool_key = pickle.dumps((jobs, Config.worker_state()))
+
+    with _shared_pool_lock:
+        if _shared_pool is not None and _shared_pool[0] != pool_key:
+            _shared_pool[1].shutdown(wait=False)  # Work already submitted to the old pool still finishes
+            _shared_pool = None
+
+        if _shared_pool is None:
+            _shared_pool = (pool_key, process_pool(jobs))
+
+        return _shared_pool[1]
+
+
+@atexit.register
+def shutdown_shared_pool() -> None:
+    global _shared_pool
+
+    with _shared_pool_lock:
+        if _shared_pool is not None:
+            _shared_pool[1].shutdown(wait=True, cancel_futures=True)
+            _shared_pool = None
+
+
+def parallel_map_in_order(
+        fxn: Callable[[T], R],
+        items: Iterable[T],
+        jobs: int,
+        should_submit: Optional[Callable[[T], bool]] = None,
+        reuse_pool: bool = False
+) -> Iterator[Union[T, R]]:
+    """
+    Like map() except fxn is run in 'jobs' worker processes. Results are yielded in the same order as
+    'items' as soon as they're ready. Items for which should_submit() returns False are yielded as is.
+    Instrumentation spans recorded in the workers are merged into this process's as each result is yielded.
+    At most jobs * TASKS_PER_WORKER tasks are outstanding at any time so memory use stays bounded.
+    If reuse_pool is True the work runs in shared_process_pool(jobs), which is left running afterwards.
+    """
+    pool = shared_process_pool(jobs) if reuse_pool else process_pool(jobs)
+    pending: Deque[Tuple[T, Optional[Future]]] = deque()
+    items = iter(items)
+
+    def fill_queue() -> None:
+        while len(pending) < jobs * TASKS_PER_WORKER:
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+
+            if should_submit is None or should_submit(item):
+                pending.append((item, pool.submit(_call_with_spans, fxn, item)))
+            else:
+                pending.append((item, None))
+
+    try:
+        fill_queue()
+
+        while pending:
+            item, future = pending.popleft()
+
+            if future is None:
+                result = item
+            else:
+                result, spans = future.result()
+                instrumentation.merge(spans)
+
+            fill_queue()
+            yield result
+    finally:
+        # If the caller stopped early (e.g. an exception or sys.exit()) queued work is cancelled but the tasks
+        # that are already running are waited for (unless the pool is shared, in which case they're abandoned)
+        if reuse_pool:
+            for _item, future in pending:
+                if future is not None:
+                    future.cancel()
+        else:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _call_with_spans(fxn: Callable[[T], R], item: T) -> Tuple[R, List[Span]]:
+    """Runs in a worker process. Returns fxn(item) and the instrumentation spans recorded while it ran."""
+    with instrumentation.collect() as spans:
+        result = fxn(item)
+
+    return result, spans
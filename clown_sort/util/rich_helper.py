@@ -82,8 +82,8 @@ def indent_whitespace(indent_level: int = 1):
     return ' ' * INDENT_SPACES * indent_level
 
 
-def copying_file_log_message(basename: str, new_file: Path) -> Text:
-    return _file_operation_log_message(basename, new_file, 'Copying')
+def copying_file_log_message(basename: str, new_file: Path, verb: str = 'Copying') -> Text:
+    return _file_operation_log_message(basename, new_file, verb)
 
 
 def moving_file_log_message(basename: str, new_file: Path) -> Text:
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Time FilenameExtractor on adversarial OCR text (text that almost looks like a tweet or reddit post) of
+increasing length to check that choosing a filename takes time proportional to the length of the text.
+The tweet and reddit detectors are also timed on the whole text (FilenameExtractor only gives them
+the first DETECTION_WINDOW_CHARS). The time per KB should stay about the same as the text gets longer.
+
+Usage: python scripts/benchmark_filename_extractor.py [--max-kb 512]
+"""
+from argparse import ArgumentParser
+from os import environ
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict
+
+environ['INVOKED_BY_PYTEST'] = 'True'  # Don't load .clown_sort dotenv files
+
+from clown_sort.filename_extractor import (FilenameExtractor, find_reddit_post, find_reddit_reply, find_tweet,
+     find_tweet_reply)
+from clown_sort.files.image_file import ImageFile
+
+FIXTURE = Path(__file__).parent.parent.joinpath('tests', 'fixtures', 'do_kwon_debate_the_poor.jpeg')
+ITERATIONS = 3
+DETECTORS = [find_tweet, find_tweet_reply, find_reddit_post, find_reddit_reply]
+
+
+def _repeated(snippet: str, suffix: str = '') -> Callable[[int], str]:
+    return lambda size: snippet * (size // len(snippet)) + suffix
+
+
+ADVERSARIAL_TEXTS: Dict[str, Callable[[int], str]] = {
+    'reddit replies after the footer': lambda size: 'Give Award Share Report\n' + _repeated('someone - 5 days ago x\n')(size),
+    'words then a footer': _repeated('lorem ipsum dolor ', '\nReply Give Award Share Report'),
+    'dashes then a footer': _repeated('word - ', 'Give Award Share Report'),
+    'reddit replies on one line': _repeated('someone - 5 days ago ', 'Give Award Share Report'),
+    'tweet headers on one line': _repeated('@abcdef - 5h '),
+    'reddit posts on one line': _repeated('Posted by u/someone 5 '),
+    'tweet replies on one line': _repeated('Replying to @abcdef '),
+    'retweeted on one line': _repeated('Someone Retweetedd '),
+    'one long word': _repeated('x'),
+}
+
+
+def best_time(fxn: Callable[[], object]) -> float:
+    """Fastest of ITERATIONS runs in seconds."""
+    times = []
+
+    for _i in range(ITERATIONS):
+        start_time = perf_counter()
+        fxn()
+        times.append(perf_counter() - start_time)
+
+    return min(times)
+
+
+def timing_str(secs: float, size: int) -> str:
+    return f"{secs * 1000:8.2f} ms ({secs * 1000 * 1024 / size:6.3f})"
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    arg_parser.add_argument('--max-kb', type=int, default=512, help='length of the longest text to try')
+    args = arg_parser.parse_args()
+    image_file = ImageFile(FIXTURE)
+    image_file.text_extraction_attempted = True
+    sizes = [1024 * kb for kb in [1, 4, 16, 64, 256, 1024, 4096] if kb <= args.max_kb]
+    print(f"Best of {ITERATIONS} runs (ms per KB of text in parentheses)\n")
+
+    for name, text_generator in ADVERSARIAL_TEXTS.items():
+        timings = []
+
+        for size in sizes:
+            text = text_generator(size)
+            image_file._extracted_text = text
+            filename_secs = best_time(lambda: FilenameExtractor(image_file).filename())
+            detector_secs = best_time(lambda: [detector(text) for detector in DETECTORS])
+            timings.append(f"{size // 1024:>5} KB   filename {timing_str(filename_secs, size)}   detectors {timing_str(detector_secs, size)}")
+
+        print(f"{name}:\n  " + '\n  '.join(timings))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Compare OCRing images as is against OCRing them after --ocr-preprocess (with and without --ocr-binarize and
+--ocr-crop-margins). Reports the OCR time and how similar the preprocessed text is to the original text.
+
+Usage: python scripts/benchmark_ocr_preprocessing.py [--ocr-engine tesserocr] [IMAGE_OR_DIR ...]
+(defaults to the images in tests/fixtures)
+"""
+import sys
+from argparse import ArgumentParser
+from difflib import SequenceMatcher
+from os import environ
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+environ['INVOKED_BY_PYTEST'] = 'True'  # Don't load .clown_sort dotenv files
+
+from PIL import Image
+
+from clown_sort.lib.ocr_engine import DEFAULT_OCR_ENGINE, OCR_ENGINE_NAMES, ocr_engine
+from clown_sort.lib.ocr_preprocessing import OcrPreprocessing, preprocess_for_ocr
+from clown_sort.util.filesystem_helper import files_in_dir, is_image
+
+FIXTURES_DIR = Path(__file__).parent.parent.joinpath('tests', 'fixtures')
+ITERATIONS = 3
+
+PREPROCESSINGS = {
+    'preprocess': OcrPreprocessing(),
+    'preprocess + binarize': OcrPreprocessing(binarize=True),
+    'preprocess + crop': OcrPreprocessing(crop_margins=True),
+    'all': OcrPreprocessing(binarize=True, crop_margins=True),
+}
+
+
+def image_paths(paths: List[str]) -> List[Path]:
+    image_paths = []
+
+    for path in [Path(p) for p in paths] or [FIXTURES_DIR]:
+        image_paths.extend(sorted(Path(p) for p in files_in_dir(path) if is_image(p)) if path.is_dir() else [path])
+
+    return image_paths
+
+
+def timed_ocr(ocr: Callable[[Image.Image], str], image: Image.Image) -> Tuple[float, str]:
+    """Fastest of ITERATIONS runs (in seconds) and the OCR text."""
+    times = []
+
+    for _i in range(ITERATIONS):
+        start_time = perf_counter()
+        text = ocr(image)
+        times.append(perf_counter() - start_time)
+
+    return min(times), text.strip()
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    arg_parser.add_argument('images', nargs='*', metavar='IMAGE_OR_DIR')
+    arg_parser.add_argument('--ocr-engine', choices=OCR_ENGINE_NAMES, default=DEFAULT_OCR_ENGINE)
+    args = arg_parser.parse_args()
+    engine = ocr_engine(args.ocr_engine)
+
+    if engine.cache_key() is None:
+        print(f"OCR engine '{args.ocr_engine}' isn't available (is tesseract installed?)")
+        sys.exit(-1)
+
+    print(f"Benchmarking {engine.cache_key()} (best of {ITERATIONS} runs)\n")
+    totals = {label: 0.0 for label in ['original'] + list(PREPROCESSINGS.keys())}
+
+    for image_path in image_paths(args.images):
+        with Image.open(image_path) as image:
+            image.load()
+
+        original_secs, original_text = timed_ocr(engine.image_to_string, image)
+        totals['original'] += original_secs
+        print(f"{image_path.name} ({image.size[0]}x{image.size[1]} {image.mode}): original {original_secs * 1000:8.1f} ms")
+
+        for label, preprocessing in PREPROCESSINGS.items():
+            ocr = lambda img: engine.image_to_string(preprocess_for_ocr(img, preprocessing))
+            secs, text = timed_ocr(ocr, image)
+            totals[label] += secs
+            similarity = SequenceMatcher(None, original_text, text).ratio()
+            print(f"  {label:>22}: {secs * 1000:8.1f} ms   speedup {original_secs / secs:5.2f}x   text similarity {similarity:6.1%}")
+
+    print('\nTotals:')
+
+    for label, secs in totals.items():
+        print(f"  {label:>22}: {secs * 1000:8.1f} ms")
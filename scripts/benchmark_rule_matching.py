@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Compare the compiled RuleSet against evaluating every sort rule's regex one by one.
+
+Usage: python scripts/benchmark_rule_matching.py [RULES_FILE.CSV]
+"""
+import random
+import sys
+from os import environ
+from pathlib import Path
+from timeit import timeit
+
+environ['INVOKED_BY_PYTEST'] = 'True'  # Don't load .clown_sort dotenv files
+
+from clown_sort.config import Config
+from clown_sort.lib.rule_match import RuleMatch
+from clown_sort.lib.rule_set import RuleSet
+from clown_sort.sort_rule import CRYPTO_RULES_CSV_PATH, SortRule
+
+ITERATIONS = 20
+WORDS = 'the a of to and in is it that for on was with he as at by this had not but from or have were'.split()
+
+TWEET_TEXT = """Wu Blockchain @ @WuBlockchain - 21m
+a16z voted 15 million UNI against the final proposal to deploy Uniswap V3
+on BNB Chain proposed by OxPlasma Labs. The proposal uses Wormhole
+as a cross-chain bridge. a16z opposes the use of Wormhole."""
+
+# Curly quotes, middle dots, and emoji are in nearly all real tweets and OCR output
+NON_ASCII_SUFFIX = ' · “a16z’s vote” 🦄'
+
+
+def legacy_rule_matches(search_text: str) -> list:
+    """The original implementation: two regex searches per rule per variant of the text."""
+    def raw_matches(text):
+        return [(sr.folder, sr.regex.search(text)) for sr in Config.sort_rules if sr.regex.search(text)]
+
+    if '_' not in search_text:
+        return raw_matches(search_text)
+
+    matched_rules = raw_matches(search_text) + raw_matches(search_text.replace('_', ' '))
+    return list({folder: (folder, match) for folder, match in matched_rules}.values())
+
+
+def long_ocr_text(num_chars: int) -> str:
+    """Pseudo OCR text with a sprinkling of underscores and a couple of rule hits."""
+    random.seed(42)
+    words = []
+
+    while sum(len(w) + 1 for w in words) < num_chars:
+        words.append(random.choice(WORDS + ['Tether', 'some_thing', 'Binance']) if random.random() < 0.02 else random.choice(WORDS))
+
+    return ' '.join(words)
+
+
+def benchmark(label: str, search_text: str) -> None:
+    assert [f for f, _m in legacy_rule_matches(search_text)] == [rm.folder for rm in RuleMatch.get_rule_matches(search_text)]
+    legacy_secs = timeit(lambda: legacy_rule_matches(search_text), number=ITERATIONS) / ITERATIONS
+    rule_set_secs = timeit(lambda: RuleMatch.get_rule_matches(search_text), number=ITERATIONS) / ITERATIONS
+    print(f"{label:>22}: legacy {legacy_secs * 1000:9.2f} ms   rule set {rule_set_secs * 1000:9.2f} ms   ", end='')
+    print(f"speedup {legacy_secs / rule_set_secs:6.1f}x")
+
+
+if __name__ == '__main__':
+    rules_csv = Path(sys.argv[1]) if len(sys.argv) > 1 else CRYPTO_RULES_CSV_PATH
+    Config.sort_rules = SortRule.load_rules_csv(rules_csv)
+    Config.rule_set = RuleSet(Config.sort_rules)
+    print(f"Benchmarking {len(Config.sort_rules)} rules from '{rules_csv}' ({ITERATIONS} iterations each)\n")
+    benchmark('tweet', TWEET_TEXT)
+    benchmark('non-ASCII tweet', TWEET_TEXT + NON_ASCII_SUFFIX)
+
+    for num_chars in [5_000, 50_000, 250_000]:
+        benchmark(f"{num_chars:,} char OCR text", long_ocr_text(num_chars))
+        benchmark(f"{num_chars:,} char non-ASCII", long_ocr_text(num_chars) + NON_ASCII_SUFFIX)
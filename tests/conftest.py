@@ -8,6 +8,7 @@
 
 from os import environ, path, pardir
 from pathlib import Path
+from typing import List
 environ['INVOKED_BY_PYTEST'] = 'True'
 
 import pytest
@@ -57,3 +58,37 @@ def three_of_swords_file():
 @pytest.fixture(scope='session')
 def unicode_filename():
     return FIXTURES_DIR.joinpath('Déltèç_bank_sücks.png')
+
+
+@pytest.fixture(scope='session')
+def build_pdf():
+    return _build_pdf
+
+
+def _build_pdf(pdf_path: Path, page_texts: List[str]) -> Path:
+    """Write a minimal PDF with one line of text on each page."""
+    page_ids = [4 + 2 * i for i in range(len(page_texts))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % i for i in page_ids) + b"] /Count %d >>" % len(page_ids),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+
+    for page_id, text in zip(page_ids, page_texts):
+        stream = b"BT /F1 24 Tf 72 720 Td (" + text.encode() + b") Tj ET"
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (page_id + 1))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+
+    xref_offset = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    pdf_path.write_bytes(pdf)
+    return pdf_path
@@ -1,7 +1,13 @@
 from shutil import rmtree
+from unittest.mock import patch
+
+from PIL import Image
 
 from clown_sort.config import Config
-from clown_sort.files.image_file import IMAGE_DESCRIPTION, ImageFile
+from clown_sort.files.image_file import EXIF_CODES, IMAGE_DESCRIPTION, ImageFile
+from clown_sort.lib.extraction_cache import ExtractionCache
+from clown_sort.lib.ocr_engine import OcrEngine, OcrError
+from clown_sort.util.constants import QUICK, SKIP
 
 from tests.test_config import *
 
@@ -18,3 +24,100 @@ def test_extracted_text_and_move(do_kwon_tweet, turn_off_dry_run):
     assert(new_file.new_basename() == SORTED_FILENAME)  # Check that it doesn't try to re-rename the file
     new_file.file_path.unlink()
     rmtree(new_file.file_path.parent)
+
+
+class CountingOcrEngine(OcrEngine):
+    """Returns OCR text if the image is at least min_width pixels wide and counts calls."""
+    def __init__(self, min_width: int = 0) -> None:
+        super().__init__()
+        self.min_width = min_width
+        self.image_widths = []
+
+    def image_to_string(self, image) -> str:
+        self.image_widths.append(image.size[0])
+        return 'Tether printed another billion' if image.size[0] >= self.min_width else ''
+
+    def engine_version(self) -> str:
+        return '1.0'
+
+
+class FailingOcrEngine(CountingOcrEngine):
+    def image_to_string(self, image) -> str:
+        raise OcrError('tesseract had a bad day')
+
+
+def test_failed_ocr_is_not_cached(tmp_path, do_kwon_tweet, monkeypatch):
+    monkeypatch.setattr(Config, 'extraction_cache', ExtractionCache(tmp_path.joinpath('cache.sqlite')))
+    monkeypatch.setattr(ImageFile, '_text_extractor_key', lambda _self: 'test engine')
+
+    try:
+        with patch('clown_sort.files.image_file.ocr_engine', return_value=FailingOcrEngine()):
+            image_file = ImageFile(do_kwon_tweet)
+            assert image_file.extracted_text() is None
+            image_file.cache_extracted_text()
+
+        assert not ImageFile(do_kwon_tweet).load_cached_text()
+
+        with patch('clown_sort.files.image_file.ocr_engine', return_value=CountingOcrEngine()):
+            assert ImageFile(do_kwon_tweet).extracted_text() == 'Tether printed another billion'
+
+        assert ImageFile(do_kwon_tweet).load_cached_text()
+    finally:
+        Config.extraction_cache.close()
+
+
+def test_text_detection_skips_ocr():
+    blank_image = Image.new('RGB', (800, 600), 'white')
+
+    for text_detection, expected_widths in [(None, [800]), (SKIP, []), (QUICK, [400])]:
+        ocr_engine = CountingOcrEngine(min_width=600)
+        Config.text_detection = text_detection
+
+        try:
+            with patch('clown_sort.files.image_file.ocr_engine', return_value=ocr_engine):
+                ImageFile.ocr_text(blank_image, 'blank.png')
+        finally:
+            Config.text_detection = None
+
+        assert ocr_engine.image_widths == expected_widths
+
+    # If the quick pass finds text the image gets a full OCR
+    ocr_engine = CountingOcrEngine()
+    Config.text_detection = QUICK
+
+    try:
+        with patch('clown_sort.files.image_file.ocr_engine', return_value=ocr_engine):
+            assert ImageFile.ocr_text(blank_image, 'blank.png') == 'Tether printed another billion'
+    finally:
+        Config.text_detection = None
+
+    assert ocr_engine.image_widths == [400, 800]
+
+
+def test_only_images_that_get_ocrd_are_preprocessed(monkeypatch):
+    blank_image = Image.new('RGB', (800, 600), 'white')
+    monkeypatch.setattr(Config, 'ocr_preprocess', True)
+
+    for text_detection, expected_calls in [(None, 1), (SKIP, 0), (QUICK, 1)]:
+        monkeypatch.setattr(Config, 'text_detection', text_detection)
+
+        with patch('clown_sort.files.image_file.ocr_engine', return_value=CountingOcrEngine(min_width=600)), \
+                patch('clown_sort.files.image_file.preprocess_for_ocr', side_effect=lambda image, _p: image) as preprocess:
+            ImageFile.ocr_text(blank_image, 'blank.png')
+
+        assert preprocess.call_count == expected_calls
+
+
+def test_copy_doesnt_modify_original_exif(tmp_path, parrot_retweet, monkeypatch):
+    monkeypatch.setattr(Config, 'dry_run', False)
+    image_file = ImageFile(parrot_retweet)
+    image_file.borrow_extracted_text('Tether printed another billion')
+    destination_path = tmp_path.joinpath(parrot_retweet.name)
+    image_file.copy_file_to_sorted_dir(destination_path)
+
+    with Image.open(destination_path) as copy:
+        assert copy.getexif()[EXIF_CODES[IMAGE_DESCRIPTION]] == 'Tether printed another billion'
+
+    assert EXIF_CODES[IMAGE_DESCRIPTION] not in image_file.raw_exif_dict()
+    assert 'ImageDescription' not in image_file.exif_dict()
+    image_file.release_resources()
@@ -0,0 +1,218 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from rich import box
+from rich.console import Console
+from rich.panel import Panel
+
+from clown_sort.config import Config
+from clown_sort.files import pdf_file as pdf_file_module
+from clown_sort.files.pdf_file import ExtractedPage, PdfFile
+from clown_sort.lib.extraction_cache import ExtractionCache
+from clown_sort.lib.page_range import PageRange
+from clown_sort.lib.pdf_page_extractor import ALWAYS, DEFAULT_PDF_OCR_POLICY
+from clown_sort.screenshot_sorter import _extract_text_and_new_basename
+from clown_sort.util.parallel import parallel_map_in_order
+
+PAGE_COUNT = 9
+
+
+def test_page_batches(tmp_path, build_pdf):
+    pdf_file = PdfFile(build_pdf(tmp_path.joinpath('report.pdf'), [f"Page {i}" for i in range(1, PAGE_COUNT + 1)]))
+    Config.pdf_page_jobs = 2
+
+    try:
+        assert pdf_file._page_batches(list(range(1, PAGE_COUNT + 1))) == [[1, 2], [3, 4], [5, 6], [7, 8], [9]]
+        assert pdf_file._page_batches([3, 4, 6, 7]) == [[3], [4], [6], [7]]
+    finally:
+        Config.pdf_page_jobs = 1
+
+
+def test_page_parallel_extraction(tmp_path, build_pdf):
+    pdf_path = build_pdf(tmp_path.joinpath('report.pdf'), [f"Page {i}" for i in range(1, PAGE_COUNT + 1)])
+    serial_text = PdfFile(pdf_path).extracted_text()
+    Config.pdf_page_jobs = 2
+
+    try:
+        assert PdfFile(pdf_path).extracted_text() == serial_text
+        range_text = PdfFile(pdf_path).extracted_text(PageRange('2-4'))
+    finally:
+        Config.pdf_page_jobs = 1
+
+    assert range_text == PdfFile(pdf_path).extracted_text(PageRange('2-4'))
+
+    assert serial_text.index('Page 1') < serial_text.index('Page 5') < serial_text.index('Page 9')
+
+
+def test_search_text_limits(tmp_path, build_pdf):
+    pdf_path = build_pdf(tmp_path.joinpath('report.pdf'), ['Tether report', 'Binance', 'Celsius', 'Page 4'])
+    assert 'Page 4' in PdfFile(pdf_path).search_text()
+
+    for limit, value, last_page_extracted in [('pdf_max_pages', 2, 'Binance'), ('pdf_max_chars', 20, 'Binance'), ('pdf_stop_after_folders', 3, 'Celsius')]:
+        setattr(Config, limit, value)
+
+        try:
+            pdf_file = PdfFile(pdf_path)
+            search_text = pdf_file.search_text()
+            assert search_text.startswith('report Tether report')
+            assert search_text.rstrip().endswith(last_page_extracted)
+            assert not pdf_file.text_extraction_attempted
+            assert 'Page 4' in pdf_file.extracted_text()
+        finally:
+            setattr(Config, limit, None)
+
+
+def test_stop_after_folders_in_worker_process(tmp_path, build_pdf):
+    pdf_path = build_pdf(tmp_path.joinpath('report.pdf'), ['Tether report', 'Binance', 'Celsius', 'Page 4'])
+    Config.pdf_stop_after_folders = 3
+
+    try:
+        pdf_file = list(parallel_map_in_order(_extract_text_and_new_basename, [PdfFile(pdf_path)], 2))[0]
+        assert pdf_file.search_text().rstrip().endswith('Celsius')
+        assert not pdf_file.text_extraction_attempted
+    finally:
+        Config.pdf_stop_after_folders = None
+
+
+def test_page_ranges_share_cached_pages(tmp_path, build_pdf):
+    pdf_path = build_pdf(tmp_path.joinpath('report.pdf'), [f"Page {i}" for i in range(1, PAGE_COUNT + 1)])
+    full_text = PdfFile(pdf_path).extracted_text()
+    Config.extraction_cache = ExtractionCache(tmp_path.joinpath('cache.sqlite'))
+    extracted_page_numbers = []
+    extract_pages = pdf_file_module._extract_pages
+
+    def recording_extract_pages(file_path, page_numbers, print_as_parsed):
+        extracted_page_numbers.append(list(page_numbers))
+        return extract_pages(file_path, page_numbers, print_as_parsed)
+
+    try:
+        with patch.object(pdf_file_module, '_extract_pages', recording_extract_pages), \
+                patch.object(PdfFile, '_text_extractor_key', lambda _self: 'pypdf test'):
+            pdf_file = PdfFile(pdf_path)
+            assert pdf_file.extracted_text(PageRange('2-4')) == 'Page 2\n\n\nPage 3'
+            # A different range asked for later isn't answered with the text of the first range
+            assert pdf_file.extracted_text(PageRange('3-5')) == 'Page 3\n\n\nPage 4'
+            assert pdf_file.extracted_text() == full_text
+            assert extracted_page_numbers == [[2, 3], [4], [1] + list(range(5, PAGE_COUNT + 1))]
+
+            # A new run finds every page in the persistent cache
+            extracted_page_numbers.clear()
+            pdf_file = PdfFile(pdf_path)
+            assert pdf_file.load_cached_text()
+            assert pdf_file.extracted_text() == full_text
+            assert PdfFile(pdf_path).extracted_text(PageRange('5-7')) == 'Page 5\n\n\nPage 6'
+            assert all(len(page_numbers) == 0 for page_numbers in extracted_page_numbers)
+    finally:
+        Config.extraction_cache.close()
+        Config.extraction_cache = None
+
+
+def test_pages_with_errors_are_not_cached(tmp_path, build_pdf):
+    pdf_path = build_pdf(tmp_path.joinpath('report.pdf'), ['Page 1', 'Page 2', 'Page 3'])
+    Config.extraction_cache = ExtractionCache(tmp_path.joinpath('cache.sqlite'))
+    extract_pages = pdf_file_module._extract_pages
+
+    def failing_page_2(file_path, page_numbers, print_as_parsed):
+        for extracted_page in extract_pages(file_path, page_numbers, print_as_parsed):
+            yield extracted_page._replace(text='', had_error=True) if extracted_page.page_number == 2 else extracted_page
+
+    try:
+        with patch.object(PdfFile, '_text_extractor_key', lambda _self: 'pypdf test'):
+            with patch.object(pdf_file_module, '_extract_pages', failing_page_2):
+                assert PdfFile(pdf_path).extracted_text() == 'Page 1\n\n\nPage 3'
+
+            # Same thing for pages extracted in a worker process and cached by the parent
+            pdf_file = PdfFile(pdf_path)
+            pdf_file._page_count = 3
+            pdf_file._record_page(ExtractedPage(1, 'Page 1'))
+            pdf_file._record_page(ExtractedPage(2, '', had_error=True))
+            pdf_file.cache_extracted_text()
+
+            pdf_file = PdfFile(pdf_path)
+            assert not pdf_file.load_cached_text()
+            assert sorted(pdf_file._page_texts) == [1, 3]
+            assert pdf_file.extracted_text() == 'Page 1\n\n\nPage 2\n\n\nPage 3'
+    finally:
+        Config.extraction_cache.close()
+        Config.extraction_cache = None
+
+
+def test_thumbnails_are_rendered_one_at_a_time(tmp_path, build_pdf):
+    pdf_path = build_pdf(tmp_path.joinpath('report.pdf'), ['Page 1'])
+    rendering = []
+    max_rendering = []
+
+    def slow_render(_self):
+        rendering.append(1)
+        max_rendering.append(len(rendering))
+        time.sleep(0.01)
+        rendering.pop()
+        return b'thumbnail'
+
+    with patch.object(PdfFile, '_render_thumbnail', slow_render), ThreadPoolExecutor(max_workers=4) as executor:
+        thumbnails = list(executor.map(lambda _i: PdfFile(pdf_path).thumbnail_bytes(), range(8)))
+
+    assert thumbnails == [b'thumbnail'] * 8
+    assert max(max_rendering) == 1
+
+
+class FakePdfalyzerFile:
+    """Formats the text of each page the way pdfalyzer does and records the page ranges it's asked for."""
+    page_ranges = []
+    panel_box = box.ROUNDED
+
+    def __init__(self, file_path):
+        pass
+
+    def extract_text(self, page_range, logger=None, print_as_parsed=False):
+        FakePdfalyzerFile.page_ranges.append(page_range.to_tuple())
+        extracted_pages = []
+
+        for page_number in range(*page_range.to_tuple()):
+            if page_number > PAGE_COUNT:
+                break
+
+            page_buffer = Console(file=io.StringIO())
+            page_buffer.print(Panel(f"PAGE {page_number}", box=self.panel_box, padding=(0, 15), expand=False))
+            page_buffer.print(f"Page {page_number}\n\n\nstill page {page_number}")
+            extracted_pages.append(page_buffer.file.getvalue())
+
+        return "\n\n".join(extracted_pages).strip()
+
+
+def test_pdf_ocr_always_extracts_chunks_of_pages(tmp_path, build_pdf):
+    pdf_path = build_pdf(tmp_path.joinpath('report.pdf'), [f"Page {i}" for i in range(1, PAGE_COUNT + 1)])
+    single_page_texts = [FakePdfalyzerFile(pdf_path).extract_text(PageRange(str(i))) for i in range(1, PAGE_COUNT + 1)]
+    FakePdfalyzerFile.page_ranges.clear()
+    Config.pdf_ocr = ALWAYS
+
+    try:
+        with patch.object(pdf_file_module, 'PdfalyzerFile', FakePdfalyzerFile):
+            pages = list(pdf_file_module._extract_pages(pdf_path, list(range(1, PAGE_COUNT + 1)), False))
+    finally:
+        Config.pdf_ocr = DEFAULT_PDF_OCR_POLICY
+
+    assert [page.text for page in pages] == single_page_texts
+    assert FakePdfalyzerFile.page_ranges == [(1, 2), (2, 4), (4, 8), (8, 10)]
+
+
+def test_pdf_ocr_always_unsplittable_chunks(tmp_path, build_pdf):
+    class SquarePanelPdfalyzerFile(FakePdfalyzerFile):
+        panel_box = box.SQUARE
+
+    pdf_path = build_pdf(tmp_path.joinpath('report.pdf'), [f"Page {i}" for i in range(1, 4)])
+    single_page_texts = [SquarePanelPdfalyzerFile(pdf_path).extract_text(PageRange(str(i))) for i in range(1, 4)]
+    FakePdfalyzerFile.page_ranges.clear()
+    Config.pdf_ocr = ALWAYS
+
+    try:
+        with patch.object(pdf_file_module, 'PdfalyzerFile', SquarePanelPdfalyzerFile):
+            pages = list(pdf_file_module._extract_pages(pdf_path, [1, 2, 3], False))
+    finally:
+        Config.pdf_ocr = DEFAULT_PDF_OCR_POLICY
+
+    # The 2-3 chunk can't be split on the panels so its pages are extracted one at a time
+    assert [page.text for page in pages] == single_page_texts
+    assert FakePdfalyzerFile.page_ranges == [(1, 2), (2, 4), (2, 3), (3, 4)]
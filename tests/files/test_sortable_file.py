@@ -1,6 +1,12 @@
+import os
+from shutil import copy2
+
 from clown_sort.config import Config
+from clown_sort.files import image_file
 from clown_sort.files.image_file import ImageFile
 from clown_sort.files.sortable_file import SortableFile
+from clown_sort.lib.sorted_manifest import SortedManifest
+from clown_sort.util.filesystem_helper import COPY, HARDLINK, file_content_hash
 
 from tests.test_config import *
 
@@ -27,3 +33,38 @@ def test_unidecode_filename(unicode_filename, turn_off_dry_run):
     new_file.file_path.unlink()
     new_file.file_path.parent.rmdir()
     Config.debug = False
+
+
+def test_sorted_copies_are_hashed_once(tmp_path, do_kwon_tweet, monkeypatch):
+    hashed_paths = []
+
+    def count_hashes(file_path):
+        hashed_paths.append(file_path)
+        return file_content_hash(file_path)
+
+    monkeypatch.setattr(image_file, 'file_content_hash', count_hashes)
+    monkeypatch.setattr(Config, 'dry_run', False)
+
+    for link_mode in [HARDLINK, COPY]:
+        copy_paths = [tmp_path.joinpath(link_mode, folder, do_kwon_tweet.name) for folder in ['Tether', 'Binance', 'Luna']]
+
+        for copy_path in copy_paths:
+            copy_path.parent.mkdir(parents=True)
+
+        copy2(do_kwon_tweet, copy_paths[0])
+
+        for copy_path in copy_paths[1:]:
+            if link_mode == HARDLINK:
+                os.link(copy_paths[0], copy_path)
+            else:
+                copy2(copy_paths[0], copy_path)
+
+        hashed_paths.clear()
+        monkeypatch.setattr(Config, 'sorted_manifest', SortedManifest(tmp_path.joinpath(link_mode, 'manifest.sqlite')))
+        monkeypatch.setattr(Config, 'link_mode', link_mode)
+        sortable_file = ImageFile(do_kwon_tweet)
+        sortable_file._paths_of_sorted_copies = copy_paths
+        sortable_file._record_sorted_copies()
+        assert hashed_paths == [copy_paths[0]]
+        copy_hash = file_content_hash(copy_paths[0])
+        assert [Config.sorted_manifest.get(copy_path).content_hash for copy_path in copy_paths] == [copy_hash] * 3
@@ -0,0 +1,29 @@
+import os
+from shutil import copy2
+
+from clown_sort.lib.decoded_image_cache import DecodedImageCache
+
+
+def test_decoded_image_cache(tmp_path, do_kwon_tweet, parrot_retweet, three_of_swords_file):
+    cache = DecodedImageCache(max_images=2)
+    image = cache.get(do_kwon_tweet)
+    assert cache.get(do_kwon_tweet) is image
+    assert cache.decode_count == 1
+
+    # Least recently used image is evicted
+    cache.get(parrot_retweet)
+    cache.get(three_of_swords_file)
+    assert len(cache) == 2
+    cache.get(do_kwon_tweet)
+    assert cache.decode_count == 4
+
+    cache.release(do_kwon_tweet)
+    assert len(cache) == 1
+
+    # Changed files are decoded again
+    changed_file = tmp_path.joinpath(parrot_retweet.name)
+    copy2(parrot_retweet, changed_file)
+    cache.get(changed_file)
+    os.utime(changed_file, ns=(0, 0))
+    cache.get(changed_file)
+    assert cache.decode_count == 6
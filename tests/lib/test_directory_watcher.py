@@ -0,0 +1,39 @@
+import sys
+import time
+
+import pytest
+
+from clown_sort.lib.directory_watcher import InotifyWatcher, PollingWatcher
+
+SETTLE_SECONDS = 0.2
+
+
+def _wait_for_settled_files(watcher, seconds: float = 3.0) -> list:
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        settled_files = watcher.settled_files(timeout=0.05)
+
+        if settled_files:
+            return settled_files
+
+    return []
+
+
+def _check_watcher(watcher, tmp_path):
+    screenshot = tmp_path.joinpath('Screen Shot 2023-02-10 at 4.00.32 PM.png')
+    screenshot.write_bytes(b'half written')
+    assert watcher.settled_files(timeout=0.05) == []  # Hasn't settled yet
+    screenshot.write_bytes(b'fully written')
+    assert _wait_for_settled_files(watcher) == [screenshot]
+    assert watcher.settled_files(timeout=0.05) == []  # Only reported once
+    watcher.close()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+def test_inotify_watcher(tmp_path):
+    _check_watcher(InotifyWatcher(tmp_path, SETTLE_SECONDS), tmp_path)
+
+
+def test_polling_watcher(tmp_path):
+    _check_watcher(PollingWatcher(tmp_path, SETTLE_SECONDS, poll_seconds=0.05), tmp_path)
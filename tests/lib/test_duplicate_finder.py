@@ -0,0 +1,52 @@
+import os
+
+from clown_sort.lib.duplicate_finder import collapse_into_hardlinks, find_duplicates
+
+BLOCK_BYTES = 16
+
+
+def test_find_duplicates(tmp_path):
+    contents = {
+        'a.png': b'A' * 100,
+        'Tether/a.png': b'A' * 100,
+        'Binance/a.png': b'A' * 100,
+        'same_ends.png': b'A' * 40 + b'B' * 20 + b'A' * 40,  # Same size and partial hash as a.png
+        'small_1.pdf': b'small',
+        'small_2.pdf': b'small',
+        'unique.pdf': b'small but unique',
+        'empty_1.pdf': b'',
+        'empty_2.pdf': b'',
+    }
+
+    for relative_path, data in contents.items():
+        file_path = tmp_path.joinpath(relative_path)
+        file_path.parent.mkdir(exist_ok=True)
+        file_path.write_bytes(data)
+
+    os.link(tmp_path.joinpath('small_1.pdf'), tmp_path.joinpath('already_linked.pdf'))
+    all_files = [f for f in tmp_path.rglob('*') if f.is_file()]
+    groups = find_duplicates(all_files, threads=2, partial_hash_bytes=BLOCK_BYTES)
+    assert [[str(f.relative_to(tmp_path)) for f in group.paths] for group in groups] == [
+        ['Binance/a.png', 'Tether/a.png', 'a.png'],
+        ['already_linked.pdf', 'small_1.pdf', 'small_2.pdf'],
+    ]
+
+    assert [group.wasted_bytes for group in groups] == [200, 5]
+    assert collapse_into_hardlinks(groups[0]) == 200
+    assert len({f.stat().st_ino for f in groups[0].paths}) == 1
+    assert tmp_path.joinpath('Tether/a.png').read_bytes() == b'A' * 100
+    assert find_duplicates(all_files, partial_hash_bytes=BLOCK_BYTES)[0].wasted_bytes == 5
+
+
+def test_changed_and_missing_files_arent_collapsed(tmp_path):
+    for name in ['a.png', 'b.png', 'c.png', 'd.png']:
+        tmp_path.joinpath(name).write_bytes(b'A' * 100)
+
+    group = find_duplicates(sorted(tmp_path.iterdir()))[0]
+    tmp_path.joinpath('b.png').unlink()
+    tmp_path.joinpath('c.png').write_bytes(b'C' * 100)
+    os.utime(tmp_path.joinpath('c.png'), ns=(0, group.mtimes_ns[group.file_ids[2]] + 1_000_000_000))
+    assert collapse_into_hardlinks(group) == 100
+    assert tmp_path.joinpath('c.png').read_bytes() == b'C' * 100
+    assert tmp_path.joinpath('d.png').stat().st_ino == tmp_path.joinpath('a.png').stat().st_ino
+    assert tmp_path.joinpath('c.png').stat().st_ino != tmp_path.joinpath('a.png').stat().st_ino
@@ -0,0 +1,93 @@
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+
+from clown_sort.lib.exif_splicer import copy_with_exif
+
+DESCRIPTION = 'the clowns are in charge'
+
+
+def _copy_with_description(source_path, destination_path) -> bool:
+    with Image.open(source_path) as image:
+        exif = image.getexif()
+
+    exif[270] = DESCRIPTION
+    return copy_with_exif(source_path, destination_path, exif)
+
+
+def test_copy_with_exif(tmp_path, do_kwon_tweet, parrot_retweet):
+    for source_path in [do_kwon_tweet, parrot_retweet]:
+        destination_path = tmp_path.joinpath(source_path.name)
+        assert _copy_with_description(source_path, destination_path)
+
+        with Image.open(source_path) as source, Image.open(destination_path) as copy:
+            assert copy.format == source.format
+            assert copy.getexif()[270] == DESCRIPTION
+            assert copy.tobytes() == source.tobytes()
+
+        # Replaces rather than duplicates existing EXIF
+        assert _copy_with_description(destination_path, tmp_path.joinpath('again' + source_path.suffix))
+        assert tmp_path.joinpath('again' + source_path.suffix).read_bytes() == destination_path.read_bytes()
+
+
+def test_png_exif_after_idat(tmp_path):
+    """Older writers put eXIf after the image data. The stale chunk has to go or there would be two."""
+    plain_path = tmp_path.joinpath('plain.png')
+    Image.new('RGB', (40, 30), 'purple').save(plain_path)
+    png_bytes = plain_path.read_bytes()
+    exif = Image.Exif()
+    exif[270] = 'stale description'
+    exif_data = exif.tobytes()
+    stale_chunk = struct.pack('>I', len(exif_data)) + b'eXIf' + exif_data + struct.pack('>I', zlib.crc32(b'eXIf' + exif_data))
+    iend_start = png_bytes.rindex(b'IEND') - 4
+    source_path = tmp_path.joinpath('late_exif.png')
+    source_path.write_bytes(png_bytes[:iend_start] + stale_chunk + png_bytes[iend_start:])
+
+    with Image.open(source_path) as image:
+        image.load()
+        assert image.getexif()[270] == 'stale description'
+
+    destination_path = tmp_path.joinpath('copy.png')
+    assert _copy_with_description(source_path, destination_path)
+    copy_bytes = destination_path.read_bytes()
+    assert copy_bytes.count(b'eXIf') == 1
+    assert copy_bytes.index(b'eXIf') < copy_bytes.index(b'IDAT')
+
+    with Image.open(destination_path) as copy, Image.open(plain_path) as source:
+        assert copy.getexif()[270] == DESCRIPTION
+        assert copy.tobytes() == source.tobytes()
+
+
+def test_unsupported_format(tmp_path, do_kwon_tweet):
+    tiff_path = tmp_path.joinpath('kwon.tiff')
+
+    with Image.open(do_kwon_tweet) as image:
+        image.save(tiff_path)
+
+    assert not _copy_with_description(tiff_path, tmp_path.joinpath('copy.tiff'))
+    assert list(tmp_path.iterdir()) == [tiff_path]
+
+
+def test_fill_bytes_before_markers(tmp_path, do_kwon_tweet):
+    jpeg_bytes = do_kwon_tweet.read_bytes()
+    padded_path = tmp_path.joinpath('padded.jpeg')
+    padded_path.write_bytes(jpeg_bytes[:2] + b'\xff\xff\xff' + jpeg_bytes[2:])  # Fill bytes before the APP0 marker
+    assert _copy_with_description(padded_path, tmp_path.joinpath('copy.jpeg'))
+
+    with Image.open(do_kwon_tweet) as source, Image.open(tmp_path.joinpath('copy.jpeg')) as copy:
+        assert copy.getexif()[270] == DESCRIPTION
+        assert copy.tobytes() == source.tobytes()
+
+
+def test_temp_file_removed_on_failure(tmp_path, do_kwon_tweet, monkeypatch):
+    def fail(*_args):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr('clown_sort.lib.exif_splicer.replace', fail)
+
+    with pytest.raises(OSError):
+        _copy_with_description(do_kwon_tweet, tmp_path.joinpath('copy.jpeg'))
+
+    assert list(tmp_path.iterdir()) == []
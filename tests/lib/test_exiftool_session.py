@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from exiftool.exceptions import ExifToolException
+
+from clown_sort.lib import exiftool_session as exiftool_session_module
+from clown_sort.lib.exiftool_session import BATCH_SIZE, ExifToolSession
+
+
+def test_exiftool_not_installed(do_kwon_tweet, parrot_retweet):
+    session = ExifToolSession('not_actually_exiftool')
+    assert session.get_metadata([do_kwon_tweet, parrot_retweet]) == [{}, {}]
+    assert session.is_unavailable
+    assert session.metadata(do_kwon_tweet) == {}
+    session.shutdown()
+
+
+def test_get_metadata_batches(monkeypatch):
+    """Results come back in input order and unreadable files get {} no matter what order exiftool uses."""
+    file_paths = [f"/screenshots/{i}.png" for i in range(2 * BATCH_SIZE + 50)]
+    batches = []
+
+    def execute_batch(_self, batch_paths):
+        batches.append(batch_paths)
+        # Reversed, and every 7th file is unreadable so it's missing from the output
+        indexes = {path: int(Path(path).stem) for path in batch_paths}
+        return [{'SourceFile': path, 'Index': indexes[path]} for path in reversed(batch_paths) if indexes[path] % 7]
+
+    monkeypatch.setattr(ExifToolSession, '_execute_batch', execute_batch)
+    metadata = ExifToolSession().get_metadata(file_paths)
+    assert [len(batch) for batch in batches] == [BATCH_SIZE, BATCH_SIZE, 50]
+    assert [path for batch in batches for path in batch] == file_paths
+    assert metadata == [{'SourceFile': path, 'Index': i} if i % 7 else {} for i, path in enumerate(file_paths)]
+
+
+class FakeExifToolHelper:
+    """Fails the first time it's asked for metadata."""
+    instances = []
+
+    def __init__(self, executable, check_execute):
+        self.running = True
+        FakeExifToolHelper.instances.append(self)
+
+    def get_metadata(self, file_paths):
+        if len(FakeExifToolHelper.instances) == 1:
+            raise ExifToolException('exiftool got confused')
+
+        return [{'SourceFile': file_path} for file_path in file_paths]
+
+    def terminate(self):
+        self.running = False
+
+
+def test_restart_after_exiftool_exception(monkeypatch):
+    monkeypatch.setattr(exiftool_session_module, 'ExifToolHelper', FakeExifToolHelper)
+    FakeExifToolHelper.instances.clear()
+    session = ExifToolSession()
+    assert session.get_metadata(['a.png', 'b.png']) == [{}, {}]
+    assert session._exiftool is None
+    assert not FakeExifToolHelper.instances[0].running
+    assert not session.is_unavailable
+
+    assert session.get_metadata(['a.png']) == [{'SourceFile': 'a.png'}]
+    assert len(FakeExifToolHelper.instances) == 2
+    assert session._exiftool is FakeExifToolHelper.instances[1]
+    session.shutdown()
+    assert not FakeExifToolHelper.instances[1].running
@@ -0,0 +1,32 @@
+from clown_sort.lib.extraction_cache import ROW_OVERHEAD_BYTES, ExtractionCache
+
+EXTRACTOR = 'tesseract 5.0 lang=eng'
+
+
+def test_get_and_put(tmp_path):
+    cache = ExtractionCache(tmp_path.joinpath('cache.sqlite'))
+    assert cache.get('abc', EXTRACTOR) is None
+    cache.put('abc', EXTRACTOR, 'clown text')
+    cache.put('def', EXTRACTOR, None)
+    assert cache.get('abc', EXTRACTOR).text == 'clown text'
+    assert cache.get('abc', 'some other engine') is None
+    assert cache.get('abc', EXTRACTOR, 'PageRange(1, 2)') is None
+    assert cache.get('def', EXTRACTOR).text is None
+    cache.close()
+
+    # Survives reopening unless rebuilding
+    assert ExtractionCache(tmp_path.joinpath('cache.sqlite')).get('abc', EXTRACTOR).text == 'clown text'
+    assert ExtractionCache(tmp_path.joinpath('cache.sqlite'), rebuild=True).get('abc', EXTRACTOR) is None
+
+
+def test_eviction(tmp_path):
+    cache = ExtractionCache(tmp_path.joinpath('cache.sqlite'), max_bytes=(ROW_OVERHEAD_BYTES + 10) * 3)
+
+    for i in range(3):
+        cache.put(f"hash{i}", EXTRACTOR, 'x' * 10)
+
+    cache.get('hash0', EXTRACTOR)  # hash1 is now the least recently used
+    cache.put('hash3', EXTRACTOR, 'x' * 10)
+    assert cache.get('hash1', EXTRACTOR) is None
+    assert cache.get('hash0', EXTRACTOR) is not None
+    assert cache.get('hash3', EXTRACTOR) is not None
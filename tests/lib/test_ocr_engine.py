@@ -0,0 +1,13 @@
+from clown_sort.lib.ocr_engine import PYTESSERACT, PytesseractEngine, ocr_engine
+
+
+def test_ocr_engine_is_reused():
+    assert ocr_engine(PYTESSERACT) is ocr_engine(PYTESSERACT)
+
+
+def test_cache_key(monkeypatch):
+    engine = PytesseractEngine()
+    monkeypatch.setattr(engine, 'engine_version', lambda: None)
+    assert engine.cache_key() is None
+    monkeypatch.setattr(engine, 'engine_version', lambda: '5.3.0')
+    assert engine.cache_key() == 'pytesseract 5.3.0 lang=eng'
@@ -0,0 +1,63 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from clown_sort.lib.ocr_preprocessing import (MARGIN_PADDING, WHITE, OcrPreprocessing, grayscale_array,
+     otsu_threshold, preprocess_for_ocr, text_line_height)
+
+LINES = ['Tether printed another billion', 'Binance says it is fine', 'Celsius is not fine']
+
+
+def text_image(font_size: int, background=(255, 255, 255, 255), text_color=(0, 0, 0, 255), margin: int = 20) -> Image.Image:
+    font = ImageFont.load_default(size=font_size)
+    line_spacing = int(font_size * 1.6)
+    image = Image.new('RGBA', (font_size * 20 + 2 * margin, line_spacing * len(LINES) + 2 * margin), background)
+    draw = ImageDraw.Draw(image)
+
+    for i, line in enumerate(LINES):
+        draw.text((margin, margin + i * line_spacing), line, font=font, fill=text_color)
+
+    return image
+
+
+def test_text_is_scaled_to_target_height():
+    retina_image = text_image(72)
+    assert text_line_height(grayscale_array(retina_image)) > 60
+    preprocessed = preprocess_for_ocr(retina_image, OcrPreprocessing(target_text_height=30))
+    assert preprocessed.mode == 'L'
+    assert preprocessed.size[0] < retina_image.size[0] / 2
+    assert 24 <= text_line_height(np.asarray(preprocessed)) <= 36
+
+    # Text that's already about the right size isn't resampled
+    image = text_image(24)
+    line_height = text_line_height(grayscale_array(image))
+    assert preprocess_for_ocr(image, OcrPreprocessing(target_text_height=int(line_height * 1.1))).size == image.size
+
+
+def test_transparent_and_dark_mode_images():
+    transparent_image = text_image(24, background=(0, 0, 0, 0))
+    dark_mode_image = text_image(24, background=(20, 20, 30, 255), text_color=(230, 230, 230, 255))
+
+    for image in [transparent_image, dark_mode_image]:
+        pixels = np.asarray(preprocess_for_ocr(image, OcrPreprocessing()))
+        assert pixels[0, 0] > 200  # Light background
+        assert pixels.min() < 60   # Dark text
+
+
+def test_crop_margins_and_binarize():
+    image = text_image(24, margin=200)
+    preprocessing = OcrPreprocessing(binarize=True, crop_margins=True, target_text_height=int(text_line_height(grayscale_array(image))))
+    preprocessed = preprocess_for_ocr(image, preprocessing)
+    pixels = np.asarray(preprocessed)
+    assert preprocessed.size[0] < image.size[0] - 300
+    assert set(np.unique(pixels)) == {0, WHITE}
+    assert (pixels[:MARGIN_PADDING // 2] == WHITE).all()
+
+
+def test_otsu_threshold():
+    pixels = np.array([[10, 12, 200, 220]] * 4, dtype=np.uint8)
+    assert 12 <= otsu_threshold(pixels) < 200
+
+
+def test_cache_key():
+    assert OcrPreprocessing().cache_key() != OcrPreprocessing(binarize=True).cache_key()
+    assert OcrPreprocessing(crop_margins=True).cache_key() != OcrPreprocessing(target_text_height=20, crop_margins=True).cache_key()
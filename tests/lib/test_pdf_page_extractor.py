@@ -0,0 +1,56 @@
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+from clown_sort.lib.ocr_engine import OcrEngine
+from clown_sort.lib.pdf_page_extractor import ALWAYS, NEVER, SPARSE, PdfPageExtractor, text_density
+
+DENSE_TEXT = 'Tether ' * 30
+
+
+class FakeOcrEngine(OcrEngine):
+    name = 'fake'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.ocr_count = 0
+
+    def image_to_string(self, image: Image.Image) -> str:
+        self.ocr_count += 1
+        return 'scanned text'
+
+    def engine_version(self) -> str:
+        return '1.0'
+
+
+def mixed_pdf(tmp_path, build_pdf) -> PdfReader:
+    """Page 1 has a text layer and no images, page 2 has a sparse text layer, page 3 is a scan."""
+    text_pdf = build_pdf(tmp_path.joinpath('text.pdf'), [DENSE_TEXT, 'Title'])
+    scan_pdf = tmp_path.joinpath('scan.pdf')
+    Image.new('RGB', (200, 100), 'white').save(scan_pdf)
+    writer = PdfWriter()
+    writer.append(str(text_pdf))
+    writer.append(str(scan_pdf))
+    mixed_pdf_path = tmp_path.joinpath('mixed.pdf')
+    writer.write(mixed_pdf_path)
+    return PdfReader(mixed_pdf_path)
+
+
+def test_text_density(tmp_path, build_pdf):
+    reader = mixed_pdf(tmp_path, build_pdf)
+    assert text_density(reader.pages[0], DENSE_TEXT) > 1.0
+    assert text_density(reader.pages[1], 'Title') < 1.0
+
+
+def test_ocr_policies(tmp_path, build_pdf):
+    reader = mixed_pdf(tmp_path, build_pdf)
+
+    for ocr_policy, expected_ocr_pages, expected_ocr_count in [(SPARSE, 1, 1), (ALWAYS, 1, 1), (NEVER, 0, 0)]:
+        ocr_engine = FakeOcrEngine()
+        page_extractor = PdfPageExtractor(reader, ocr_engine, ocr_policy)
+        page_texts = [page_extractor.page_text(page_number) for page_number in range(1, page_extractor.page_count + 1)]
+        assert page_texts[0] == DENSE_TEXT.strip()
+        assert page_texts[1] == 'Title'
+        assert page_texts[2] == ('' if ocr_policy == NEVER else 'scanned text')
+        assert page_extractor.ocr_page_count == expected_ocr_pages
+        assert ocr_engine.ocr_count == expected_ocr_count
+        assert page_extractor.page_numbers_of_errors == []
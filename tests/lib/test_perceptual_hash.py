@@ -0,0 +1,88 @@
+import io
+import random
+
+from PIL import Image, ImageDraw, ImageFont
+
+from clown_sort.files.image_file import ImageFile
+from clown_sort.lib.perceptual_hash import (NEAR_DUPLICATE_MAX_DISTANCE, BKTree, NearDuplicateIndex, Thumbnail,
+     dhash, hamming_distance)
+
+
+def test_dhash(do_kwon_tweet, parrot_retweet):
+    image = Image.open(do_kwon_tweet).convert('RGB')
+    tweaked_image = image.copy()
+    ImageDraw.Draw(tweaked_image).rectangle((0, 0, 20, 20), fill='red')  # e.g. a notification badge
+    rescaled_image = image.resize((image.width // 2, image.height // 2))
+    image_hash = ImageFile(do_kwon_tweet).perceptual_hash()
+    assert image_hash == dhash(image)
+    assert hamming_distance(image_hash, dhash(tweaked_image)) <= NEAR_DUPLICATE_MAX_DISTANCE
+    assert hamming_distance(image_hash, dhash(rescaled_image)) <= NEAR_DUPLICATE_MAX_DISTANCE
+    assert hamming_distance(image_hash, ImageFile(parrot_retweet).perceptual_hash()) > 10
+
+
+def test_bk_tree():
+    randomizer = random.Random(42)
+    hashes = [randomizer.getrandbits(64) for _ in range(2000)]
+    hashes += [h ^ (1 << randomizer.randrange(64)) for h in hashes[:50]]  # Some near duplicates
+    tree = BKTree()
+
+    for i, h in enumerate(hashes):
+        tree.add(h, i)
+
+    assert len(tree) == len(hashes)
+
+    for query in hashes[:60] + [randomizer.getrandbits(64)]:
+        expected = sorted((hamming_distance(query, h), i) for i, h in enumerate(hashes) if hamming_distance(query, h) <= 6)
+        assert sorted(tree.find(query, 6)) == expected
+
+
+def test_near_duplicate_index(tmp_path):
+    index = NearDuplicateIndex(max_distance=2)
+    first_path, second_path, third_path = [tmp_path.joinpath(f"{i}.png") for i in range(3)]
+    assert index.find_or_add(first_path, 0b1111) is None
+    assert index.find_or_add(second_path, 0b1110) == first_path
+    assert index.find_or_add(third_path, 0b1100) == second_path
+    index.record_extracted_text(first_path, 'some text')
+    index.record_extracted_text(second_path, None)
+    assert index.extracted_text(first_path) == 'some text'
+    assert index.extracted_text(second_path) is None
+
+
+def test_near_duplicate_index_with_thumbnails(tmp_path):
+    index = NearDuplicateIndex(max_distance=2)
+    first_path, second_path, third_path = [tmp_path.joinpath(f"{i}.png") for i in range(3)]
+    white, black = [Thumbnail.of(Image.new('L', (200, 100), color)) for color in [255, 0]]
+    assert index.find_or_add(first_path, 0b1111, white) is None
+    assert index.find_or_add(second_path, 0b1111, black) is None
+    assert index.find_or_add(third_path, 0b1110, white) == first_path
+
+
+def _tweet_image(body_lines):
+    """Same canvas, header, and avatar for every tweet so only the body text differs."""
+    font = ImageFont.load_default(size=26)
+    image = Image.new('RGB', (800, 400), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 800, 60), fill=(29, 161, 242))
+    draw.ellipse((20, 80, 80, 140), fill='gray')
+    draw.text((100, 95), '@clown_sort_test', font=font, fill='black')
+
+    for i, line in enumerate(body_lines):
+        draw.text((20, 170 + 40 * i), line, font=font, fill='black')
+
+    return image
+
+
+def test_thumbnail_matches():
+    tweet = _tweet_image(['Tether printed another billion dollars today', 'and nobody seems to care about it at all'])
+    other_tweet = _tweet_image(['Binance says the exchange is fully solvent', 'trust us, the auditors are on vacation'])
+    # Precondition: the layout dominates the dHash so different tweets look like near duplicates
+    assert hamming_distance(dhash(tweet), dhash(other_tweet)) <= NEAR_DUPLICATE_MAX_DISTANCE
+    assert not Thumbnail.of(tweet).matches(Thumbnail.of(other_tweet))
+
+    badged_tweet = tweet.copy()
+    ImageDraw.Draw(badged_tweet).rectangle((0, 0, 20, 20), fill='red')
+    jpeg_bytes = io.BytesIO()
+    tweet.save(jpeg_bytes, 'JPEG', quality=70)
+    assert Thumbnail.of(tweet).matches(Thumbnail.of(badged_tweet))
+    assert Thumbnail.of(tweet).matches(Thumbnail.of(Image.open(jpeg_bytes)))
+    assert not Thumbnail.of(tweet).matches(Thumbnail.of(tweet.resize((tweet.width // 2, tweet.height // 2))))
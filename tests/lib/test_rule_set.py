@@ -0,0 +1,47 @@
+import re
+
+from clown_sort.config import Config
+from clown_sort.lib.rule_set import RuleSet, required_literals
+from clown_sort.sort_rule import SortRule
+
+SEARCH_TEXTS = [
+    'fuck Arianna _ Simpson',
+    'fuck the brockpierce coin',
+    'fuck B. Blumer ',
+    'fuck Matthew  Roszak he sucks',
+    "CFTC’s Division of Clearing and Risk Issues.pdf",
+    'fuck 0xe85c4D91DC0D9dB0a59300e18acFA2A498419E83 coin',
+    'Déltèç bank sücks',
+    'nothing to see here',
+    '“Tether” is a scam · says BİNANCE 🤡',
+    '\u212araken and ſushiswap',
+    'Coınbase’s fees',
+]
+
+
+def test_required_literals():
+    assert required_literals(re.compile('\\bAAX(Exchange)?\\b', re.I)) == {'aax', 'aaxexchange'}
+    assert required_literals(re.compile('(matthew)?[-\\s_.]*roszak', re.I)) == {'roszak'}
+    assert required_literals(re.compile('[$#]ALGO\\b', re.I)) == {'$algo', '#algo'}
+    assert required_literals(re.compile('\\d+', re.I)) is None
+    assert required_literals(re.compile('foo|\\w+bar', re.I)) == {'foo', 'bar'}
+    assert required_literals(re.compile('foo|\\w*', re.I)) is None
+
+
+def test_search_matches_every_rule_evaluation():
+    for search_text in SEARCH_TEXTS:
+        expected = [(r.folder, r.regex.search(search_text)[0]) for r in Config.sort_rules if r.regex.search(search_text)]
+        found = [(rule.folder, match[0]) for rule, match in Config.rule_set.search(search_text)]
+        assert found == expected
+
+
+def test_rules_without_literals_are_always_evaluated():
+    rule_set = RuleSet([SortRule('Numbers', '\\d{3}'), SortRule('Words', 'clown')])
+    assert [rule.folder for rule, _match in rule_set.search('CLOWN 123')] == ['Numbers', 'Words']
+    assert [rule.folder for rule, _match in rule_set.search('bozo 123')] == ['Numbers']
+
+
+def test_non_ascii_case_folds():
+    rule_set = RuleSet([SortRule('Kraken', 'kraken'), SortRule('Sushi', 'sushi'), SortRule('Bit', 'bit')])
+    assert [rule.folder for rule, _match in rule_set.search('\u212aRAKEN ſUSHI BİT ’')] == ['Kraken', 'Sushi', 'Bit']
+    assert [rule.folder for rule, _match in rule_set.search('KRAKEN sushı ’')] == ['Kraken', 'Sushi']
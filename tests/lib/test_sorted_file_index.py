@@ -0,0 +1,34 @@
+import os
+
+from clown_sort.lib.sorted_file_index import SortedFileIndex
+
+
+def test_sorted_file_index(tmp_path):
+    sorted_dir = tmp_path.joinpath('Sorted')
+
+    for relative_path in ['Tether/report.pdf', 'Binance/report.pdf', 'Binance/Nested/other.pdf', '.hidden/report.pdf']:
+        file_path = sorted_dir.joinpath(relative_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.touch()
+
+    index_path = tmp_path.joinpath('index.sqlite')
+    index = SortedFileIndex(index_path)
+    index.refresh(sorted_dir)
+    assert sorted(index.paths('report.pdf')) == [sorted_dir.joinpath('Binance/report.pdf'), sorted_dir.joinpath('Tether/report.pdf')]
+    assert index.paths('other.pdf') == [sorted_dir.joinpath('Binance/Nested/other.pdf')]
+    assert index.paths('nothing.pdf') == []
+    assert index.relisted_dir_count == 4
+    index.close()
+
+    # Only dirs whose contents changed are re-listed by the next run
+    sorted_dir.joinpath('Tether/report.pdf').unlink()
+    sorted_dir.joinpath('Binance/Nested/new.pdf').touch()
+    os.rmdir(sorted_dir.joinpath('Tether'))
+    index = SortedFileIndex(index_path)
+    index.refresh(sorted_dir)
+    assert index.paths('report.pdf') == [sorted_dir.joinpath('Binance/report.pdf')]
+    assert index.paths('new.pdf') == [sorted_dir.joinpath('Binance/Nested/new.pdf')]
+    assert index.relisted_dir_count == 2
+
+    index.remove(sorted_dir.joinpath('Binance/report.pdf'))
+    assert index.paths('report.pdf') == []
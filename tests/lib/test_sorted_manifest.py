@@ -0,0 +1,58 @@
+import os
+from shutil import copy2
+
+from clown_sort.lib.rule_set import RuleSet
+from clown_sort.lib.sorted_manifest import SortedManifest
+from clown_sort.sort_rule import SortRule
+
+TETHER_RULE = SortRule('Tether', 'tether')
+BINANCE_RULE = SortRule('Binance', 'binance')
+
+
+def test_rules_to_evaluate(tmp_path, do_kwon_tweet):
+    manifest = SortedManifest(tmp_path.joinpath('manifest.sqlite'))
+    sorted_file = tmp_path.joinpath(do_kwon_tweet.name)
+    copy2(do_kwon_tweet, sorted_file)
+    content_hash = lambda: 'hash'
+    old_rules = RuleSet([TETHER_RULE])
+    new_rules = RuleSet([TETHER_RULE, BINANCE_RULE])
+    assert manifest.rules_to_evaluate(sorted_file, content_hash, old_rules) is old_rules
+    manifest.record(sorted_file, old_rules, 'hash')
+    assert manifest.rules_to_evaluate(sorted_file, content_hash, old_rules) is None
+    assert manifest.rules_to_evaluate(sorted_file, content_hash, RuleSet([TETHER_RULE])) is None
+    # Only the added rule needs to be checked
+    assert manifest.rules_to_evaluate(sorted_file, content_hash, new_rules).sort_rules == [BINANCE_RULE]
+    # Removing rules doesn't require re-evaluation
+    manifest.record(sorted_file, new_rules, 'hash')
+    assert manifest.rules_to_evaluate(sorted_file, content_hash, old_rules) is None
+
+    # Touched but not modified
+    os.utime(sorted_file, ns=(0, 0))
+    assert manifest.rules_to_evaluate(sorted_file, content_hash, new_rules) is None
+    os.utime(sorted_file, ns=(1, 1))
+    assert manifest.rules_to_evaluate(sorted_file, lambda: 'modified', new_rules) is new_rules
+
+    sorted_file.unlink()
+    manifest.remove_deleted_files()
+    assert manifest.get(sorted_file) is None
+
+
+def test_touched_files_are_hashed_once(tmp_path, do_kwon_tweet):
+    manifest = SortedManifest(tmp_path.joinpath('manifest.sqlite'))
+    sorted_file = tmp_path.joinpath(do_kwon_tweet.name)
+    copy2(do_kwon_tweet, sorted_file)
+    rule_set = RuleSet([TETHER_RULE])
+    manifest.record(sorted_file, rule_set, 'hash')
+    hash_calls = []
+
+    def content_hash():
+        hash_calls.append(sorted_file)
+        return 'hash'
+
+    os.utime(sorted_file, ns=(0, 0))
+
+    for _rescan in range(2):
+        assert manifest.rules_to_evaluate(sorted_file, content_hash, rule_set) is None
+
+    assert hash_calls == [sorted_file]
+    assert manifest.get(sorted_file).mtime_ns == 0
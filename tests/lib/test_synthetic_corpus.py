@@ -0,0 +1,52 @@
+from collections import Counter
+
+from clown_sort.filename_extractor import DUNE_ANALYTICS_REGEX, find_reddit_post, find_reddit_reply, find_tweet
+from clown_sort.lib.rule_match import RuleMatch
+from clown_sort.lib.synthetic_corpus import (BLANK, CORPUS_KINDS, CRYPTO_KEYWORDS, DUNE, FILLER_WORDS, KEYWORDS,
+     PDF, REDDIT, TWEET, generate_corpus, load_corpus)
+from clown_sort.util.constants import DEFAULT_FILENAME_REGEX
+
+
+def test_generate_corpus(tmp_path):
+    corpus = generate_corpus(tmp_path.joinpath('corpus'), 7, 2, 2)
+    assert Counter(corpus_file.kind for corpus_file in corpus) == {kind: 2 for kind in CORPUS_KINDS}
+    assert all(corpus_file.file_path.is_file() for corpus_file in corpus)
+
+    for corpus_file in corpus:
+        if corpus_file.kind == PDF:
+            assert corpus_file.file_path.read_bytes().count(b'/Type /Page\n') == 2
+        else:
+            assert DEFAULT_FILENAME_REGEX.match(corpus_file.file_path.name)
+
+        if corpus_file.kind == TWEET:
+            assert find_tweet(corpus_file.text)
+        elif corpus_file.kind == REDDIT:
+            assert find_reddit_post(corpus_file.text) or find_reddit_reply(corpus_file.text)
+        elif corpus_file.kind == DUNE:
+            assert DUNE_ANALYTICS_REGEX.search(corpus_file.text)
+        elif corpus_file.kind == BLANK:
+            assert corpus_file.text == ''
+
+        if corpus_file.kind in [KEYWORDS, PDF]:
+            assert len(RuleMatch.get_rule_matches(corpus_file.text)) > 0
+
+
+def test_corpus_is_reproducible(tmp_path):
+    corpus = generate_corpus(tmp_path.joinpath('corpus'), 7, 1, 1)
+    same_corpus = generate_corpus(tmp_path.joinpath('same'), 7, 1, 1)
+    other_corpus = generate_corpus(tmp_path.joinpath('other'), 8, 1, 1)
+    read_bytes = lambda c: [corpus_file.file_path.read_bytes() for corpus_file in c if corpus_file.kind != PDF]
+    assert read_bytes(corpus) == read_bytes(same_corpus)
+    assert read_bytes(corpus) != read_bytes(other_corpus)
+    # Reused if the options match
+    assert load_corpus(tmp_path.joinpath('corpus'), 7, 1, 1) == corpus
+    assert load_corpus(tmp_path.joinpath('corpus'), 8, 1, 1) is None
+    corpus[0].file_path.unlink()
+    assert load_corpus(tmp_path.joinpath('corpus'), 7, 1, 1) is None
+
+
+def test_keywords_match_rules():
+    for keyword in CRYPTO_KEYWORDS:
+        assert len(RuleMatch.get_rule_matches(keyword)) > 0, f"'{keyword}' doesn't match any crypto.csv rules"
+
+    assert RuleMatch.get_rule_matches(' '.join(FILLER_WORDS)) == []
@@ -0,0 +1,32 @@
+import numpy as np
+from PIL import Image, ImageFilter
+
+from clown_sort.lib.text_detection import detect_text, quick_pass_found_text
+
+
+def test_screenshots_have_text(do_kwon_tweet, parrot_retweet, three_of_swords_file, unicode_filename):
+    for fixture_path in [do_kwon_tweet, parrot_retweet, three_of_swords_file, unicode_filename]:
+        with Image.open(fixture_path) as image:
+            assert detect_text(image).has_text, f"No text detected in '{fixture_path.name}'"
+
+
+def test_images_without_text():
+    random_pixels = np.random.default_rng(42).integers(0, 256, (100, 125, 3), dtype=np.uint8)
+    photo = Image.fromarray(random_pixels).resize((1000, 800), Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(6))
+    gradient = Image.fromarray(np.outer(np.linspace(0, 255, 800), np.ones(1000)).astype(np.uint8))
+
+    for image in [Image.new('RGB', (1000, 800), 'white'), photo, gradient]:
+        detection = detect_text(image)
+        assert not detection.has_text
+        assert 'probably no text' in detection.description()
+
+
+def test_threshold_is_tunable(do_kwon_tweet):
+    with Image.open(do_kwon_tweet) as image:
+        detection = detect_text(image)
+        assert not detect_text(image, detection.edge_density * 2).has_text
+
+
+def test_quick_pass_found_text():
+    assert not quick_pass_found_text('~ . ,, |')
+    assert quick_pass_found_text('Tether printed another billion')
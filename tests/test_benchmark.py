@@ -0,0 +1,38 @@
+from argparse import Namespace
+
+from clown_sort.benchmark import benchmark_results, sort_corpus
+from clown_sort.config import Config
+from clown_sort.lib.rule_match import RuleMatch
+from clown_sort.lib.synthetic_corpus import CORPUS_KINDS, KEYWORDS, generate_corpus
+from clown_sort.util.instrumentation import MOVE_FILE, OCR, RULE_MATCH, SCAN, SORT_FILE, instrumentation
+
+
+def test_sort_corpus(tmp_path, monkeypatch):
+    corpus = generate_corpus(tmp_path.joinpath('corpus'), 1, 1, 2)
+    monkeypatch.setattr(Config, 'screenshots_dir', tmp_path.joinpath('Screenshots'))
+    monkeypatch.setattr(Config, 'destination_dir', tmp_path)
+    monkeypatch.setattr(Config, 'sorted_screenshots_dir', tmp_path.joinpath('Sorted'))
+    monkeypatch.setattr(Config, 'processed_screenshots_dir', tmp_path.joinpath('Processed'))
+    stage_stats = sort_corpus(corpus, use_corpus_text=True)
+
+    assert stage_stats[SCAN].count == 1
+    assert OCR not in stage_stats
+
+    for stage in [SORT_FILE, RULE_MATCH, MOVE_FILE]:
+        assert stage_stats[stage].count == len(CORPUS_KINDS)
+
+    # The spans recorded while sorting the corpus aren't left in the summary
+    assert instrumentation.stage_stats == {}
+    args = Namespace(repeat=1, seed=1, files_per_kind=1, pdf_pages=2)
+    results = benchmark_results([stage_stats], corpus, args, None)
+    assert results['stages'][OCR] == {'count': 0, 'total_seconds': None}
+    assert results['total_seconds'] == stage_stats[SCAN].total + stage_stats[SORT_FILE].total
+
+    assert sorted(p.name for p in tmp_path.joinpath('Processed').iterdir()) == sorted(f.file_path.name for f in corpus)
+    keywords_file = next(corpus_file for corpus_file in corpus if corpus_file.kind == KEYWORDS)
+
+    for rule_match in RuleMatch.get_rule_matches(keywords_file.text):
+        assert len(list(tmp_path.joinpath('Sorted', rule_match.folder).iterdir())) > 0
+
+    assert list(tmp_path.joinpath('Screenshots').iterdir()) == []
+    assert Config.dry_run is True
@@ -1,7 +1,12 @@
+from time import perf_counter
+
 import pytest
 
-from clown_sort.filename_extractor import FilenameExtractor
+import clown_sort.filename_extractor
+from clown_sort.filename_extractor import FilenameExtractor, find_reddit_reply, find_tweet
 from clown_sort.files.image_file import ImageFile
+from clown_sort.screenshot_sorter import _extract_text_and_new_basename
+from clown_sort.util.parallel import parallel_map_in_order
 
 WUBLOCKCHAIN_TWEET_TEXT = """wu
 
@@ -276,6 +281,10 @@ through the region, its intense, almost exclusively white, upper-middle class
 Americans carrying the society's conservative banner.
 """
 
+# Text that almost looks like a reddit reply over and over (used to take minutes to name)
+ADVERSARIAL_REDDIT_REPLIES = 'Give Award Share Report\n' + 'someone - 5 days ago x\n' * 10_000
+ADVERSARIAL_TWEET_HEADERS = '@abcdef - 5h ' * 10_000
+
 
 @pytest.fixture(scope='session')
 def ocr_image(do_kwon_tweet):
@@ -338,3 +347,41 @@ def test_dune_analytics_filename(ocr_image):
 def test_everything_else_filename(ocr_image):
     ocr_image._extracted_text = PARANOID_STYLE
     assert FilenameExtractor(ocr_image).filename() == 'do_kwon_debate_the_poor - "It was Welch who promised to cut communists and "comsymps" (sympathizers) from the fabric of American society. It was Welch who called then-President Dwight D. Eisenhower".jpeg'
+
+
+def test_adversarial_text_filenames(ocr_image):
+    for text in [ADVERSARIAL_REDDIT_REPLIES, ADVERSARIAL_TWEET_HEADERS]:
+        ocr_image._extracted_text = text
+        start_time = perf_counter()
+        FilenameExtractor(ocr_image).filename()
+        assert perf_counter() - start_time < 1.0
+
+    # The detectors themselves are linear even on the whole text
+    start_time = perf_counter()
+    assert find_reddit_reply(ADVERSARIAL_REDDIT_REPLIES) is None
+    assert find_tweet(ADVERSARIAL_TWEET_HEADERS) is None
+    assert perf_counter() - start_time < 1.0
+
+
+def test_detectors_run_once(ocr_image, monkeypatch):
+    calls = []
+
+    def counting_find_tweet(text):
+        calls.append(text)
+        return find_tweet(text)
+
+    monkeypatch.setattr(clown_sort.filename_extractor, 'find_tweet', counting_find_tweet)
+    ocr_image._extracted_text = REPLY_TWEET_TEXT
+    extractor = FilenameExtractor(ocr_image)
+    assert extractor.filename().startswith('Tweet by @gedaominas replying to @tier10k')
+    assert extractor._is_tweet() and not extractor._is_retweet()
+    assert len(calls) == 1
+
+
+def test_filename_in_worker_process(do_kwon_tweet):
+    image_file = ImageFile(do_kwon_tweet)
+    image_file.text_extraction_attempted = True
+    image_file._extracted_text = REPLY_TWEET_TEXT
+    image_file = list(parallel_map_in_order(_extract_text_and_new_basename, [image_file], 2))[0]
+    assert image_file.new_basename().startswith('Tweet by @gedaominas replying to @tier10k')
+    assert image_file._filename_extractor._is_tweet()
@@ -0,0 +1,26 @@
+"""
+Run the find_duplicates script in a subprocess (Config.configure() parses sys.argv and changes the
+directories every other test uses).
+"""
+import subprocess
+import sys
+from os import environ
+
+from tests.conftest import PROJECT_DIR
+
+
+def test_find_duplicates_script(tmp_path):
+    sorted_dir = tmp_path.joinpath('Sorted')
+
+    for relative_path in ['a.png', 'Tether/a.png', 'Binance/a.png']:
+        sorted_dir.joinpath(relative_path).parent.mkdir(parents=True, exist_ok=True)
+        sorted_dir.joinpath(relative_path).write_bytes(b'A' * 100)
+
+    sorted_dir.joinpath('unique.png').write_bytes(b'B' * 100)
+    code = "from clown_sort import find_duplicates; find_duplicates()"
+    args = ['-s', str(tmp_path), '-d', str(tmp_path), '--no-cache', '--hardlink', '--execute']
+    env = dict(environ, INVOKED_BY_PYTEST='True')
+    result = subprocess.run([sys.executable, '-c', code, *args], capture_output=True, text=True, cwd=PROJECT_DIR, env=env)
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert 'Replaced duplicates with hardlinks' in result.stdout
+    assert len({sorted_dir.joinpath(p).stat().st_ino for p in ['a.png', 'Tether/a.png', 'Binance/a.png']}) == 1
@@ -0,0 +1,34 @@
+"""
+Run each of the scripts in pyproject.toml with --help under `python -X importtime` to make sure parsing
+the arguments doesn't import the image, OCR, and PDF libraries, which take longer to import than
+everything else put together.
+"""
+import re
+import subprocess
+import sys
+import tomllib
+from os import environ
+
+import pytest
+
+from tests.conftest import PROJECT_DIR
+
+HEAVY_MODULES = ['FreeSimpleGUI', 'PIL', 'exiftool', 'fitz', 'numpy', 'pdfalyzer', 'pypdf', 'pytesseract']
+IMPORT_TIME_BUDGET_SECONDS = 1.0  # Loose enough for slow CI machines; HEAVY_MODULES is the precise check
+IMPORTTIME_LINE_REGEX = re.compile(r'import time:\s+(\d+) \|\s+\d+ \| *([\w.]+)')
+
+with open(f"{PROJECT_DIR}/pyproject.toml", 'rb') as pyproject:
+    SCRIPTS = tomllib.load(pyproject)['tool']['poetry']['scripts']
+
+
+@pytest.mark.parametrize('script', sorted(SCRIPTS.keys()))
+def test_script_imports(script):
+    module, function = SCRIPTS[script].split(':')
+    code = f"import sys; sys.argv = ['{script}', '--help']; from {module} import {function}; {function}()"
+    env = dict(environ, INVOKED_BY_PYTEST='True')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, cwd=PROJECT_DIR, env=env)
+    assert result.returncode == 0, result.stderr[-2000:]
+    imports = IMPORTTIME_LINE_REGEX.findall(result.stderr)
+    imported_modules = set(match[1] for match in imports)
+    assert [m for m in HEAVY_MODULES if m in imported_modules] == []
+    assert sum(int(match[0]) for match in imports) / 1_000_000 < IMPORT_TIME_BUDGET_SECONDS
@@ -0,0 +1,130 @@
+import subprocess
+import sys
+from os import environ
+
+from PIL import Image
+
+from clown_sort.config import Config
+from clown_sort.files.image_file import ImageFile
+from clown_sort.lib.perceptual_hash import NearDuplicateIndex
+from clown_sort.screenshot_sorter import _watch_for_screenshots, _with_near_duplicates_found, sort_screenshots
+from clown_sort.util.constants import REUSE_OCR
+
+from clown_sort.util.filesystem_helper import SYMLINK
+from tests.conftest import PROJECT_DIR
+
+OCR_TEXTS = {'a.png': 'Tether news', 'b.png': 'Binance news'}
+
+
+def test_rescan_sorted(tmp_path, monkeypatch):
+    """Copies written to folders that haven't been walked yet shouldn't be rescanned and moved out of Sorted/."""
+    sorted_dir = tmp_path.joinpath('Sorted')
+    processed_dir = tmp_path.joinpath('Processed')
+    processed_dir.mkdir()
+
+    for folder, basename in [('Binance', 'a.png'), ('Tether', 'b.png')]:
+        sorted_dir.joinpath(folder).mkdir(parents=True)
+        Image.new('RGB', (10, 10), (255, 255, 255)).save(sorted_dir.joinpath(folder, basename))
+
+    monkeypatch.setattr(ImageFile, '_ocr_text', lambda image_file: OCR_TEXTS[image_file.basename])
+    monkeypatch.setattr(Config, 'sorted_screenshots_dir', sorted_dir)
+    monkeypatch.setattr(Config, 'processed_screenshots_dir', processed_dir)
+    monkeypatch.setattr(Config, 'rescan_sorted', True)
+    monkeypatch.setattr(Config, 'screenshots_only', False)
+    monkeypatch.setattr(Config, 'dry_run', False)
+    monkeypatch.setattr(Config, 'leave_in_place', False)
+    monkeypatch.setattr(Config, 'yes_overwrite', True)
+    sort_screenshots()
+    assert sorted(str(f.relative_to(sorted_dir)) for f in sorted_dir.rglob('*.png')) == [
+        'Binance/b - "Binance news".png',
+        'Tether/a - "Tether news".png',
+    ]
+    assert sorted(f.name for f in processed_dir.iterdir()) == ['a.png', 'b.png']
+
+
+def test_rescan_sorted_symlinks(tmp_path, monkeypatch):
+    """Symlinks shouldn't be rescanned and the files they point to shouldn't be moved out of Sorted/."""
+    sorted_dir = tmp_path.joinpath('Sorted')
+    processed_dir = tmp_path.joinpath('Processed')
+    processed_dir.mkdir()
+
+    for folder in ['Binance', 'Luna', 'Tether']:
+        sorted_dir.joinpath(folder).mkdir(parents=True)
+
+    for folder, basename in [('Binance', 'a.png'), ('Tether', 'b.png')]:
+        Image.new('RGB', (10, 10), (255, 255, 255)).save(sorted_dir.joinpath(folder, basename))
+
+    sorted_dir.joinpath('Luna', 'a.png').symlink_to('../Binance/a.png')
+    monkeypatch.setattr(ImageFile, '_ocr_text', lambda image_file: OCR_TEXTS[image_file.basename])
+    monkeypatch.setattr(Config, 'sorted_screenshots_dir', sorted_dir)
+    monkeypatch.setattr(Config, 'processed_screenshots_dir', processed_dir)
+    monkeypatch.setattr(Config, 'link_mode', SYMLINK)
+    monkeypatch.setattr(Config, 'rescan_sorted', True)
+    monkeypatch.setattr(Config, 'screenshots_only', False)
+    monkeypatch.setattr(Config, 'dry_run', False)
+    monkeypatch.setattr(Config, 'leave_in_place', False)
+    monkeypatch.setattr(Config, 'yes_overwrite', True)
+    monkeypatch.setattr(Config, 'symlink_targets', set())
+    sort_screenshots()
+    assert sorted(str(f.relative_to(sorted_dir)) for f in sorted_dir.rglob('*.png')) == [
+        'Binance/a.png',
+        'Binance/b - "Binance news".png',
+        'Luna/a.png',
+        'Tether/a - "Tether news".png',
+    ]
+    assert sorted_dir.joinpath('Luna', 'a.png').resolve() == sorted_dir.joinpath('Binance', 'a.png').resolve()
+    assert [f.name for f in processed_dir.iterdir()] == ['b.png']
+
+
+def test_near_duplicates_are_hashed_in_worker_processes(tmp_path, monkeypatch):
+    for basename, color in [('a.png', 'white'), ('b.png', 'black'), ('c.png', 'white')]:
+        Image.new('RGB', (64, 48), color).save(tmp_path.joinpath(basename))
+
+    def no_decoding_here(image_file):
+        raise AssertionError(f"'{image_file.basename}' was decoded in the parent process")
+
+    monkeypatch.setattr(ImageFile, 'pillow_image_obj', no_decoding_here)
+    monkeypatch.setattr(Config, 'near_duplicates', REUSE_OCR)
+    monkeypatch.setattr(Config, 'jobs', 2)
+    image_files = [ImageFile(tmp_path.joinpath(basename)) for basename in ['a.png', 'b.png', 'c.png']]
+    image_files = list(_with_near_duplicates_found(image_files, NearDuplicateIndex()))
+    assert [image_file.near_duplicate_of for image_file in image_files] == [None, None, tmp_path.joinpath('a.png')]
+
+
+class ScriptedWatcher:
+    """Reports each batch of settled files in turn and then stops the watch loop."""
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def settled_files(self):
+        if not self.batches:
+            raise KeyboardInterrupt
+
+        return self.batches.pop(0)
+
+    def close(self):
+        pass
+
+
+def test_watch_doesnt_resort_files_left_in_place(tmp_path, monkeypatch):
+    backlog_file, new_file = tmp_path.joinpath('backlog.png'), tmp_path.joinpath('new.png')
+    sorted_basenames = []
+    monkeypatch.setattr(Config, 'screenshots_dir', tmp_path)
+    monkeypatch.setattr(Config, 'screenshots_only', False)
+    monkeypatch.setattr(Config, 'reload_sort_rules_if_changed', lambda: False)
+    monkeypatch.setattr(ImageFile, 'sort_file', lambda image_file: sorted_basenames.append(image_file.basename))
+
+    for file_path in [backlog_file, new_file]:
+        Image.new('RGB', (10, 10), 'white').save(file_path)
+
+    _watch_for_screenshots(ScriptedWatcher([[backlog_file, new_file], [new_file], [backlog_file]]), {backlog_file})
+    assert sorted_basenames == ['new.png']
+
+
+def test_show_rules_doesnt_open_stores(tmp_path):
+    code = "from clown_sort import sort_screenshots; sort_screenshots()"
+    args = ['-s', str(tmp_path), '-d', str(tmp_path), '--show-rules']
+    env = dict(environ, INVOKED_BY_PYTEST='True')
+    result = subprocess.run([sys.executable, '-c', code, *args], capture_output=True, text=True, cwd=PROJECT_DIR, env=env)
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert list(tmp_path.glob('*.sqlite')) == []
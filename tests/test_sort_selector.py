@@ -0,0 +1,89 @@
+import threading
+import time
+from unittest.mock import patch
+
+from PIL import Image
+
+from clown_sort.files.image_file import ImageFile
+from clown_sort.lib.ocr_engine import OcrEngine
+from clown_sort.sort_selector import PopupPrefetcher
+
+FILE_COUNT = 8
+
+
+class ThreadRecordingOcrEngine(OcrEngine):
+    def __init__(self) -> None:
+        super().__init__()
+        self.thread_names = []
+
+    def image_to_string(self, image) -> str:
+        self.thread_names.append(threading.current_thread().name)
+        return 'Tether printed another billion'
+
+    def engine_version(self) -> str:
+        return '1.0'
+
+
+def image_files(tmp_path):
+    for i in range(FILE_COUNT):
+        Image.new('RGB', (64, 48), 'white').save(tmp_path.joinpath(f"screenshot_{i}.png"))
+
+    return [ImageFile(tmp_path.joinpath(f"screenshot_{i}.png")) for i in range(FILE_COUNT)]
+
+
+def wait_for_pending(prefetcher: PopupPrefetcher) -> None:
+    while not all(future.done() for _file, future in prefetcher._pending):
+        time.sleep(0.01)
+
+
+def test_popups_are_prefetched_in_order(tmp_path):
+    ocr_engine = ThreadRecordingOcrEngine()
+    files = image_files(tmp_path)
+
+    with patch('clown_sort.files.image_file.ocr_engine', return_value=ocr_engine):
+        prefetcher = PopupPrefetcher(files, lookahead=3)
+        yielded_files = []
+
+        for image_file in prefetcher:
+            assert 'Tether printed another billion' in image_file.popup_data.suggested_filename
+            assert image_file.popup_data.thumbnail_bytes.startswith(b'\x89PNG')
+            assert len(prefetcher._pending) <= 3
+            yielded_files.append(image_file)
+
+    assert yielded_files == files
+    assert all(image_file.popup_data is None for image_file in files)  # Released once they've been shown
+    assert len(ocr_engine.thread_names) == FILE_COUNT
+    assert all(name.startswith('popup_prefetch') for name in ocr_engine.thread_names)
+
+
+def test_memory_budget(tmp_path):
+    with patch('clown_sort.files.image_file.ocr_engine', return_value=ThreadRecordingOcrEngine()):
+        for max_bytes, expected_pending in [(1024 * 1024 * 1024, 3), (1, 1)]:
+            # Prefetch one file, then see how many more get prefetched once its data counts against the budget
+            prefetcher = PopupPrefetcher(image_files(tmp_path), lookahead=1, max_bytes=max_bytes)
+            prefetcher._fill()
+            wait_for_pending(prefetcher)
+            prefetcher.lookahead = 3
+            prefetcher._fill()
+            assert len(prefetcher._pending) == expected_pending
+            prefetcher.close()
+
+
+def test_deleted_files_are_skipped_and_work_is_cancelled(tmp_path):
+    ocr_engine = ThreadRecordingOcrEngine()
+    files = image_files(tmp_path)
+
+    with patch('clown_sort.files.image_file.ocr_engine', return_value=ocr_engine):
+        prefetcher = PopupPrefetcher(files, lookahead=2)
+        yielded_files = []
+
+        for image_file in prefetcher:
+            yielded_files.append(image_file)
+
+            if len(yielded_files) == 1:
+                files[1].file_path.unlink()
+            elif len(yielded_files) == 3:
+                break  # e.g. the user clicked 'Exit'
+
+    assert yielded_files == [files[0], files[2], files[3]]
+    assert len(ocr_engine.thread_names) < FILE_COUNT - 1
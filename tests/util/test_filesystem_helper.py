@@ -1,3 +1,5 @@
+import re
+import shutil
 from datetime import datetime
 from pathlib import Path
 
@@ -19,3 +21,62 @@ def test_strip_bad_chars():
 def test_insert_suffix_before_extension():
     assert insert_suffix_before_extension(TEST_PATH, 'pages 1-10') == Path('/Users/hrollins/Screen Shot 2023-02-10 at 4.00.32 PM__pages_1-10.png')
     assert insert_suffix_before_extension(TEST_PATH, 'wacko!!! $/(Sx::)') == Path('/Users/hrollins/Screen Shot 2023-02-10 at 4.00.32 PM__wacko__$_(Sx::).png')
+
+
+def test_link_file(tmp_path, three_of_swords_file):
+    source = tmp_path.joinpath('source.jpeg')
+    copy_file = tmp_path.joinpath('copy.jpeg')
+    shutil.copy2(three_of_swords_file, source)
+    assert link_file(source, copy_file, COPY) == COPY
+
+    for link_mode in [HARDLINK, SYMLINK]:
+        destination = tmp_path.joinpath(f"{link_mode}.jpeg")
+        destination.write_bytes(b'already here')
+        assert link_file(source, destination, link_mode) == link_mode
+        assert destination.read_bytes() == source.read_bytes()
+
+    assert tmp_path.joinpath(f"{HARDLINK}.jpeg").stat().st_ino == source.stat().st_ino
+    assert tmp_path.joinpath(f"{SYMLINK}.jpeg").is_symlink()
+    # Reflinks fall back to a copy on filesystems that don't support them
+    assert link_file(source, tmp_path.joinpath('reflink.jpeg'), REFLINK) in [REFLINK, COPY]
+    assert tmp_path.joinpath('reflink.jpeg').read_bytes() == source.read_bytes()
+
+
+def test_break_link(tmp_path, three_of_swords_file):
+    source = tmp_path.joinpath('source.jpeg')
+    shutil.copy2(three_of_swords_file, source)
+    hardlink = tmp_path.joinpath('hardlink.jpeg')
+    link_file(source, hardlink, HARDLINK)
+    break_link(hardlink)
+    assert not hardlink.exists()
+    break_link(source)  # Only link left so it stays
+    assert source.exists()
+
+
+def test_walk_files(tmp_path):
+    for relative_path in ['a.png', 'b.pdf', '.hidden.png', 'sub/c.png', 'sub/deeper/d.jpeg', '.hidden_dir/e.png']:
+        file_path = tmp_path.joinpath(relative_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.touch()
+
+    tmp_path.joinpath('linked_dir').symlink_to(tmp_path.joinpath('sub'))
+    tmp_path.joinpath('sub', 'linked.png').symlink_to('../a.png')
+    walked = lambda *args: sorted(str(f.relative_to(tmp_path)) for f in walk_files(tmp_path, *args))
+    assert walked() == ['a.png', 'b.pdf', 'sub/c.png', 'sub/deeper/d.jpeg']
+    assert walked(IMAGE_FILE_EXTENSIONS) == ['a.png', 'sub/c.png', 'sub/deeper/d.jpeg']
+    assert walked(IMAGE_FILE_EXTENSIONS, re.compile('[ad]')) == ['a.png', 'sub/deeper/d.jpeg']
+
+
+def test_list_dir(tmp_path):
+    for relative_path in ['a.png', '.hidden.png', 'sub/c.png', '.hidden_dir/e.png']:
+        file_path = tmp_path.joinpath(relative_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.touch()
+
+    tmp_path.joinpath('linked_dir').symlink_to(tmp_path.joinpath('sub'))
+    tmp_path.joinpath('linked.png').symlink_to('a.png')
+    symlinks = []
+    subdirs, file_entries = list_dir(tmp_path, symlinks)
+    assert subdirs == [str(tmp_path.joinpath('sub'))]
+    assert [entry.name for entry in file_entries] == ['a.png']
+    assert sorted(symlinks) == [str(tmp_path.joinpath('linked.png')), str(tmp_path.joinpath('linked_dir'))]
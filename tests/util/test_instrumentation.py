@@ -0,0 +1,109 @@
+import json
+import os
+
+import random
+
+from clown_sort.util.instrumentation import (COPY_FILE, OCR, SCAN, SORT_FILE, Instrumentation, Span,
+     StageStats, percentile)
+
+
+def test_span_nesting():
+    instrumentation = Instrumentation()
+
+    with instrumentation.collect() as spans:
+        with instrumentation.span(SORT_FILE, 'a.png'):
+            with instrumentation.span(OCR, 'a.png'):
+                pass
+
+    assert [(span.stage, span.path, span.depth) for span in spans] == [(OCR, 'a.png', 1), (SORT_FILE, 'a.png', 0)]
+    assert all(span.pid == os.getpid() and span.seconds >= 0 for span in spans)
+    assert instrumentation.stage_stats[OCR].count == 1
+
+
+def test_merge_and_collect():
+    worker = Instrumentation()
+
+    with worker.collect() as worker_spans:
+        with worker.span(OCR, 'a.png'):
+            pass
+
+    # Spans aren't kept after the 'with' block
+    with worker.span(OCR, 'b.png'):
+        pass
+
+    assert len(worker_spans) == 1
+    instrumentation = Instrumentation()
+
+    with instrumentation.collect() as spans:
+        with instrumentation.span(SORT_FILE, 'a.png'):
+            instrumentation.merge(worker_spans)
+
+    assert [(span.stage, span.depth) for span in spans] == [(OCR, 1), (SORT_FILE, 0)]
+
+
+def test_trace(tmp_path):
+    trace_path = tmp_path.joinpath('trace.jsonl')
+    instrumentation = Instrumentation()
+    instrumentation.open_trace(trace_path)
+
+    with instrumentation.collect() as spans:
+        with instrumentation.span(SCAN, tmp_path):
+            pass
+
+    instrumentation.close_trace()
+
+    with instrumentation.span(SCAN, tmp_path):
+        pass
+
+    events = [json.loads(line) for line in trace_path.read_text().splitlines()]
+    assert len(events) == 1
+    assert Span(**events[0]) == spans[0]
+
+
+def test_percentile():
+    durations = [float(i) for i in range(1, 101)]
+    assert percentile(durations, 50) == 50.0
+    assert percentile(durations, 95) == 95.0
+    assert percentile([3.0], 95) == 3.0
+
+
+def test_summary_tables():
+    instrumentation = Instrumentation()
+    instrumentation.record(Span(SCAN, '/screenshots', 0.0, 5.0, 0, 1))
+    instrumentation.record(Span(OCR, '/screenshots/slow.png', 0.0, 2.0, 1, 1))
+    instrumentation.record(Span(COPY_FILE, '/screenshots/slow.png', 0.0, 0.5, 1, 1))
+    instrumentation.record(Span(SORT_FILE, '/screenshots/slow.png', 0.0, 3.0, 0, 1))
+    instrumentation.record(Span(SORT_FILE, '/screenshots/fast.png', 0.0, 1.0, 0, 1))
+
+    stages_table = instrumentation.stages_table()
+    assert list(stages_table.columns[0].cells) == [SCAN, SORT_FILE, OCR, COPY_FILE]
+    assert list(stages_table.columns[1].cells) == ['1', '2', '1', '1']
+
+    # Dir scans aren't files and nested spans aren't counted twice
+    slowest_files_table = instrumentation.slowest_files_table()
+    assert list(slowest_files_table.columns[0].cells) == ['slow.png', 'fast.png']
+    assert list(slowest_files_table.columns[1].cells) == ['3.000 s', '1.000 s']
+    assert list(slowest_files_table.columns[2].cells) == ['ocr (2.000 s)', '']
+
+
+def test_stage_stats_sample_is_bounded():
+    stats = StageStats(max_samples=10)
+    randomizer = random.Random(1)
+
+    for i in range(1, 1001):
+        stats.add(float(i), randomizer)
+
+    assert (stats.count, stats.total, stats.max) == (1000, 500500.0, 1000.0)
+    assert len(stats.samples) == 10
+
+
+def test_only_slowest_files_are_tracked():
+    instrumentation = Instrumentation(max_files_tracked=4)
+
+    for i in range(1, 101):
+        instrumentation.record(Span(OCR, f"/screenshots/{i}.png", 0.0, 1.0, 1, 1))
+        instrumentation.record(Span(SORT_FILE, f"/screenshots/{i}.png", 0.0, float(i), 0, 1))
+
+    assert len(instrumentation._file_totals) <= 4
+    assert len(instrumentation._file_stage_totals) <= 4
+    assert list(instrumentation.slowest_files_table(2).columns[0].cells) == ['100.png', '99.png']
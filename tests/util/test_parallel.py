@@ -0,0 +1,66 @@
+import os
+
+from clown_sort.config import Config
+from clown_sort.util.instrumentation import SCAN, instrumentation
+from clown_sort.util.parallel import parallel_map_in_order, shared_process_pool, shutdown_shared_pool
+
+
+def test_parallel_map_in_order():
+    numbers = list(range(-50, 0))
+    results = list(parallel_map_in_order(abs, numbers, 2, should_submit=lambda n: n % 3 == 0))
+    assert results == [abs(n) if n % 3 == 0 else n for n in numbers]
+
+
+def test_worker_state():
+    state = Config.worker_state()
+    assert state['jobs'] == Config.jobs
+    assert state['sort_rules'] == Config.sort_rules
+    assert 'extraction_cache' not in state
+
+
+def test_workers_dont_split_up_pdfs():
+    Config.pdf_page_jobs = 3
+
+    try:
+        assert list(parallel_map_in_order(_pdf_page_jobs, [0], 2)) == [1]
+    finally:
+        Config.pdf_page_jobs = 1
+
+
+def test_worker_spans_are_merged():
+    with instrumentation.collect() as collected_spans:
+        results = list(parallel_map_in_order(_timed_abs, [-1, -2, -3], 2))
+
+    assert results == [1, 2, 3]
+    # Threads left over from other tests can record spans in this process at the same time
+    spans = [span for span in collected_spans if span.pid != os.getpid()]
+    assert sorted(span.path for span in spans) == ['-1', '-2', '-3']
+    assert all(span.stage == SCAN for span in spans)
+
+
+def test_shared_pool_is_reused(monkeypatch):
+    pool = shared_process_pool(2)
+
+    try:
+        assert list(parallel_map_in_order(abs, [-1, -2, -3], 2, reuse_pool=True)) == [1, 2, 3]
+        assert shared_process_pool(2) is pool
+        assert list(parallel_map_in_order(abs, [-4], 2, reuse_pool=True)) == [4]
+        # Workers started with an outdated Config aren't reused
+        monkeypatch.setattr(Config, 'pdf_max_pages', 3)
+        assert list(parallel_map_in_order(_pdf_max_pages, [0], 2, reuse_pool=True)) == [3]
+        assert shared_process_pool(2) is not pool
+    finally:
+        shutdown_shared_pool()
+
+
+def _timed_abs(n: int) -> int:
+    with instrumentation.span(SCAN, str(n)):
+        return abs(n)
+
+
+def _pdf_page_jobs(_n: int) -> int:
+    return Config.pdf_page_jobs
+
+
+def _pdf_max_pages(_n: int) -> int:
+    return Config.pdf_max_pages